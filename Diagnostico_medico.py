@@ -1,350 +1,443 @@
 # app.py
+import time
+# Referencia para el informe de tiempos de arranque (antes de las importaciones)
+_T_START = time.perf_counter()
+
 import customtkinter as ctk
 import tkinter as tk
-from tkinter import ttk, messagebox
-import psycopg2
-import bcrypt
-from datetime import datetime
-import bcrypt
-import base64
-import binascii
-import difflib
-import pprint
-
-# ---------- Configuración DB ----------
-DB_CONFIG = {
-    "host": "localhost",
-    "port": 5432,
-    "dbname": "medic_database",
-    "user": "postgres",
-    "password": ""
-}
+from tkinter import ttk, messagebox, filedialog
+from datetime import datetime, timedelta
+import json
+import os
+import atexit
+import threading
+# bcrypt (en seguridad.py) se importa donde se usa: no hace falta para
+# mostrar la pantalla de login
+
+from database import DB, DB_CONFIG, db
+from catalogos import CatalogResolver, CatalogStore, fold
+import migraciones
+import instrumentacion
+from paginacion import Column, KeysetSource
+from asincrono import default_executor
+import cargadores
+import exportacion
+import auditoria
+import analitica
+import cohortes
+from seguridad import verify_password, hash_password, needs_rehash
+from recomendaciones import RecommendationCache, DEFAULT_TOP_K
+from motor import (Rule, InferenceEngine, RULES, RULE_IDS, RULES_VERSION, SIGNOS_LIST, SINTOMAS_LIST,
+                   normalize_set, differential)
+from concurrent.futures import CancelledError
+
+_T_IMPORTS = time.perf_counter()
+
+# ---------- Catálogos ----------
+# Catálogos (enfermedades, signos, síntomas, pruebas) compartidos por el proceso
+catalog_store = CatalogStore(db)
+# Recomendaciones por enfermedad_id; se precalientan tras cada inferencia
+recommendation_cache = RecommendationCache(db)
+# Auditoría de inferencias (DIAG_AUDIT); se crea al arrancar la app
+audit_logger = None
+
+# ---------- Interfaz ----------
+
+APP_TITLE = "Gestión Clínica - Demo"
+
+# ---------- Helper: llamadas a BD sin bloquear la UI ----------
+def _default_async_error(exc):
+    print("ERROR en tarea en segundo plano:", exc)
+    messagebox.showerror("Error", f"Error de base de datos: {exc}")
+
 
-# ---------- Helper DB ----------
-class DB:
-    def __init__(self, config):
-        self.config = config
-        self.conn = None
-
-    def connect(self):
-        if self.conn is None or self.conn.closed:
-            self.conn = psycopg2.connect(**self.config)
-            self.conn.autocommit = True
-        return self.conn
-
-    def query(self, sql, params=None, fetch=False):
-        conn = self.connect()
-        with conn.cursor() as cur:
-            cur.execute(sql, params or ())
-            if fetch:
-                return cur.fetchall()
-
-    def fetchall(self, sql, params=None):
-        conn = self.connect()
-        with conn.cursor() as cur:
-            cur.execute(sql, params or ())
-            return cur.fetchall()
-
-    def fetchone(self, sql, params=None):
-        conn = self.connect()
-        with conn.cursor() as cur:
-            cur.execute(sql, params or ())
-            return cur.fetchone()
-
-db = DB(DB_CONFIG)
-
-# ---------- Esquema y datos recomendados (tratamientos y pruebas) ----------
-def ensure_recommended_schema_and_seed():
+class TkAsync:
     """
-    Crea tablas de recomendaciones si no existen y agrega datos básicos
-    para poder mostrar tratamientos y pruebas sugeridas por enfermedad.
+    Ejecuta funciones en el DBExecutor y entrega el resultado en el hilo de
+    Tk, sondeando los Futures con after(). Si se indica `key`, solo se
+    entrega la respuesta de la llamada más reciente con esa clave; las
+    anteriores se descartan al terminar.
     """
-    # Tablas de mapeo recomendadas
-    db.query(
-        """
-        CREATE TABLE IF NOT EXISTS enfermedad_tratamientos_recomendados (
-            id SERIAL PRIMARY KEY,
-            enfermedad_id INT NOT NULL REFERENCES enfermedades(enfermedad_id) ON DELETE CASCADE,
-            tratamiento TEXT NOT NULL,
-            indicaciones TEXT,
-            tipo VARCHAR(50), -- farmacologico / no_farmacologico / procedimiento
-            prioridad SMALLINT, -- 1 alta, 2 media, 3 baja
-            UNIQUE (enfermedad_id, tratamiento)
-        )
-        """
-    )
+    POLL_MS = 15
+
+    def __init__(self, root, executor):
+        self.root = root
+        self.executor = executor
+        self._pending = []
+        self._tokens = {}
+        self._polling = False
+
+    def call(self, fn, *args, on_done=None, on_error=None, key=None, **kwargs):
+        token = None
+        if key is not None:
+            token = self._tokens.get(key, 0) + 1
+            self._tokens[key] = token
+        future = self.executor.submit(fn, *args, **kwargs)
+        self._pending.append((future, key, token, on_done, on_error))
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.POLL_MS, self._poll)
+        return future
+
+    def discard(self, key):
+        """Descarta la respuesta pendiente con esa clave (p. ej. al cerrar la vista)."""
+        if key in self._tokens:
+            self._tokens[key] += 1
+
+    def _poll(self):
+        done, still = [], []
+        for item in self._pending:
+            (done if item[0].done() else still).append(item)
+        self._pending = still
+        try:
+            for future, key, token, on_done, on_error in done:
+                if key is not None and self._tokens.get(key) != token:
+                    continue  # respuesta obsoleta
+                try:
+                    exc = future.exception()
+                    if exc is None:
+                        if on_done:
+                            on_done(future.result())
+                    else:
+                        (on_error or _default_async_error)(exc)
+                except CancelledError:
+                    pass
+                except tk.TclError:
+                    pass  # el widget destino ya no existe
+                except Exception as e:
+                    # Un callback con error no debe cortar la entrega de los demás
+                    try:
+                        _default_async_error(e)
+                    except tk.TclError:
+                        pass
+            # Claves sin llamadas pendientes: su contador ya no hace falta
+            pending_keys = {item[1] for item in self._pending}
+            for _, key, _, _, _ in done:
+                if key is not None and key not in pending_keys:
+                    self._tokens.pop(key, None)
+        finally:
+            if self._pending:
+                self.root.after(self.POLL_MS, self._poll)
+            else:
+                self._polling = False
 
-    db.query(
-        """
-        CREATE TABLE IF NOT EXISTS enfermedad_pruebas_recomendadas (
-            id SERIAL PRIMARY KEY,
-            enfermedad_id INT NOT NULL REFERENCES enfermedades(enfermedad_id) ON DELETE CASCADE,
-            prueba_lab_id INT NOT NULL REFERENCES pruebas_lab_catalogo(prueba_lab_id) ON DELETE CASCADE,
-            nota TEXT,
-            urgencia SMALLINT, -- 1 urgente, 2 prioritaria, 3 rutina
-            UNIQUE (enfermedad_id, prueba_lab_id)
-        )
-        """
-    )
 
-    # Tabla alternativa: pruebas/estudios texto (cuando no existan en catálogo)
-    db.query(
-        """
-        CREATE TABLE IF NOT EXISTS enfermedad_pruebas_texto_recomendadas (
-            id SERIAL PRIMARY KEY,
-            enfermedad_id INT NOT NULL REFERENCES enfermedades(enfermedad_id) ON DELETE CASCADE,
-            nombre TEXT NOT NULL,
-            nota TEXT,
-            urgencia SMALLINT,
-            UNIQUE (enfermedad_id, nombre)
-        )
-        """
-    )
+_tk_async = None
 
-    # Semilla mínima: solo insertar si no hay registros
-    try:
-        has_any = db.fetchone("SELECT EXISTS (SELECT 1 FROM enfermedad_tratamientos_recomendados) ")
-        if has_any and has_any[0]:
-            return  # ya hay datos
-    except Exception:
-        # Si falla la consulta por cualquier razón, continuar con semilla best-effort
-        pass
+def run_in_background(widget, fn, *args, on_done=None, on_error=None, key=None, **kwargs):
+    """
+    Ejecuta fn(*args, **kwargs) fuera del hilo de Tk; on_done(resultado) u
+    on_error(excepción) se llaman después en el hilo de Tk.
+    """
+    global _tk_async
+    if _tk_async is None:
+        _tk_async = TkAsync(widget._root(), default_executor())
+    return _tk_async.call(fn, *args, on_done=on_done, on_error=on_error, key=key, **kwargs)
 
-    # Helper: obtener enfermedad_id por patrón de nombre
-    def get_enf_id(name_like):
-        row = db.fetchone(
-            "SELECT enfermedad_id FROM enfermedades WHERE nombre ILIKE %s ORDER BY gravedad DESC LIMIT 1",
-            (f"%{name_like}%",)
-        )
-        return row[0] if row else None
 
-    # Helper: obtener prueba_lab_id por nombre
-    def get_lab_id(name_like):
-        row = db.fetchone(
-            "SELECT prueba_lab_id FROM pruebas_lab_catalogo WHERE nombre ILIKE %s LIMIT 1",
-            (f"%{name_like}%",)
-        )
-        return row[0] if row else None
-
-    seeds = [
-        {
-            "name": "Neumon",
-            "tx": [
-                ("Amoxicilina-clavulánico", "500/125 mg cada 8h por 5-7 días", "farmacologico", 2),
-                ("Azitromicina", "500 mg día 1, luego 250 mg/día 4 días", "farmacologico", 2),
-                ("Reposo e hidratación", "Ingesta de líquidos y reposo relativo", "no_farmacologico", 3)
-            ],
-            "labs": [
-                ("Hemograma", "Leucocitosis orienta a infección bacteriana", 2),
-                ("Proteína C reactiva", "Inflamación sistémica", 2),
-                ("Radiografía de tórax", "Valorar consolidaciones y patrón alveolar", 1)
-            ]
-        },
-        {
-            "name": "Bronquitis",
-            "tx": [
-                ("Antitusígenos", "Si tos seca molesta (p. ej., dextrometorfano)", "farmacologico", 3),
-                ("Broncodilatador inhalado", "Salbutamol 1-2 disparos cada 6-8h si sibilancias", "farmacologico", 2)
-            ],
-            "labs": [
-                ("Hemograma", "Descartar infección bacteriana significativa", 3)
-            ]
-        },
-        {
-            "name": "Asma",
-            "tx": [
-                ("Salbutamol inhalado", "2-4 inhalaciones cada 20 min x 1h, luego según respuesta", "farmacologico", 1),
-                ("Corticoide sistémico", "Prednisona 40-50 mg/día por 5-7 días en exacerbación", "farmacologico", 1)
-            ],
-            "labs": [
-                ("Sat O2", "Oximetría de pulso para valorar hipoxemia", 1)
-            ]
-        },
-        {
-            "name": "Sepsis",
-            "tx": [
-                ("Antibióticos de amplio espectro", "Administrar en la primera hora", "farmacologico", 1),
-                ("Líquidos IV", "Cristaloides 30 ml/kg en la primera hora", "procedimiento", 1)
-            ],
-            "labs": [
-                ("Hemocultivos", "Antes de antibióticos si es posible", 1),
-                ("Lactato", "Marcador pronóstico", 1),
-                ("Función renal", "Urea y creatinina", 2)
-            ]
-        },
-        {
-            "name": "Infarto agudo de miocardio",
-            "tx": [
-                ("AAS", "160-325 mg masticable una sola vez (si no contraindicado)", "farmacologico", 1),
-                ("Nitroglicerina", "0.4 mg SL cada 5 min x 3 si TA lo permite", "farmacologico", 1)
-            ],
-            "labs": [
-                ("Troponina", "Biomarcador de daño miocárdico", 1),
-                ("ECG", "Electrocardiograma de 12 derivaciones", 1)
-            ]
-        },
-        {
-            "name": "Apendicitis",
-            "tx": [
-                ("Cirugía: apendicectomía", "Derivar a cirugía general", "procedimiento", 1),
-                ("Antibióticos", "Ceftriaxona + metronidazol preoperatorio", "farmacologico", 1)
-            ],
-            "labs": [
-                ("Hemograma", "Leucocitosis con neutrofilia", 2),
-                ("PCR", "Marcador inespecífico de inflamación", 3)
-            ]
-        },
-        {
-            "name": "ITU",
-            "tx": [
-                ("Nitrofurantoína", "100 mg cada 12h por 5 días (cistitis no complicada)", "farmacologico", 2)
-            ],
-            "labs": [
-                ("EGO", "EGO/EGO+urocultivo si fiebre o recurrencia", 2)
-            ]
-        },
-        {
-            "name": "Meningitis",
-            "tx": [
-                ("Antibióticos IV", "Ceftriaxona + vancomicina (empírico)", "farmacologico", 1),
-                ("Dexametasona", "10 mg IV cada 6h por 4 días (bacteriana)", "farmacologico", 1)
-            ],
-            "labs": [
-                ("Punción lumbar", "Citoquímico de LCR, según indicación y seguridad", 1),
-                ("Hemocultivos", "Antes de antibiótico si es posible", 1)
-            ]
-        },
-        {
-            "name": "Dengue",
-            "tx": [
-                ("Hidratación", "VO o IV según signos de alarma", "procedimiento", 1),
-                ("Paracetamol", "Evitar AINES", "farmacologico", 2)
-            ],
-            "labs": [
-                ("Hemograma", "Hematocrito y plaquetas para seguimiento", 1)
-            ]
-        },
-        {
-            "name": "Pancreatitis",
-            "tx": [
-                ("Hidratación IV", "Cristaloides agresivos primeras 24-48h", "procedimiento", 1),
-                ("Analgesia", "Opioide según dolor", "farmacologico", 1)
-            ],
-            "labs": [
-                ("Amilasa", "Diagnóstico y seguimiento", 1),
-                ("Lipasa", "Más específica que amilasa", 1)
-            ]
-        },
-        {
-            "name": "Hipoglucemia",
-            "tx": [
-                ("Glucosa oral o IV", "15-20 g de glucosa oral; en severa, D50 IV", "farmacologico", 1)
-            ],
-            "labs": [
-                ("Glucosa capilar", "Control seriado hasta normalización", 1)
-            ]
-        }
-    ]
-
-    for item in seeds:
-        enf_id = get_enf_id(item["name"])
-        if not enf_id:
-            continue
-        # Insertar tratamientos
-        for t in item["tx"]:
-            nombre_tx, indic, tipo, prioridad = t
-            try:
-                db.query(
-                    """
-                    INSERT INTO enfermedad_tratamientos_recomendados
-                    (enfermedad_id, tratamiento, indicaciones, tipo, prioridad)
-                    VALUES (%s,%s,%s,%s,%s)
-                    ON CONFLICT (enfermedad_id, tratamiento) DO NOTHING
-                    """,
-                    (enf_id, nombre_tx, indic, tipo, prioridad)
-                )
-            except Exception:
-                pass
+def discard_background(key):
+    if _tk_async is not None:
+        _tk_async.discard(key)
 
-        # Insertar pruebas: si existen en catálogo, se relacionan; si no, se guardan como texto
-        for l in item["labs"]:
-            nombre_lab, nota, urgencia = l
-            lab_id = get_lab_id(nombre_lab)
-            try:
-                if lab_id:
-                    db.query(
-                        """
-                        INSERT INTO enfermedad_pruebas_recomendadas
-                        (enfermedad_id, prueba_lab_id, nota, urgencia)
-                        VALUES (%s,%s,%s,%s)
-                        ON CONFLICT (enfermedad_id, prueba_lab_id) DO NOTHING
-                        """,
-                        (enf_id, lab_id, nota, urgencia)
-                    )
-                else:
-                    db.query(
-                        """
-                        INSERT INTO enfermedad_pruebas_texto_recomendadas
-                        (enfermedad_id, nombre, nota, urgencia)
-                        VALUES (%s,%s,%s,%s)
-                        ON CONFLICT (enfermedad_id, nombre) DO NOTHING
-                        """,
-                        (enf_id, nombre_lab, nota, urgencia)
-                    )
-            except Exception:
-                pass
 
-# ---------- Seguridad de contraseña ----------
-def normalize_hash_from_db(raw):
-    if raw is None:
-        return None
-    if isinstance(raw, memoryview):
-        return raw.tobytes()
-    if isinstance(raw, bytes):
-        return raw
-    if isinstance(raw, str):
-        s = raw.strip()
-        if s.startswith(("$2a$", "$2b$", "$2y$")):
-            return s.encode("utf-8")
-        try:
-            return bytes.fromhex(s)
-        except (ValueError, TypeError):
-            pass
-        try:
-            return base64.b64decode(s)
-        except (binascii.Error, ValueError):
-            pass
-        return s.encode("utf-8")
-    try:
-        return bytes(raw)
-    except Exception:
-        return None
-
-def verify_password(password_plain: str, hashed_raw) -> bool:
-    hashed = normalize_hash_from_db(hashed_raw)
-    if not hashed:
-        return False
-    try:
-        prefix = hashed[:4].decode('utf-8', errors='ignore')
-    except Exception:
-        prefix = ""
-    if not prefix.startswith(("$2a", "$2b", "$2y")):
-        return False
+def set_busy(window, busy, title=None, widgets=()):
+    """
+    Estado de carga de un diálogo: título con sufijo, cursor de espera y
+    `widgets` (botones) deshabilitados mientras dura la operación.
+    """
     try:
-        return bcrypt.checkpw(password_plain.encode('utf-8'), hashed)
-    except (ValueError, TypeError):
-        return False
-
-
-def hash_password(password_plain: str) -> str:
-    return bcrypt.hashpw(password_plain.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        base = title or getattr(window, "_base_title", None) or window.title()
+        window._base_title = base
+        window.title(f"{base} — cargando…" if busy else base)
+        window.configure(cursor="watch" if busy else "")
+        for w in widgets:
+            w.configure(state="disabled" if busy else "normal")
+    except tk.TclError:
+        pass
 
+# ---------- Helper: llenado de Treeview por porciones ----------
+class TreeFiller:
+    """
+    Llena un ttk.Treeview en porciones de tiempo acotado con after(), para
+    que tablas grandes no congelen la UI. clear() vacía con un solo
+    delete(*children); cancel() detiene el llenado pendiente (p. ej. al
+    salir de la vista). Con keyed=True cada fila es (iid, valores).
+    """
+    SLICE_MS = 12   # tiempo máximo insertando por porción
+    GAP_MS = 1      # respiro entre porciones para procesar eventos
+
+    def __init__(self, tree, keyed=False):
+        self.tree = tree
+        self.keyed = keyed
+        self._queue = []
+        self._pos = 0
+        self._job = None
+        self._callbacks = []
+
+    @property
+    def busy(self):
+        return self._job is not None
+
+    def cancel(self):
+        if self._job is not None:
+            try:
+                self.tree.after_cancel(self._job)
+            except tk.TclError:
+                pass
+            self._job = None
+        self._queue, self._pos, self._callbacks = [], 0, []
+
+    def clear(self):
+        self.cancel()
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+
+    def load(self, rows, on_done=None):
+        """Reemplaza el contenido por `rows`."""
+        self.clear()
+        self.append(rows, on_done)
+
+    def append(self, rows, on_done=None):
+        """Agrega `rows` al final, detrás de lo que aún esté pendiente."""
+        self._queue.extend(rows)
+        if on_done is not None:
+            self._callbacks.append((len(self._queue), on_done))
+        if self._job is None:
+            self._job = self.tree.after(0, self._step)
+
+    def _step(self):
+        self._job = None
+        deadline = time.perf_counter() + self.SLICE_MS / 1000.0
+        queue, insert = self._queue, self.tree.insert
+        try:
+            while self._pos < len(queue):
+                if self.keyed:
+                    iid, values = queue[self._pos]
+                    insert("", "end", iid=iid, values=values)
+                else:
+                    insert("", "end", values=queue[self._pos])
+                self._pos += 1
+                if not (self._pos & 31) and time.perf_counter() >= deadline:
+                    break
+        except tk.TclError:
+            self.cancel()  # el Treeview ya no existe
+            return
+        # Avisar a quien esperaba que terminaran sus filas
+        while self._callbacks and self._callbacks[0][0] <= self._pos:
+            self._callbacks.pop(0)[1]()
+        if self._pos < len(queue):
+            self._job = self.tree.after(self.GAP_MS, self._step)
+        else:
+            self._queue, self._pos = [], 0
 
+# ---------- Helper: listados paginados ----------
+class PagedTree:
+    """
+    Conecta un ttk.Treeview con un KeysetSource: carga la primera página,
+    pide la siguiente al acercarse al final del scroll, ordena en el servidor
+    al hacer clic en un encabezado y aplica filtros por columna.
 
+    Los items del Treeview usan la clave primaria como iid. refresh() no
+    recarga: pide solo lo cambiado o eliminado desde la última carga y lo
+    aplica fila por fila (si la fuente tiene marcas de cambio).
+    """
+    LOAD_AT = 0.9  # fracción del scroll a partir de la cual se pide otra página
+    # Solape al pedir cambios: una transacción que escribió antes de la marca
+    # pero confirmó después también se ve (reaplicar una fila es inocuo)
+    CHANGE_MARGIN = timedelta(seconds=5)
+
+    def __init__(self, tree, vsb, source):
+        self.tree = tree
+        self.vsb = vsb
+        self.source = source
+        self._loading = False
+        self._active = False   # no pedir páginas hasta el primer reload()
+        self._key = (id(self), "page")
+        self.filler = TreeFiller(tree, keyed=True)
+        self._keys = []       # claves (valor_orden, pk) cargadas, en orden del listado
+        self._key_of = {}     # iid -> clave
+        self._since = None    # marca de tiempo del servidor de la última carga
+        self.status = tk.StringVar(value="")
+        self._titles = {c.name: tree.heading(c.name, "text") for c in source.columns}
+        for c in source.columns:
+            tree.heading(c.name, command=lambda n=c.name: self.sort_by(n))
+        tree.configure(yscrollcommand=self._on_scroll)
+        self._update_headings()
+
+    def _on_scroll(self, first, last):
+        self.vsb.set(first, last)
+        if (self._active and float(last) >= self.LOAD_AT
+                and self.source.has_more and not self._loading):
+            self.load_more()
+
+    def reload(self):
+        self._active = True
+        self.source.reset()
+        self.filler.clear()
+        self._keys, self._key_of, self._since = [], {}, None
+        self.load_more()
 
-# ---------- Interfaz ----------
+    def refresh(self):
+        """Actualiza lo ya cargado con los cambios desde la última carga, o recarga."""
+        if (not self._active or self._since is None or not self.source.tracks_changes
+                or self._loading or self.filler.busy):
+            self.reload()
+            return
+        self._loading = True
+        run_in_background(self.tree, self._fetch_changes, self._since - self.CHANGE_MARGIN,
+                          on_done=self._apply_changes, on_error=self._on_page_error, key=self._key)
+
+    def cancel(self):
+        """Descarta la página en vuelo y el llenado pendiente (al salir de la vista)."""
+        pending = self._loading or self.filler.busy
+        discard_background(self._key)
+        self.filler.cancel()
+        self._loading = False
+        if pending:
+            # Quedaron filas sin insertar: la próxima vez se recarga desde el principio
+            self._active = False
+
+    def load_more(self):
+        # La consulta se arma aquí y se ejecuta en el executor; si llega otro
+        # reload() antes de la respuesta, ésta se descarta (misma key).
+        sql, params = self.source.build_query()
+        stamp = self.source.tracks_changes and self._since is None
+        self._loading = True
+        self.status.set("Cargando…")
+        run_in_background(self.tree, self._fetch_page, sql, params, stamp,
+                          on_done=self._on_page, on_error=self._on_page_error, key=self._key)
+
+    def _fetch_page(self, sql, params, stamp):
+        # En el executor. La marca se toma antes de leer: lo que cambie
+        # durante la lectura se vuelve a pedir en el próximo refresh()
+        db_ = self.source.db
+        since = db_.fetchone("SELECT clock_timestamp()")[0] if stamp else None
+        return since, db_.fetchall(sql, params)
+
+    def _fetch_changes(self, since):
+        db_ = self.source.db
+        stamp = db_.fetchone("SELECT clock_timestamp()")[0]
+        changed = db_.fetchall(*self.source.build_changes_query(since))
+        deleted = db_.fetchall(*self.source.build_deleted_query(since))
+        return stamp, changed, deleted
+
+    def _update_status(self):
+        n = len(self._keys)
+        self.status.set(f"{n} filas" + (" (desplaza para ver más)" if self.source.has_more else ""))
+
+    def _on_page(self, result):
+        since, rows = result
+        if since is not None:
+            self._since = since
+        page = []
+        for key, values in self.source.accept(rows, keyed=True):
+            iid = str(key[1])
+            if iid in self._key_of:
+                continue  # ya insertada por un refresh() anterior
+            self._keys.append(key)
+            self._key_of[iid] = key
+            page.append((iid, values))
+
+        def done():
+            self._loading = False
+            self._update_status()
+
+        self.filler.append(page, on_done=done)
+
+    def _remove(self, iid):
+        key = self._key_of.pop(iid, None)
+        if key is not None:
+            self._keys.remove(key)
+            self.tree.delete(iid)
+
+    def _apply_changes(self, result):
+        stamp, changed, deleted = result
+        self._loading = False
+        try:
+            for pk, _ in deleted:
+                self._remove(str(pk))
+            for row in changed:
+                values, key, matches = tuple(row[:-4]), (row[-4], row[-3]), row[-2]
+                iid = str(key[1])
+                if not matches or not self.source.in_window(key):
+                    # Ya no cumple los filtros o quedó más allá de lo cargado
+                    # (llegará con su página al desplazarse)
+                    self._remove(iid)
+                elif self._key_of.get(iid) == key:
+                    self.tree.item(iid, values=values)
+                else:
+                    self._remove(iid)
+                    index = self.source.position(self._keys, key)
+                    self._keys.insert(index, key)
+                    self._key_of[iid] = key
+                    self.tree.insert("", index, iid=iid, values=values)
+        except (TypeError, tk.TclError) as e:
+            # Claves no comparables o Treeview desincronizado: recargar entero
+            print("WARN: no se pudo aplicar el refresco por diferencias:", e)
+            self.reload()
+            return
+        self._since = stamp
+        self._update_status()
+
+    def _on_page_error(self, exc):
+        self._loading = False
+        self.status.set("Error al cargar")
+        _default_async_error(exc)
+
+    def sort_by(self, name):
+        self.source.set_sort(name)
+        self._update_headings()
+        self.reload()
+
+    def set_filter(self, name, text):
+        self.source.set_filter(name, text)
+        self.reload()
+
+    def clear_filters(self):
+        self.source.clear_filters()
+        self.reload()
+
+    def _update_headings(self):
+        for name, title in self._titles.items():
+            mark = ""
+            if name == self.source.sort:
+                mark = " ▼" if self.source.desc else " ▲"
+            self.tree.heading(name, text=f"{title}{mark}")
+
+    def build_filter_bar(self, parent):
+        """Barra: columna + texto; Enter o 'Filtrar' aplica, 'Limpiar' quita todos."""
+        bar = ctk.CTkFrame(parent)
+        col_var = tk.StringVar(value=self.source.columns[0].name)
+        col_cb = ttk.Combobox(bar, textvariable=col_var, state="readonly",
+                              values=[c.name for c in self.source.columns], width=22)
+        col_cb.pack(side="left", padx=(8, 4))
+        entry = ctk.CTkEntry(bar, placeholder_text="Filtrar por columna")
+        entry.pack(side="left", fill="x", expand=True, padx=4)
+        status = tk.StringVar(value="")
+
+        def refresh_status():
+            status.set(", ".join(f"{k} ~ {v}" for k, v in self.source.filters.items()))
+
+        def apply(_event=None):
+            self.set_filter(col_var.get(), entry.get())
+            refresh_status()
+
+        def clear():
+            entry.delete(0, tk.END)
+            self.clear_filters()
+            refresh_status()
+
+        entry.bind("<Return>", apply)
+        ctk.CTkButton(bar, text="Filtrar", width=80, command=apply).pack(side="left", padx=4)
+        ctk.CTkButton(bar, text="Limpiar", width=80, fg_color="gray", command=clear).pack(side="left", padx=4)
+        ctk.CTkLabel(bar, textvariable=status, anchor="w").pack(side="left", padx=8)
+        ctk.CTkLabel(bar, textvariable=self.status, anchor="e", text_color="gray").pack(side="right", padx=8)
+        return bar
+
+def _ms_since(t0, t1=None):
+    return round(((t1 if t1 is not None else time.perf_counter()) - t0) * 1000.0, 1)
 
-APP_TITLE = "Gestión Clínica - Demo"
 
 class App(ctk.CTk):
     def __init__(self):
@@ -354,13 +447,17 @@ class App(ctk.CTk):
         self.title(APP_TITLE)
         self.geometry("1000x700")
         self.current_user = None
+        self.startup = {"importaciones_ms": _ms_since(_T_START, _T_IMPORTS)}
         
-        # Asegurar tablas de recomendaciones y datos base
+        # Esquema, tablas de recomendaciones, semilla e índices como migraciones
+        # versionadas: con la BD al día solo cuesta leer schema_version
         try:
-            ensure_recommended_schema_and_seed()
+            for m in migraciones.apply_pending(db):
+                print(f"INFO: migración aplicada {m.version:04d} {m.nombre}")
         except Exception as e:
-            # No bloquear la app si falla semilla/esquema; se mostrará en consola
-            print("WARN: no se pudo asegurar esquema recomendado:", e)
+            # No bloquear la app si falla una migración; se mostrará en consola
+            print("WARN: no se pudieron aplicar migraciones:", e)
+        self.startup["migraciones_ms"] = _ms_since(_T_IMPORTS)
         
         # Configurar expansión de la ventana principal
         self.grid_rowconfigure(0, weight=1)
@@ -374,21 +471,45 @@ class App(ctk.CTk):
         self.container.grid_rowconfigure(0, weight=1)
         self.container.grid_columnconfigure(0, weight=1)
 
+        # Los frames se crean la primera vez que se muestran (ver get_frame)
         self.frames = {}
-        for F in (LoginFrame, MainMenuFrame, PacientesFrame, CatalogosFrame, EncuentrosFrame, DiagnosticosFrame, TratamientosFrame, UsuariosFrame):
-            page_name = F.__name__
-            frame = F(parent=self.container, controller=self)
-            self.frames[page_name] = frame
-            frame.grid(row=0, column=0, sticky="nsew")
-
         self.show_frame("LoginFrame")
+        # after_idle corre tras el primer dibujado de la ventana
+        self.after_idle(self._report_startup)
+
+    def get_frame(self, name):
+        frame = self.frames.get(name)
+        if frame is None:
+            t0 = time.perf_counter()
+            frame = FRAME_CLASSES[name](parent=self.container, controller=self)
+            frame.grid(row=0, column=0, sticky="nsew")
+            self.frames[name] = frame
+            self.startup.setdefault(f"frame_{name}_ms", _ms_since(t0))
+        return frame
 
     def show_frame(self, name):
-        frame = self.frames[name]
+        frame = self.get_frame(name)
+        previous = getattr(self, "_current_frame", None)
+        if previous is not None and previous is not frame and hasattr(previous, "on_hide"):
+            previous.on_hide()
+        self._current_frame = frame
         frame.tkraise()
         if hasattr(frame, "on_show"):
             frame.on_show()
 
+    def _report_startup(self):
+        """Imprime (y opcionalmente registra en DIAG_STARTUP_LOG) el tiempo hasta ver el login."""
+        self.startup["pantalla_login_ms"] = _ms_since(_T_START)
+        print("INFO: arranque " + ", ".join(f"{k}={v}" for k, v in self.startup.items()))
+        path = os.environ.get("DIAG_STARTUP_LOG")
+        if path:
+            entry = dict(self.startup, ts=time.strftime("%Y-%m-%dT%H:%M:%S"))
+            try:
+                with open(path, "a", encoding="utf-8") as fh:
+                    fh.write(json.dumps(entry) + "\n")
+            except OSError as e:
+                print("WARN: no se pudo escribir el registro de arranque:", e)
+
     def login(self, user_row):
         # user_row: (usuario_id, nombre, correo, rol, hashed_password, ...)
         self.current_user = {
@@ -397,6 +518,16 @@ class App(ctk.CTk):
             "correo": user_row[2],
             "rol": user_row[3]
         }
+        # Precargar catálogos y el mapa regla -> enfermedad una vez por sesión,
+        # sin bloquear la UI (los ids de regla sin vincular se avisan aquí)
+        def preload():
+            catalog_store.load_all()
+            catalog_store.disease_map(RULE_IDS)
+
+        run_in_background(
+            self, preload,
+            on_error=lambda e: print("WARN: no se pudieron precargar catálogos:", e)
+        )
         self.show_frame("MainMenuFrame")
 
 # ---------- Frame: Tratamientos ----------
@@ -415,6 +546,8 @@ class TratamientosFrame(ctk.CTkFrame):
 
         # Treeview para listar tratamientos
         cols = ("tratamiento_id", "paciente_nombre", "diagnostico", "tratamiento_nombre", "descripcion", "inicio_fecha", "estado")
+        filter_slot = ctk.CTkFrame(self, fg_color="transparent")
+        filter_slot.pack(fill="x", padx=10)
         container = ctk.CTkFrame(self)
         container.pack(fill="both", expand=True, padx=10, pady=10)
 
@@ -443,26 +576,41 @@ class TratamientosFrame(ctk.CTkFrame):
 
         self.tree.bind("<Double-1>", self.on_edit)
 
+        # Paginación keyset con orden y filtros en el servidor
+        source = KeysetSource(
+            db,
+            [
+                Column("tratamiento_id", "t.tratamiento_id"),
+                Column("paciente_nombre", "p.nombre", null_as="''", text=True),
+                Column("diagnostico", "e.nombre", null_as="''", text=True),
+                Column("tratamiento_nombre", "t.nombre", text=True),
+                Column("descripcion",
+                       "SUBSTRING(t.descripcion FROM 1 FOR 50) || CASE WHEN LENGTH(t.descripcion) > 50 THEN '...' ELSE '' END",
+                       key="t.descripcion", null_as="''", text=True),
+                Column("inicio_fecha", "t.inicio_fecha", null_as="'-infinity'::date"),
+                Column("estado", "t.estado", null_as="''", text=True),
+            ],
+            """tratamientos t
+            LEFT JOIN diagnosticos d ON t.diagnostico_id = d.diagnostico_id
+            LEFT JOIN pacientes p ON d.paciente_id = p.paciente_id
+            LEFT JOIN enfermedades e ON d.enfermedad_id = e.enfermedad_id""",
+            pk="t.tratamiento_id",
+            default_sort="inicio_fecha",
+            default_desc=True,
+            table="tratamientos",
+            changed_at=("t.updated_at", "d.updated_at", "p.updated_at", "e.updated_at"),
+        )
+        self.pager = PagedTree(self.tree, vsb, source)
+        self.pager.build_filter_bar(filter_slot).pack(fill="x", pady=(0, 4))
+
     def on_show(self):
         self.refresh()
 
+    def on_hide(self):
+        self.pager.cancel()
+
     def refresh(self):
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-        
-        sql = """
-        SELECT t.tratamiento_id, p.nombre, e.nombre, t.nombre, 
-               SUBSTRING(t.descripcion FROM 1 FOR 50) || CASE WHEN LENGTH(t.descripcion) > 50 THEN '...' ELSE '' END as desc_corta,
-               t.inicio_fecha, t.estado
-        FROM tratamientos t
-        LEFT JOIN diagnosticos d ON t.diagnostico_id = d.diagnostico_id
-        LEFT JOIN pacientes p ON d.paciente_id = p.paciente_id
-        LEFT JOIN enfermedades e ON d.enfermedad_id = e.enfermedad_id
-        ORDER BY t.inicio_fecha DESC
-        """
-        rows = db.fetchall(sql)
-        for r in rows:
-            self.tree.insert("", "end", values=r)
+        self.pager.refresh()
 
     def open_add_dialog(self):
         dlg = TratamientoDialog(self, None, self.refresh)
@@ -510,11 +658,11 @@ class TratamientoDialog(tk.Toplevel):
         self.canvas.bind("<MouseWheel>", self._on_mousewheel)
 
         # Contenido del formulario
+        self.diagnosticos_map = {}
         self.create_form(self.scrollable_frame)
 
-        self.cargar_diagnosticos()
-        if tratamiento_id:
-            self.load()
+        # Opciones de diagnóstico y, si se edita, el tratamiento: una sola consulta
+        self.load()
 
     def _on_mousewheel(self, event):
         self.canvas.yview_scroll(int(-1*(event.delta/120)), "units")
@@ -565,55 +713,43 @@ class TratamientoDialog(tk.Toplevel):
         footer = ctk.CTkFrame(parent)
         footer.pack(fill="x", pady=(20,0))
         
-        save_btn = ctk.CTkButton(footer, text="Guardar", command=self.save)
-        save_btn.pack(side="right", padx=6)
+        self.save_btn = ctk.CTkButton(footer, text="Guardar", command=self.save)
+        self.save_btn.pack(side="right", padx=6)
         
-        del_btn = ctk.CTkButton(footer, text="Eliminar", fg_color="red", command=self.delete)
-        del_btn.pack(side="right", padx=6)
+        self.del_btn = ctk.CTkButton(footer, text="Eliminar", fg_color="red", command=self.delete)
+        self.del_btn.pack(side="right", padx=6)
 
         # Espaciador
         ctk.CTkLabel(parent, text="").pack(pady=10)
 
-    def cargar_diagnosticos(self):
-        # Cargar diagnósticos disponibles
-        sql = """
-        SELECT d.diagnostico_id, p.nombre, e.nombre, d.created_at
-        FROM diagnosticos d
-        LEFT JOIN pacientes p ON d.paciente_id = p.paciente_id
-        LEFT JOIN enfermedades e ON d.enfermedad_id = e.enfermedad_id
-        ORDER BY d.created_at DESC
-        """
-        diagnosticos = db.fetchall(sql)
-        self.diagnosticos_map = {f"{d[1]} - {d[2]} ({d[3]})": d[0] for d in diagnosticos}
-        self.diagnostico_cb['values'] = list(self.diagnosticos_map.keys())
+    def _busy(self, busy):
+        set_busy(self, busy, widgets=(self.save_btn, self.del_btn))
 
     def load(self):
-        # Cargar datos del tratamiento existente
-        sql = """
-        SELECT diagnostico_id, nombre, descripcion, inicio_fecha, fin_fecha, estado
-        FROM tratamientos WHERE tratamiento_id = %s
-        """
-        row = db.fetchone(sql, (self.tratamiento_id,))
-        
+        def failed(exc):
+            self._busy(False)
+            _default_async_error(exc)
+
+        self._busy(True)
+        run_in_background(self, cargadores.tratamiento_form, db, self.tratamiento_id,
+                          on_done=self._fill, on_error=failed)
+
+    def _fill(self, form):
+        self._busy(False)
+        # Diagnósticos disponibles
+        self.diagnosticos_map = {label: did for did, label in form["diagnosticos"]}
+        self.diagnostico_cb['values'] = list(self.diagnosticos_map.keys())
+
+        row = form["registro"]
         if row:
-            # Buscar el diagnóstico correspondiente
-            diagnostico_info = db.fetchone("""
-                SELECT p.nombre, e.nombre, d.created_at
-                FROM diagnosticos d
-                LEFT JOIN pacientes p ON d.paciente_id = p.paciente_id
-                LEFT JOIN enfermedades e ON d.enfermedad_id = e.enfermedad_id
-                WHERE d.diagnostico_id = %s
-            """, (row[0],))
-            
-            if diagnostico_info:
-                display_text = f"{diagnostico_info[0]} - {diagnostico_info[1]} ({diagnostico_info[2]})"
-                self.diagnostico_var.set(display_text)
+            if row["diagnostico"]:
+                self.diagnostico_var.set(row["diagnostico"])
             
-            self.nombre.insert(0, row[1] or "")
-            self.descripcion.insert("1.0", row[2] or "")
-            self.inicio_fecha.insert(0, str(row[3] or ""))
-            self.fin_fecha.insert(0, str(row[4] or ""))
-            self.estado_var.set(row[5] or "Prescrito")
+            self.nombre.insert(0, row["nombre"] or "")
+            self.descripcion.insert("1.0", row["descripcion"] or "")
+            self.inicio_fecha.insert(0, str(row["inicio_fecha"] or ""))
+            self.fin_fecha.insert(0, str(row["fin_fecha"] or ""))
+            self.estado_var.set(row["estado"] or "Prescrito")
 
     def save(self):
         # Validaciones
@@ -626,7 +762,10 @@ class TratamientoDialog(tk.Toplevel):
             return
 
         # Obtener ID del diagnóstico
-        diagnostico_id = self.diagnosticos_map[self.diagnostico_var.get()]
+        diagnostico_id = self.diagnosticos_map.get(self.diagnostico_var.get())
+        if diagnostico_id is None:
+            messagebox.showwarning("Validación", "Seleccione un diagnóstico de la lista")
+            return
         
         # Preparar datos
         datos = (
@@ -647,7 +786,7 @@ class TratamientoDialog(tk.Toplevel):
             fin_fecha=%s, estado=%s, prescrito_por=%s
             WHERE tratamiento_id=%s
             """
-            db.query(sql, datos + (self.tratamiento_id,))
+            params = datos + (self.tratamiento_id,)
         else:
             # Insertar nuevo
             sql = """
@@ -655,11 +794,20 @@ class TratamientoDialog(tk.Toplevel):
             (diagnostico_id, nombre, descripcion, inicio_fecha, fin_fecha, estado, prescrito_por)
             VALUES (%s, %s, %s, %s, %s, %s, %s)
             """
-            db.query(sql, datos)
+            params = datos
 
-        self.on_save()
-        messagebox.showinfo("Éxito", "Tratamiento guardado correctamente")
-        self.destroy()
+        def done(_):
+            self._busy(False)
+            self.on_save()
+            messagebox.showinfo("Éxito", "Tratamiento guardado correctamente")
+            self.destroy()
+
+        def failed(exc):
+            self._busy(False)
+            messagebox.showerror("Error", f"No se pudo guardar el tratamiento: {exc}")
+
+        self._busy(True)
+        run_in_background(self, db.query, sql, params, on_done=done, on_error=failed)
 
     def delete(self):
         if not self.tratamiento_id:
@@ -667,9 +815,17 @@ class TratamientoDialog(tk.Toplevel):
             return
         
         if messagebox.askyesno("Confirmar", "¿Eliminar tratamiento? Esta acción no se puede deshacer"):
-            db.query("DELETE FROM tratamientos WHERE tratamiento_id=%s", (self.tratamiento_id,))
-            self.on_save()
-            self.destroy()
+            def done(_):
+                self.on_save()
+                self.destroy()
+
+            def failed(exc):
+                self._busy(False)
+                messagebox.showerror("Error", f"No se pudo eliminar el tratamiento: {exc}")
+
+            self._busy(True)
+            run_in_background(self, db.query, "DELETE FROM tratamientos WHERE tratamiento_id=%s",
+                              (self.tratamiento_id,), on_done=done, on_error=failed)
 
 # ---------- Frame: Diagnósticos ----------
 class DiagnosticosFrame(ctk.CTkFrame):
@@ -687,6 +843,8 @@ class DiagnosticosFrame(ctk.CTkFrame):
 
         # Treeview para listar diagnósticos
         cols = ("diagnostico_id", "paciente_nombre", "enfermedad_nombre", "fecha", "tipo", "probabilidad", "notas")
+        filter_slot = ctk.CTkFrame(self, fg_color="transparent")
+        filter_slot.pack(fill="x", padx=10)
         container = ctk.CTkFrame(self)
         container.pack(fill="both", expand=True, padx=10, pady=10)
 
@@ -715,24 +873,40 @@ class DiagnosticosFrame(ctk.CTkFrame):
 
         self.tree.bind("<Double-1>", self.on_edit)
 
+        # Paginación keyset con orden y filtros en el servidor
+        source = KeysetSource(
+            db,
+            [
+                Column("diagnostico_id", "d.diagnostico_id"),
+                Column("paciente_nombre", "p.nombre", null_as="''", text=True),
+                Column("enfermedad_nombre", "e.nombre", null_as="''", text=True),
+                Column("fecha", "d.created_at", null_as="'-infinity'::timestamptz"),
+                Column("tipo", "d.tipo", null_as="''", text=True),
+                Column("probabilidad", "d.probabilidad", null_as="-1"),
+                Column("notas",
+                       "SUBSTRING(d.notas FROM 1 FOR 50) || CASE WHEN LENGTH(d.notas) > 50 THEN '...' ELSE '' END",
+                       key="d.notas", null_as="''", text=True),
+            ],
+            """diagnosticos d
+            LEFT JOIN pacientes p ON d.paciente_id = p.paciente_id
+            LEFT JOIN enfermedades e ON d.enfermedad_id = e.enfermedad_id""",
+            pk="d.diagnostico_id",
+            default_sort="fecha",
+            default_desc=True,
+            table="diagnosticos",
+            changed_at=("d.updated_at", "p.updated_at", "e.updated_at"),
+        )
+        self.pager = PagedTree(self.tree, vsb, source)
+        self.pager.build_filter_bar(filter_slot).pack(fill="x", pady=(0, 4))
+
     def on_show(self):
         self.refresh()
 
+    def on_hide(self):
+        self.pager.cancel()
+
     def refresh(self):
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-        
-        sql = """
-        SELECT d.diagnostico_id, p.nombre, e.nombre, d.created_at, d.tipo, d.probabilidad,
-               SUBSTRING(d.notas FROM 1 FOR 50) || CASE WHEN LENGTH(d.notas) > 50 THEN '...' ELSE '' END as notas_corta
-        FROM diagnosticos d
-        LEFT JOIN pacientes p ON d.paciente_id = p.paciente_id
-        LEFT JOIN enfermedades e ON d.enfermedad_id = e.enfermedad_id
-        ORDER BY d.created_at DESC
-        """
-        rows = db.fetchall(sql)
-        for r in rows:
-            self.tree.insert("", "end", values=r)
+        self.pager.refresh()
 
     def open_add_dialog(self):
         dlg = DiagnosticoDialog(self, None, self.refresh)
@@ -746,376 +920,128 @@ class DiagnosticosFrame(ctk.CTkFrame):
         diagnostico_id = values[0]
         dlg = DiagnosticoDialog(self, diagnostico_id, self.refresh)
         dlg.grab_set()
-# Síntomas reportados por el paciente (clave, etiqueta)
-
-
-from typing import Iterable, Mapping, Set, Tuple, List, Dict, Any
-
-from typing import Any, Dict, Iterable, List, Mapping, Set, Tuple
-
-class Rule:
-    def __init__(
-        self,
-        enfermedad_id: Any,
-        required_signs: Iterable[str] = None,
-        required_symptoms: Iterable[str] = None,
-        optional_signs: Mapping[str, float] = None,
-        optional_symptoms: Mapping[str, float] = None,
-        rule_weight: float = 1.0,
-        sign_vs_symptom_balance: float = 0.5,
-        rule_id: Any = None
-    ):
-        self.rule_id = rule_id
-        self.enfermedad_id = enfermedad_id
-        self.required_signs = set(required_signs or [])
-        self.required_symptoms = set(required_symptoms or [])
-        self.optional_signs = dict(optional_signs or {})
-        self.optional_symptoms = dict(optional_symptoms or {})
-        self.rule_weight = float(rule_weight)
-        self.sign_vs_symptom_balance = float(sign_vs_symptom_balance)
-
-        # validaciones simples
-        if self.rule_weight < 0:
-            raise ValueError("rule_weight debe ser >= 0")
-        if not (0.0 <= self.sign_vs_symptom_balance <= 1.0):
-            raise ValueError("sign_vs_symptom_balance debe estar en [0,1]")
-        for w in list(self.optional_signs.values()) + list(self.optional_symptoms.values()):
-            if w < 0:
-                raise ValueError("pesos en optional_signs/optional_symptoms deben ser >= 0")
-
-    def _partial_score(self, optional_map: Mapping[str, float], evidence_set: Set[str]):
-        total_w = sum(optional_map.values())
-        if total_w <= 0:
-            return None
-        present_w = sum(w for s, w in optional_map.items() if s in evidence_set)
-        return float(present_w / total_w)
 
-    def match_score(self, present_signs: Set[str], present_symptoms: Set[str]) -> Tuple[float, Dict[str, Any]]:
-        """
-        Retorna (raw_score, breakdown). Si falta required devuelve score 0 y breakdown con razón.
-        raw_score está en rango [0, rule_weight].
-        """
-        # required checks
-        if self.required_signs and not self.required_signs.issubset(present_signs):
-            return 0.0, {"reason": "missing_required_signs", "missing": list(self.required_signs - present_signs)}
-        if self.required_symptoms and not self.required_symptoms.issubset(present_symptoms):
-            return 0.0, {"reason": "missing_required_symptoms", "missing": list(self.required_symptoms - present_symptoms)}
+# ---------- Panel de evidencia (signos y síntomas) ----------
+class EvidencePanel(ctk.CTkFrame):
+    """
+    Lista marcable de hallazgos en un solo ttk.Treeview (una fila por
+    hallazgo, no un widget por casilla), agrupada por sección y con caja de
+    filtro. El filtro separa (detach) las filas que no coinciden; las
+    marcadas siempre quedan visibles. reset() deja el panel como nuevo.
 
-        signs_partial = self._partial_score(self.optional_signs, present_signs)
-        symptoms_partial = self._partial_score(self.optional_symptoms, present_symptoms)
+    sections: [(clave_seccion, titulo, [(clave, etiqueta), ...])]
+    """
+    CHECKED, UNCHECKED = "☑ ", "☐ "
+    FILTER_DELAY_MS = 120
 
-        if signs_partial is None:
-            signs_score = 1.0 if self.required_signs else 0.0
-        else:
-            signs_score = signs_partial
+    def __init__(self, parent, sections, height=14):
+        super().__init__(parent)
+        self._order = {}      # seccion -> [iid] en el orden del vocabulario
+        self._label = {}      # iid -> etiqueta
+        self._search = {}     # iid -> texto plegado para filtrar
+        self._checked = set()
+        self._filter_job = None
 
-        if symptoms_partial is None:
-            symptoms_score = 1.0 if self.required_symptoms else 0.0
-        else:
-            symptoms_score = symptoms_partial
-
-        balance = self.sign_vs_symptom_balance
-        combined = balance * signs_score + (1.0 - balance) * symptoms_score
-        raw_score = float(self.rule_weight * combined)
-
-        breakdown = {
-            "rule_id": self.rule_id,
-            "enfermedad_id": self.enfermedad_id,
-            "required_signs": list(self.required_signs),
-            "required_symptoms": list(self.required_symptoms),
-            "signs_score": signs_score,
-            "symptoms_score": symptoms_score,
-            "combined_ratio": combined,
-            "rule_weight": self.rule_weight,
-            "raw_score": raw_score
-        }
-        return raw_score, breakdown
-
-    def match_score_ignore_required(self, present_signs: Set[str], present_symptoms: Set[str]) -> Tuple[float, Dict[str, Any]]:
-        """Versión suave que no falla por requireds (usada en fallback)."""
-        signs_partial = self._partial_score(self.optional_signs, present_signs)
-        symptoms_partial = self._partial_score(self.optional_symptoms, present_symptoms)
-
-        signs_score = 1.0 if signs_partial is None and self.required_signs else (signs_partial or 0.0)
-        symptoms_score = 1.0 if symptoms_partial is None and self.required_symptoms else (symptoms_partial or 0.0)
-
-        combined = self.sign_vs_symptom_balance * signs_score + (1 - self.sign_vs_symptom_balance) * symptoms_score
-        raw_score = float(self.rule_weight * combined)
-        return raw_score, {"note": "soft_ignore_required", "raw_score": raw_score}
-
-class InferenceEngine:
-    def __init__(self, rules: Iterable[Rule] = None):
-        self.rules: List[Rule] = list(rules or [])
-
-    def add_rule(self, rule: Rule) -> None:
-        self.rules.append(rule)
-
-    def infer(self, present_signs: Set[str], present_symptoms: Set[str]) -> List[Tuple[Any, float, List[Any]]]:
-        scores: Dict[Any, float] = {}
-        details: Dict[Any, List[Tuple[Any, float, Dict[str, Any]]]] = {}
-
-        for rule in self.rules:
-            s, breakdown = rule.match_score(present_signs, present_symptoms)
-            if s <= 0:
-                continue
-            eid = rule.enfermedad_id
-            scores[eid] = scores.get(eid, 0.0) + s
-            details.setdefault(eid, []).append((rule.rule_id, s, breakdown))
-
-        if not scores:
-            return []
-
-        total = sum(scores.values())
-        if total <= 1e-12:
-            n = len(scores)
-            results = []
-            for eid in scores:
-                prob = 100.0 / n
-                results.append((eid, prob, details.get(eid, [])))
-            results.sort(key=lambda x: x[1], reverse=True)
-            return results
-
-        results = []
-        for eid, v in scores.items():
-            prob = (v / total) * 100.0
-            results.append((eid, prob, details.get(eid, [])))
-        results.sort(key=lambda x: x[1], reverse=True)
-        return results
-
-
-SINTOMAS_LIST = [
-    ("fiebre", "Fiebre (sensación de calor)"),
-    ("escalofrios", "Escalofríos"),
-    ("tos", "Tos"),
-    ("disnea", "Disnea / Dificultad para respirar"),
-    ("dolor_pecho", "Dolor torácico / Dolor en el pecho"),
-    ("dolor_abdominal", "Dolor abdominal"),
-    ("nausea", "Náusea"),
-    ("vomito", "Vómito"),
-    ("diarrea", "Diarrea"),
-    ("cefalea", "Cefalea / Dolor de cabeza"),
-    ("mareo", "Mareo / Vértigo"),
-    ("confusion", "Confusión"),
-    ("perdida_conciencia", "Pérdida de conciencia"),
-    ("prurito", "Prurito"),
-    ("dolor_articular", "Dolor articular"),
-    ("dolor_muscular", "Dolor muscular"),
-    ("odinofagia", "Odinofagia / Dolor al tragar"),
-    ("rinorrea", "Secreción nasal / Rinorrea"),
-    ("estornudos", "Estornudos"),
-    ("anosmia", "Pérdida de olfato (Anosmia)"),
-    ("ageusia", "Pérdida de gusto (Ageusia)"),
-    ("fatiga", "Fatiga"),
-    ("sudoracion_nocturna", "Sudoración nocturna"),
-    ("dolor_pecho_radiado", "Dolor torácico irradiado"),
-    ("poliaquiuria", "Poliaquiuria / Micciones frecuentes"),
-    ("disuria", "Disuria / Dolor al orinar"),
-    ("diaforesis", "Diaforesis / Sudoración profusa"),
-    ("astenia", "Astenia / Debilidad general")
-]
-
-SIGNOS_LIST = [
-    ("fiebre_obj", "Fiebre (medida)"),
-    ("taquicardia", "Taquicardia"),
-    ("bradicardia", "Bradicardia"),
-    ("hipotension", "Hipotensión"),
-    ("hipertension", "Hipertensión"),
-    ("cianosis", "Cianosis"),
-    ("palidez", "Palidez"),
-    ("ictericia", "Ictericia"),
-    ("lesion_cutanea", "Lesión cutánea / Exantema"),
-    ("adenopatias", "Adenopatías palpables"),
-    ("taquipnea", "Taquipnea"),
-    ("bradipnea", "Bradipnea"),
-    ("hipoxia", "Hipoxia (SpO2 baja)"),
-    ("rales_respiratorios", "Rales / Crepitos"),
-    ("sibilancias", "Sibilancias"),
-    ("murmullo_reducido", "Murmullo vesicular reducido"),
-    ("distension_abdominal", "Distensión abdominal"),
-    ("hepatomegalia", "Hepatomegalia"),
-    ("esplenomegalia", "Esplenomegalia"),
-    ("signos_meningeos", "Signos meníngeos (rigidez nucal)"),
-    ("paresia_paralisis", "Paresia / Parálisis focal"),
-    ("arritmia", "Arritmia (observada/ECG)"),
-    ("edema_periferico", "Edema periférico"),
-    ("oliguria", "Oliguria"),
-    ("sincope", "Síncope observado"),
-    ("hemorragia_activa", "Hemorragia activa")
-]
-
-SYNONYMS = {
-    "dificultad_respiratoria": "disnea",
-    "dificultad-respiratoria": "disnea",
-    "polaquiuria": "poliaquiuria",
-    "congestion": "rinorrea",
-    "rash": "lesion_cutanea",
-    "rash_cutaneo": "lesion_cutanea",
-    "sudoracion": "diaforesis",
-    "sudoracion_nocturna": "sudoracion_nocturna",
-    "fiebre_medida": "fiebre_obj",
-    # añade más según sea necesario
-}
+        top = ctk.CTkFrame(self)
+        top.pack(fill="x", pady=(0, 4))
+        self.filter_var = tk.StringVar()
+        entry = ctk.CTkEntry(top, textvariable=self.filter_var, placeholder_text="Filtrar hallazgos")
+        entry.pack(side="left", fill="x", expand=True, padx=(0, 4))
+        ctk.CTkButton(top, text="Limpiar", width=80, fg_color="gray",
+                      command=lambda: self.filter_var.set("")).pack(side="left")
+        self.count_var = tk.StringVar(value="")
+        ctk.CTkLabel(top, textvariable=self.count_var, text_color="gray").pack(side="right", padx=8)
 
-def normalize_set(raw_set):
-    """Devuelve un set con las claves normalizadas por SYNONYMS."""
-    return {SYNONYMS.get(k, k) for k in raw_set}
-
-
-
-RULES = [
-    Rule(
-        enfermedad_id="Neumonia",
-        required_signs=["rales_respiratorios"],
-        required_symptoms=["fiebre"],
-        optional_signs={"hipoxia": 1.0, "taquipnea": 0.6, "fiebre_obj": 0.8},
-        optional_symptoms={"tos": 0.8, "dolor_pecho": 0.5, "disnea": 0.9},
-        rule_weight=1.6,
-        sign_vs_symptom_balance=0.7,
-        rule_id="r_neumo_1"
-    ),
-    Rule(
-        enfermedad_id="Bronquitis",
-        required_symptoms=["tos"],
-        optional_signs={"sibilancias": 0.6, "rales_respiratorios": 0.3},
-        optional_symptoms={"escalofrios": 0.2, "dolor_pecho": 0.2},
-        rule_weight=0.9,
-        sign_vs_symptom_balance=0.4,
-        rule_id="r_bronq_1"
-    ),
-    Rule(
-        enfermedad_id="Asma",
-        required_signs=["sibilancias"],
-        required_symptoms=["disnea"],
-        optional_signs={"taquipnea": 0.5},
-        optional_symptoms={"tos": 0.6, "fatiga": 0.2},
-        rule_weight=1.2,
-        sign_vs_symptom_balance=0.6,
-        rule_id="r_asma_1"
-    ),
-    Rule(
-        enfermedad_id="Gripe",
-        required_symptoms=["fiebre", "dolor_muscular"],
-        optional_signs={"fiebre_obj": 0.8},
-        optional_symptoms={"tos": 0.6, "rinorrea": 0.3, "anosmia": 0.1},
-        rule_weight=1.0,
-        sign_vs_symptom_balance=0.3,
-        rule_id="r_gripe_1"
-    ),
-    Rule(
-        enfermedad_id="Resfriado",
-        required_symptoms=["rinorrea"],
-        optional_symptoms={"estornudos": 0.7, "odinofagia": 0.3},
-        optional_signs={},
-        rule_weight=0.7,
-        sign_vs_symptom_balance=0.2,
-        rule_id="r_resf_1"
-    ),
-    Rule(
-        enfermedad_id="Sepsis",
-        required_signs=["hipoxia"],
-        required_symptoms=["fiebre"],
-        optional_signs={"taquicardia": 0.7, "hipotension": 0.8},
-        optional_symptoms={"confusion": 0.5, "oliguria": 0.6},
-        rule_weight=2.0,
-        sign_vs_symptom_balance=0.7,
-        rule_id="r_sepsis_1"
-    ),
-    Rule(
-        enfermedad_id="IAM",
-        required_symptoms=["dolor_pecho"],
-        optional_signs={"taquicardia": 0.4, "hipotension": 0.5, "arritmia": 0.6},
-        optional_symptoms={"diaforesis": 0.6, "mareo": 0.3, "nausea": 0.2},
-        rule_weight=1.8,
-        sign_vs_symptom_balance=0.5,
-        rule_id="r_iam_1"
-    ),
-    Rule(
-        enfermedad_id="Apendicitis",
-        required_symptoms=["dolor_abdominal"],
-        optional_signs={"distension_abdominal": 0.4, "fiebre_obj": 0.3},
-        optional_symptoms={"nausea": 0.6, "vomito": 0.5},
-        rule_weight=1.0,
-        sign_vs_symptom_balance=0.4,
-        rule_id="r_apend_1"
-    ),
-    Rule(
-        enfermedad_id="ITU",
-        required_symptoms=["disuria"],
-        optional_symptoms={"poliaquiuria": 0.8, "disuria": 1.0},
-        optional_signs={"fiebre_obj": 0.3},
-        rule_weight=0.8,
-        sign_vs_symptom_balance=0.2,
-        rule_id="r_itu_1"
-    ),
-    Rule(
-        enfermedad_id="Meningitis",
-        required_signs=["signos_meningeos"],
-        required_symptoms=["cefalea", "fiebre"],
-        optional_signs={"confusion": 0.6},
-        optional_symptoms={"vomito": 0.4},
-        rule_weight=1.9,
-        sign_vs_symptom_balance=0.8,
-        rule_id="r_mening_1"
-    ),
-    Rule(
-        enfermedad_id="Dengue",
-        required_symptoms=["fiebre", "dolor_muscular"],
-        optional_symptoms={"sudoracion_nocturna": 0.2, "prurito": 0.5},
-        optional_signs={"lesion_cutanea": 0.6, "hipotension": 0.4},
-        rule_weight=1.3,
-        sign_vs_symptom_balance=0.3,
-        rule_id="r_dengue_1"
-    ),
-    Rule(
-        enfermedad_id="Pancreatitis",
-        required_symptoms=["dolor_abdominal"],
-        optional_signs={"ictericia": 0.3},
-        optional_symptoms={"vomito": 0.6, "fiebre": 0.2},
-        rule_weight=1.1,
-        sign_vs_symptom_balance=0.3,
-        rule_id="r_pancr_1"
-    ),
-    Rule(
-        enfermedad_id="Hipoglucemia",
-        required_signs=[],
-        required_symptoms=["confusion", "mareo"],
-        optional_signs={"diaforesis": 0.6},
-        optional_symptoms={"diaforesis": 0.5},
-        rule_weight=1.0,
-        sign_vs_symptom_balance=0.2,
-        rule_id="r_hipo_1"
-    )
-]
-
-def validate_rules(rules, sintomas_list, signos_list):
-    valid_sintomas = {k for k, _ in sintomas_list}
-    valid_signos = {k for k, _ in signos_list}
-    report = {}
-    for rule in rules:
-        unknown = {"required_signs": [], "required_symptoms": [],
-                   "optional_signs": [], "optional_symptoms": []}
-
-        def check_iterables(iterable, target_set, bucket):
-            for item in (iterable or []):
-                if item not in target_set:
-                    bucket.append(item)
-
-        check_iterables(rule.required_signs, valid_signos, unknown["required_signs"])
-        check_iterables(rule.required_symptoms, valid_sintomas, unknown["required_symptoms"])
-        check_iterables(rule.optional_signs.keys(), valid_signos, unknown["optional_signs"])
-        check_iterables(rule.optional_symptoms.keys(), valid_sintomas, unknown["optional_symptoms"])
-
-        # sugerir correcciones
-        suggestions = {}
-        for cat, items in unknown.items():
-            suggestions[cat] = {}
-            target = valid_signos if "sign" in cat else valid_sintomas
-            for it in items:
-                cands = difflib.get_close_matches(it, target, n=3, cutoff=0.5)
-                suggestions[cat][it] = cands
-        report[rule.rule_id or str(rule.enfermedad_id)] = {"unknown": unknown, "suggestions": suggestions}
-    return report
+        container = ctk.CTkFrame(self)
+        container.pack(fill="both", expand=True)
+        self.tree = ttk.Treeview(container, show="tree", selectmode="browse", height=height)
+        vsb = ttk.Scrollbar(container, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=vsb.set)
+        self.tree.pack(side="left", fill="both", expand=True)
+        vsb.pack(side="right", fill="y")
+
+        for section, title, items in sections:
+            self.tree.insert("", "end", iid=section, text=title, open=True)
+            order = []
+            for key, label in items:
+                iid = f"{section}:{key}"
+                self.tree.insert(section, "end", iid=iid, text=self.UNCHECKED + label)
+                self._label[iid] = label
+                self._search[iid] = fold(f"{label} {key.replace('_', ' ')}")
+                order.append(iid)
+            self._order[section] = order
+
+        self.tree.bind("<Button-1>", self._on_click)
+        self.tree.bind("<space>", self._on_space)
+        self.filter_var.trace_add("write", lambda *_: self._schedule_filter())
+        self._update_count()
+
+    # ---------- API ----------
+    def selected(self, section):
+        """Claves marcadas de una sección."""
+        prefix = section + ":"
+        return {iid[len(prefix):] for iid in self._checked if iid.startswith(prefix)}
+
+    def set_selected(self, section, keys):
+        for iid in self._order.get(section, ()):
+            self._set_checked(iid, iid.split(":", 1)[1] in keys)
+        self.apply_filter()
+
+    def reset(self):
+        for iid in list(self._checked):
+            self._set_checked(iid, False)
+        self.filter_var.set("")
+        self.apply_filter()
+        self.tree.yview_moveto(0)
+
+    # ---------- Interno ----------
+    def _set_checked(self, iid, checked):
+        if checked:
+            self._checked.add(iid)
+        else:
+            self._checked.discard(iid)
+        mark = self.CHECKED if checked else self.UNCHECKED
+        self.tree.item(iid, text=mark + self._label[iid])
+        self._update_count()
+
+    def _toggle(self, iid):
+        if iid in self._label:
+            self._set_checked(iid, iid not in self._checked)
+
+    def _on_click(self, event):
+        iid = self.tree.identify_row(event.y)
+        if iid in self._label:
+            self._toggle(iid)
+            self.tree.selection_set(iid)
+            return "break"
+
+    def _on_space(self, _event):
+        for iid in self.tree.selection():
+            self._toggle(iid)
+        return "break"
+
+    def _schedule_filter(self):
+        if self._filter_job is not None:
+            self.after_cancel(self._filter_job)
+        self._filter_job = self.after(self.FILTER_DELAY_MS, self.apply_filter)
+
+    def apply_filter(self):
+        self._filter_job = None
+        words = fold(self.filter_var.get()).split()
+        for section, order in self._order.items():
+            index = 0
+            for iid in order:
+                text = self._search[iid]
+                if iid in self._checked or all(w in text for w in words):
+                    # move() reinserta una fila separada en su posición original
+                    self.tree.move(iid, section, index)
+                    index += 1
+                else:
+                    self.tree.detach(iid)
 
+    def _update_count(self):
+        n = len(self._checked)
+        self.count_var.set(f"{n} marcado(s)" if n else "")
 
 
 class DiagnosticoDialog(tk.Toplevel):
@@ -1153,12 +1079,14 @@ class DiagnosticoDialog(tk.Toplevel):
         # Bind mouse wheel to canvas
         self.canvas.bind("<MouseWheel>", self._on_mousewheel)
 
-        # Contenido del formulario
+        # Contenido del formulario (los mapas se llenan en segundo plano)
+        self.pacientes_map, self.enfermedades_map, self.encuentros_map = {}, {}, {}
+        self.enfermedades_catalog = None
+        # etiqueta mostrada en resultados -> enfermedad_id (para recomendaciones)
+        self._label_ids = {}
         self.create_form(self.scrollable_frame)
 
         self.cargar_comboboxes()
-        if diagnostico_id:
-            self.load()
 
     def _on_mousewheel(self, event):
         self.canvas.yview_scroll(int(-1*(event.delta/120)), "units")
@@ -1167,96 +1095,50 @@ class DiagnosticoDialog(tk.Toplevel):
     def run_inference(self):
         """
         Inferencia que muestra todos los candidatos (firmes + suaves) en la tabla.
-        Requisitos de atributos en self: signo_vars, sintoma_vars, enfermedad_var,
+        Requisitos de atributos en self: evidence, enfermedad_var,
         probabilidad (Entry-like), infer_result_var, enfermedades_map (opt), results_tree creado.
         """
         try:
-            print("DEBUG: botón inferir pulsado")
-            raw_present_signs = {k for k, v in self.signo_vars.items() if v.get()}
-            raw_present_symptoms = {k for k, v in self.sintoma_vars.items() if v.get()}
+            t0 = time.perf_counter()
+            raw_present_signs = self.evidence.selected("signos")
+            raw_present_symptoms = self.evidence.selected("sintomas")
 
             present_signs = normalize_set(raw_present_signs)
             present_symptoms = normalize_set(raw_present_symptoms)
 
-            print("DEBUG present_signs:", present_signs)
-            print("DEBUG present_symptoms:", present_symptoms)
-
             engine = InferenceEngine(rules=RULES)
-            print("DEBUG num rules:", len(engine.rules))
-
-            # 1) Resultados firmes (respetan requireds)
-            firm_results = engine.infer(present_signs, present_symptoms)  # [(eid, prob_pct, details), ...]
-            print("DEBUG firm_results:", firm_results)
-
-            # 2) Resultados suaves (ignoran requireds)
-            soft_scores = {}
-            soft_details = {}
-            for rule in engine.rules:
-                s, breakdown = rule.match_score_ignore_required(present_signs, present_symptoms)
-                if s <= 0:
-                    continue
-                eid = rule.enfermedad_id
-                soft_scores[eid] = soft_scores.get(eid, 0.0) + s
-                soft_details.setdefault(eid, []).append((rule.rule_id, s, breakdown))
-
-            soft_results = []
-            if soft_scores:
-                total_soft = sum(soft_scores.values())
-                soft_results = [(eid, (v / total_soft) * 100.0, soft_details.get(eid, [])) for eid, v in soft_scores.items()]
-                soft_results.sort(key=lambda x: x[1], reverse=True)
-            print("DEBUG soft_results:", soft_results)
-
-            # 3) Combinar: mantener probabilidades firmes, añadir suaves para eids no presentes
-            combined_map = {}   # eid -> (score_raw_equivalent, details)
-            # convert firm_results pct back to raw-like values to combine meaningfully:
-            for eid, prob_pct, details in firm_results:
-                # store a pseudo-raw score proportional to prob (we'll renormalize later)
-                combined_map[eid] = {"score": prob_pct, "details": details, "source": "firm"}
-
-            for eid, prob_pct, details in soft_results:
-                if eid in combined_map:
-                    # ya existe firme, no sobrescribir pero agregar detalles
-                    combined_map[eid]["details"].extend(details)
-                    # opcional: keep source as 'firm'
-                else:
-                    combined_map[eid] = {"score": prob_pct, "details": details, "source": "soft"}
+
+            # Firmes (respetan requeridos) + suaves para las que no salieron firmes
+            result = differential(engine, present_signs, present_symptoms)
+            firm_results, soft_results, results = result["firm"], result["soft"], result["combined"]
+            self._audit_inference(raw_present_signs, raw_present_symptoms, present_signs, present_symptoms,
+                                  result, (time.perf_counter() - t0) * 1000.0)
 
             # Si no hay ningun resultado (ni firm ni soft)
-            if not combined_map:
+            if not results:
                 self.infer_result_var.set("No se encontraron coincidencias.")
                 self._last_infer_details = {"mode": "none", "raw_signs": raw_present_signs, "raw_symptoms": raw_present_symptoms}
                 # limpiar tabla
                 self.update_results_table([])
                 return
 
-            # 4) Normalizar scores combinados a porcentajes (suma 100)
-            total_score = sum(v["score"] for v in combined_map.values())
-            if total_score <= 1e-12:
-                # si total cero por alguna razón, distribuir uniformemente
-                n = len(combined_map)
-                results = [(eid, 100.0 / n, data["details"]) for eid, data in combined_map.items()]
-            else:
-                results = [(eid, (data["score"] / total_score) * 100.0, data["details"]) for eid, data in combined_map.items()]
-
-            # ordenar por prob desc
-            results.sort(key=lambda x: x[1], reverse=True)
-
-            # 5) Actualizar tabla con TODOS los candidatos
-            print("DEBUG combined results to show:", results)
+            # Actualizar tabla con TODOS los candidatos
             self.update_results_table(results)
+            self._prefetch_recommendations([eid for eid, _, _ in results[:DEFAULT_TOP_K]])
 
             # guardar detalles completos
             self._last_infer_details = {"mode": "combined", "firm": firm_results, "soft": soft_results, "combined": results}
 
-            # 6) Poner el mejor en combobox/entrada de probabilidad
+            # Poner el mejor en combobox/entrada de probabilidad
             best_eid, best_prob, best_details = results[0]
             setted = False
-            if getattr(self, "enfermedades_map", None):
-                for display_name, eid in self.enfermedades_map.items():
-                    if str(eid) == str(best_eid) or str(display_name).lower().startswith(str(best_eid).lower()):
-                        self.enfermedad_var.set(display_name)
-                        setted = True
-                        break
+            catalog_id = self._resolve_enfermedad_id_from_label(str(best_eid), block=False)
+            # Catálogo ya cargado por cargar_comboboxes (sin consultas en el hilo de Tk)
+            catalog = self.enfermedades_catalog
+            display_name = catalog.name_for(catalog_id) if catalog is not None else None
+            if display_name is not None and display_name in self.enfermedades_map:
+                self.enfermedad_var.set(display_name)
+                setted = True
             if not setted:
                 try:
                     self.enfermedad_var.set(str(best_eid))
@@ -1270,8 +1152,6 @@ class DiagnosticoDialog(tk.Toplevel):
                 pass
 
             self.infer_result_var.set(f"Mejor: {best_eid} — {round(best_prob,2)}%")
-            print("DEBUG detalle por enfermedad:")
-            pprint.pprint(self._last_infer_details)
 
         except Exception as exc:
             print("ERROR en run_inference:", exc)
@@ -1280,8 +1160,17 @@ class DiagnosticoDialog(tk.Toplevel):
             except Exception:
                 pass
 
-    
-     
+    def _audit_inference(self, raw_signs, raw_symptoms, signs, symptoms, result, duration_ms):
+        """Encola la entrada de auditoría (el hilo de auditoria.py la escribe)."""
+        if audit_logger is None:
+            return
+        user = self.master.controller.current_user or {}
+        audit_logger.log(auditoria.inference_entry(
+            user.get("usuario_id"),
+            self.pacientes_map.get(self.paciente_var.get()),
+            self.encuentros_map.get(self.encuentro_var.get()),
+            raw_signs, raw_symptoms, signs, symptoms, RULES_VERSION, result, duration_ms,
+        ))
 
     # Métodos de la clase: creación y actualización de la tabla
 
@@ -1321,35 +1210,43 @@ class DiagnosticoDialog(tk.Toplevel):
 
         self.results_tree = tree
 
-    def _resolve_enfermedad_id_from_label(self, label: str):
-        """Resuelve enfermedad_id a partir del texto mostrado en la tabla.
-        Intenta usar el mapa precargado y, si falla, consulta por nombre aproximado.
+    def _resolve_enfermedad_id_from_label(self, label: str, block=True):
+        """Resuelve enfermedad_id a partir del texto mostrado en la tabla
+        (id de regla o nombre del catálogo) con búsquedas en mapas precalculados.
+        Con block=False (hilo de Tk) solo usa el mapa ya cargado; si no lo
+        está, lo pide en segundo plano y resuelve solo por nombre.
         """
         if not label:
             return None
-        # 1) mapa cargado en el combobox (nombre -> id)
-        try:
-            if getattr(self, "enfermedades_map", None):
-                # coincidencia exacta
-                if label in self.enfermedades_map:
-                    return self.enfermedades_map[label]
-                # aproximado por prefijo/casefold
-                lab_cf = str(label).casefold()
-                for nombre, eid in self.enfermedades_map.items():
-                    if str(nombre).casefold().startswith(lab_cf) or lab_cf in str(nombre).casefold():
-                        return eid
-        except Exception:
-            pass
+        if block:
+            dm = catalog_store.disease_map(RULE_IDS)
+        else:
+            dm = catalog_store.loaded_disease_map()
+            if dm is None:
+                run_in_background(self, catalog_store.disease_map, RULE_IDS, key="mapa_enfermedades",
+                                  on_error=lambda e: print("WARN: no se pudo cargar el mapa de enfermedades:", e))
+        eid = dm.resolve(label) if dm is not None else None
+        if eid is None:
+            eid = self.enfermedades_map.get(label)
+        return eid
+
+    def _prefetch_recommendations(self, labels):
+        """
+        Resuelve los ids de los mejores candidatos y carga sus recomendaciones
+        en caché en segundo plano, para que abrirlas sea inmediato.
+        """
+        labels = [str(l) for l in labels if str(l) not in self._label_ids]
 
-        # 2) consulta directa a BD
-        try:
-            row = db.fetchone(
-                "SELECT enfermedad_id FROM enfermedades WHERE nombre ILIKE %s ORDER BY gravedad DESC LIMIT 1",
-                (f"%{label}%",)
-            )
-            return row[0] if row else None
-        except Exception:
-            return None
+        def work():
+            ids = {label: self._resolve_enfermedad_id_from_label(label) for label in labels}
+            recommendation_cache.warm(ids.values())
+            return ids
+
+        def done(ids):
+            self._label_ids.update(ids)
+
+        run_in_background(self, work, on_done=done,
+                          on_error=lambda e: print("WARN: no se pudieron precargar recomendaciones:", e))
 
     def on_result_double_click(self, event):
         try:
@@ -1358,8 +1255,15 @@ class DiagnosticoDialog(tk.Toplevel):
                 return
             vals = self.results_tree.item(sel[0], "values")
             enf_label = vals[0]
-            enf_id = self._resolve_enfermedad_id_from_label(enf_label)
-            self.show_recommendations_dialog(enf_id, enf_label)
+            if enf_label in self._label_ids:
+                self.show_recommendations_dialog(self._label_ids[enf_label], enf_label)
+                return
+            # La resolución puede caer en una consulta a BD: fuera del hilo de Tk
+            def done(enf_id):
+                self._label_ids[enf_label] = enf_id
+                self.show_recommendations_dialog(enf_id, enf_label)
+
+            run_in_background(self, self._resolve_enfermedad_id_from_label, enf_label, on_done=done)
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo abrir recomendaciones: {e}")
 
@@ -1414,80 +1318,30 @@ class DiagnosticoDialog(tk.Toplevel):
             )
             return
 
-        try:
-            # Tratamientos
-            tx_rows = db.fetchall(
-                """
-                SELECT tratamiento, COALESCE(indicaciones, ''), COALESCE(tipo, ''), COALESCE(prioridad, 0)
-                FROM enfermedad_tratamientos_recomendados
-                WHERE enfermedad_id = %s
-                ORDER BY COALESCE(prioridad, 99), tratamiento
-                """,
-                (enfermedad_id,)
-            )
-            # Si hay específicos (prioridad <= 2), ocultar genéricos (prioridad >= 3) con nombres comunes
-            has_specific_tx = any((r[3] or 99) <= 2 for r in tx_rows)
-            if has_specific_tx:
-                filtered_tx = [
-                    r for r in tx_rows
-                    if (r[3] or 99) <= 2 or r[0] not in ("Manejo sintomático", "Analgesia/antitérmico")
-                ]
-            else:
-                filtered_tx = tx_rows
-
-            for r in filtered_tx:
+        def fill(recs):
+            set_busy(dlg, False)
+            # La función SQL ya filtra genéricos y ordena; aquí solo se pinta
+            for r in recs["tratamientos"]:
                 tx_tree.insert("", "end", values=r)
-
-            if not filtered_tx:
+            if not recs["tratamientos"]:
                 tx_tree.insert("", "end", values=("—", "No hay tratamientos registrados", "", ""))
 
-            # Pruebas desde catálogo
-            lab_rows = db.fetchall(
-                """
-                SELECT plc.nombre, COALESCE(epr.nota, ''), COALESCE(epr.urgencia, 0)
-                FROM enfermedad_pruebas_recomendadas epr
-                JOIN pruebas_lab_catalogo plc ON plc.prueba_lab_id = epr.prueba_lab_id
-                WHERE epr.enfermedad_id = %s
-                ORDER BY COALESCE(epr.urgencia, 99), plc.nombre
-                """,
-                (enfermedad_id,)
-            )
-
-            # Pruebas en texto libre
-            lab_rows_text = db.fetchall(
-                """
-                SELECT nombre, COALESCE(nota, ''), COALESCE(urgencia, 0)
-                FROM enfermedad_pruebas_texto_recomendadas
-                WHERE enfermedad_id = %s
-                ORDER BY COALESCE(urgencia, 99), nombre
-                """,
-                (enfermedad_id,)
-            )
-
-            # Si hay específicas (urgencia <= 2 o notas no genéricas), ocultar genéricas ("Estudio básico"/"Perfil básico")
-            def is_specific_lab(row):
-                urg = row[2] or 99
-                nota = (row[1] or "").strip().lower()
-                return urg <= 2 or (nota not in ("estudio básico", "perfil básico"))
-
-            has_specific_labs = any(is_specific_lab(r) for r in (lab_rows + lab_rows_text))
-            if has_specific_labs:
-                filtered_labs = [r for r in lab_rows if is_specific_lab(r)]
-                filtered_labs_text = [r for r in lab_rows_text if is_specific_lab(r)]
-            else:
-                filtered_labs = lab_rows
-                filtered_labs_text = lab_rows_text
-
-            for r in filtered_labs:
-                lab_tree.insert("", "end", values=r)
-            for r in filtered_labs_text:
+            for r in recs["pruebas"]:
                 lab_tree.insert("", "end", values=r)
-
-            if not filtered_labs and not filtered_labs_text:
+            if not recs["pruebas"]:
                 lab_tree.insert("", "end", values=("—", "No hay pruebas registradas", ""))
-        except Exception as e:
+
+        def failed(e):
+            set_busy(dlg, False)
             messagebox.showerror("Error", f"Error al cargar recomendaciones: {e}")
 
+        cached = recommendation_cache.peek(enfermedad_id)
+        if cached is not None:
+            fill(cached)
+            return
+        set_busy(dlg, True)
+        run_in_background(dlg, recommendation_cache.get, enfermedad_id, on_done=fill, on_error=failed)
+
 
     def update_results_table(self, results, mode="firm"):
         """
@@ -1576,85 +1430,12 @@ class DiagnosticoDialog(tk.Toplevel):
         self.probabilidad.pack(fill="x", pady=(0,8))
 
                         # ------- Inicio sección Signos y Síntomas -------
-        ctk.CTkLabel(parent, text="Signos (observables por el doctor)", anchor="w").pack(fill="x", pady=(8,2))
-        self.signos_list = [
-            ("fiebre_obj", "Fiebre (medida)"),
-            ("taquicardia", "Taquicardia"),
-            ("bradicardia", "Bradicardia"),
-            ("hipotension", "Hipotensión"),
-            ("hipertension", "Hipertensión"),
-            ("cianosis", "Cianosis"),
-            ("palidez", "Palidez"),
-            ("ictericia", "Ictericia"),
-            ("lesion_cutanea", "Lesión cutánea / Exantema"),
-            ("adenopatias", "Adenopatías palpables"),
-            ("taquipnea", "Taquipnea"),
-            ("bradipnea", "Bradipnea"),
-            ("hipoxia", "Hipoxia (SpO2 baja)"),
-            ("rales_respiratorios", "Rales / Crepitos"),
-            ("sibilancias", "Sibilancias"),
-            ("murmullo_reducido", "Murmullo vesicular reducido"),
-            ("distension_abdominal", "Distensión abdominal"),
-            ("hepatomegalia", "Hepatomegalia"),
-            ("esplenomegalia", "Esplenomegalia"),
-            ("signos_meningeos", "Signos meníngeos (rigidez nucal)"),
-            ("paresia_paralisis", "Paresia / Parálisis focal"),
-            ("arritmia", "Arritmia (observada/ECG)"),
-            ("edema_periferico", "Edema periférico"),
-            ("oliguria", "Oliguria"),
-            ("sincope", "Síncope observado"),
-            ("hemorragia_activa", "Hemorragia activa")
-        ]
-
-        signos_frame = ctk.CTkFrame(parent)
-        signos_frame.pack(fill="x", pady=(0,8))
-        self.signo_vars = {}
-        for key, label in self.signos_list:
-            var = tk.BooleanVar(value=False)
-            cb = ctk.CTkCheckBox(signos_frame, text=label, variable=var)
-            cb.pack(anchor="w", padx=4, pady=2)
-            self.signo_vars[key] = var
-
-        ctk.CTkLabel(parent, text="Síntomas (reportados por el paciente)", anchor="w").pack(fill="x", pady=(8,2))
-        self.sintomas_list = [
-            ("fiebre", "Fiebre (sensación de calor)"),
-            ("escalofrios", "Escalofríos"),
-            ("tos", "Tos"),
-            ("disnea", "Disnea / Dificultad para respirar"),
-            ("dolor_pecho", "Dolor torácico / Dolor en el pecho"),
-            ("dolor_abdominal", "Dolor abdominal"),
-            ("nausea", "Náusea"),
-            ("vomito", "Vómito"),
-            ("diarrea", "Diarrea"),
-            ("cefalea", "Cefalea / Dolor de cabeza"),
-            ("mareo", "Mareo / Vértigo"),
-            ("confusion", "Confusión"),
-            ("perdida_conciencia", "Pérdida de conciencia"),
-            ("prurito", "Prurito"),
-            ("dolor_articular", "Dolor articular"),
-            ("dolor_muscular", "Dolor muscular"),
-            ("odinofagia", "Odinofagia / Dolor al tragar"),
-            ("rinorrea", "Secreción nasal / Rinorrea"),
-            ("estornudos", "Estornudos"),
-            ("anosmia", "Pérdida de olfato (Anosmia)"),
-            ("ageusia", "Pérdida de gusto (Ageusia)"),
-            ("fatiga", "Fatiga"),
-            ("sudoracion_nocturna", "Sudoración nocturna"),
-            ("dolor_pecho_radiado", "Dolor torácico irradiado"),
-            ("poliaquiuria", "Poliaquiuria / Micciones frecuentes"),
-            ("disuria", "Disuria / Dolor al orinar"),
-            ("diaforesis", "Diaforesis / Sudoración profusa"),
-            ("astenia", "Astenia / Debilidad general")
-        ]
-
-        sintomas_frame = ctk.CTkFrame(parent)
-        sintomas_frame.pack(fill="x", pady=(0,8))
-        self.sintoma_vars = {}
-        for key, label in self.sintomas_list:
-            var = tk.BooleanVar(value=False)
-            cb = ctk.CTkCheckBox(sintomas_frame, text=label, variable=var)
-            cb.pack(anchor="w", padx=4, pady=2)
-            self.sintoma_vars[key] = var
+        ctk.CTkLabel(parent, text="Signos y síntomas", anchor="w").pack(fill="x", pady=(8,2))
+        self.evidence = EvidencePanel(parent, [
+            ("signos", "Signos (observables por el doctor)", SIGNOS_LIST),
+            ("sintomas", "Síntomas (reportados por el paciente)", SINTOMAS_LIST),
+        ])
+        self.evidence.pack(fill="x", pady=(0,8))
 
         # Botones inferencia
         bottom_row = ctk.CTkFrame(parent)
@@ -1666,6 +1447,8 @@ class DiagnosticoDialog(tk.Toplevel):
 
         infer_btn = ctk.CTkButton(inf_frame, text="Inferir diagnóstico", command=self.run_inference)
         infer_btn.pack(side="left", padx=(0,8))
+        ctk.CTkButton(inf_frame, text="Limpiar", width=70, fg_color="gray",
+                      command=self.evidence.reset).pack(side="left", padx=(0,8))
 
         self.infer_result_var = tk.StringVar(value="")
         inf_lbl = ctk.CTkLabel(inf_frame, textvariable=self.infer_result_var, anchor="w")
@@ -1693,69 +1476,71 @@ class DiagnosticoDialog(tk.Toplevel):
         footer = ctk.CTkFrame(parent)
         footer.pack(fill="x", pady=(20,0))
         
-        save_btn = ctk.CTkButton(footer, text="Guardar", command=self.save)
-        save_btn.pack(side="right", padx=6)
+        self.save_btn = ctk.CTkButton(footer, text="Guardar", command=self.save)
+        self.save_btn.pack(side="right", padx=6)
         
-        del_btn = ctk.CTkButton(footer, text="Eliminar", fg_color="red", command=self.delete)
-        del_btn.pack(side="right", padx=6)
+        self.del_btn = ctk.CTkButton(footer, text="Eliminar", fg_color="red", command=self.delete)
+        self.del_btn.pack(side="right", padx=6)
 
         # Espaciador
         ctk.CTkLabel(parent, text="").pack(pady=10)
 
+    def _busy(self, busy):
+        set_busy(self, busy, widgets=(self.save_btn, self.del_btn))
+
     def cargar_comboboxes(self):
-        # Cargar pacientes
-        pacientes = db.fetchall("SELECT paciente_id, nombre FROM pacientes ORDER BY nombre")
-        self.pacientes_map = {f"{p[1]}": p[0] for p in pacientes}
-        self.paciente_cb['values'] = list(self.pacientes_map.keys())
+        # Pacientes, diagnóstico existente y encuentros de su paciente: una sola consulta
+        def failed(exc):
+            self._busy(False)
+            _default_async_error(exc)
 
-        # Cargar enfermedades
-        enfermedades = db.fetchall("SELECT enfermedad_id, nombre FROM enfermedades ORDER BY nombre")
-        self.enfermedades_map = {f"{e[1]}": e[0] for e in enfermedades}
-        self.enfermedad_cb['values'] = list(self.enfermedades_map.keys())
+        self._busy(True)
+        run_in_background(self, cargadores.diagnostico_form, db, self.diagnostico_id,
+                          on_done=self._fill, on_error=failed)
+
+        # Cargar enfermedades (desde el catálogo en memoria)
+        def done_enfermedades(enfermedades):
+            self.enfermedades_catalog = enfermedades
+            self.enfermedades_map = enfermedades.by_name
+            self.enfermedad_cb['values'] = enfermedades.names
+
+        run_in_background(self, catalog_store.get, "enfermedades", on_done=done_enfermedades)
+
+    def _set_encuentros(self, encuentros):
+        self.encuentros_map = {label: eid for eid, label in encuentros}
+        self.encuentro_cb['values'] = list(self.encuentros_map.keys())
 
     def on_paciente_select(self, event):
         # Cuando se selecciona paciente, cargar sus encuentros
         paciente_nombre = self.paciente_var.get()
-        if not paciente_nombre:
+        if not paciente_nombre or paciente_nombre not in self.pacientes_map:
             return
         
         paciente_id = self.pacientes_map[paciente_nombre]
-        encuentros = db.fetchall("""
-            SELECT encuentro_id, fecha, tipo_encuentro 
-            FROM encuentros 
-            WHERE paciente_id = %s 
-            ORDER BY fecha DESC
-        """, (paciente_id,))
-        
-        self.encuentros_map = {f"{e[1]} - {e[2]}": e[0] for e in encuentros}
-        self.encuentro_cb['values'] = list(self.encuentros_map.keys())
+        # Clave por diálogo: si se cambia de paciente rápido solo cuenta el último
+        run_in_background(self, cargadores.encuentros_de_paciente, db, paciente_id,
+                          on_done=self._set_encuentros, key=(id(self), "encuentros"))
 
-    def load(self):
-        # Cargar datos del diagnóstico existente
-        sql = """
-        SELECT paciente_id, encuentro_id, enfermedad_id, tipo, probabilidad, notas
-        FROM diagnosticos WHERE diagnostico_id = %s
-        """
-        row = db.fetchone(sql, (self.diagnostico_id,))
-        
+    def _fill(self, form):
+        self._busy(False)
+        self.pacientes_map = {f"{nombre}": pid for pid, nombre in form["pacientes"]}
+        self.paciente_cb['values'] = list(self.pacientes_map.keys())
+
+        row = form["registro"]
         if row:
-            # Cargar nombres para los comboboxes
-            paciente = db.fetchone("SELECT nombre FROM pacientes WHERE paciente_id = %s", (row[0],))
-            if paciente: 
-                self.paciente_var.set(paciente[0])
+            self._set_encuentros(form["encuentros"])
+            if row["paciente"]: 
+                self.paciente_var.set(row["paciente"])
             
-            if row[1]:  # encuentro_id
-                encuentro = db.fetchone("SELECT fecha, tipo_encuentro FROM encuentros WHERE encuentro_id = %s", (row[1],))
-                if encuentro:
-                    self.encuentro_var.set(f"{encuentro[0]} - {encuentro[1]}")
+            if row["encuentro"]:
+                self.encuentro_var.set(row["encuentro"])
             
-            enfermedad = db.fetchone("SELECT nombre FROM enfermedades WHERE enfermedad_id = %s", (row[2],))
-            if enfermedad:
-                self.enfermedad_var.set(enfermedad[0])
+            if row["enfermedad"]:
+                self.enfermedad_var.set(row["enfermedad"])
             
-            self.tipo_var.set(row[3] or "")
-            self.probabilidad.insert(0, str(row[4] or ""))
-            self.notas.insert("1.0", row[5] or "")
+            self.tipo_var.set(row["tipo"] or "")
+            self.probabilidad.insert(0, str(row["probabilidad"] or ""))
+            self.notas.insert("1.0", row["notas"] or "")
 
     def save(self):
         # Validaciones
@@ -1764,12 +1549,15 @@ class DiagnosticoDialog(tk.Toplevel):
             return
 
         # Obtener IDs
-        paciente_id = self.pacientes_map[self.paciente_var.get()]
-        enfermedad_id = self.enfermedades_map[self.enfermedad_var.get()]
+        paciente_id = self.pacientes_map.get(self.paciente_var.get())
+        enfermedad_id = self.enfermedades_map.get(self.enfermedad_var.get())
+        if paciente_id is None or enfermedad_id is None:
+            messagebox.showwarning("Validación", "Espere a que carguen las listas y seleccione paciente y enfermedad")
+            return
         
         encuentro_id = None
         if self.encuentro_var.get():
-            encuentro_id = self.encuentros_map[self.encuentro_var.get()]
+            encuentro_id = self.encuentros_map.get(self.encuentro_var.get())
 
         # Preparar datos
         datos = (
@@ -1784,27 +1572,43 @@ class DiagnosticoDialog(tk.Toplevel):
             self.master.controller.current_user["usuario_id"]
         )
 
-        if self.diagnostico_id:
-            # Actualizar
-            sql = """
-            UPDATE diagnosticos SET 
-            paciente_id=%s, encuentro_id=%s, enfermedad_id=%s, tipo=%s, 
-            probabilidad=%s, fuente=%s, regla_id=%s, notas=%s, created_by=%s
-            WHERE diagnostico_id=%s
-            """
-            db.query(sql, datos + (self.diagnostico_id,))
-        else:
-            # Insertar nuevo
-            sql = """
-            INSERT INTO diagnosticos 
-            (paciente_id, encuentro_id, enfermedad_id, tipo, probabilidad, fuente, regla_id, notas, created_by)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            db.query(sql, datos)
+        diagnostico_id = self.diagnostico_id
+
+        def work():
+            # Una transacción para el diagnóstico y cualquier fila hija asociada
+            with db.transaction():
+                if diagnostico_id:
+                    # Actualizar
+                    sql = """
+                    UPDATE diagnosticos SET 
+                    paciente_id=%s, encuentro_id=%s, enfermedad_id=%s, tipo=%s, 
+                    probabilidad=%s, fuente=%s, regla_id=%s, notas=%s, created_by=%s
+                    WHERE diagnostico_id=%s
+                    """
+                    db.query(sql, datos + (diagnostico_id,))
+                    return diagnostico_id
+                # Insertar nuevo
+                sql = """
+                INSERT INTO diagnosticos 
+                (paciente_id, encuentro_id, enfermedad_id, tipo, probabilidad, fuente, regla_id, notas, created_by)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING diagnostico_id
+                """
+                return db.fetchone(sql, datos)[0]
 
-        self.on_save()
-        messagebox.showinfo("Éxito", "Diagnóstico guardado correctamente")
-        self.destroy()
+        def done(new_id):
+            self._busy(False)
+            self.diagnostico_id = new_id
+            self.on_save()
+            messagebox.showinfo("Éxito", "Diagnóstico guardado correctamente")
+            self.destroy()
+
+        def failed(exc):
+            self._busy(False)
+            messagebox.showerror("Error", f"No se pudo guardar el diagnóstico: {exc}")
+
+        self._busy(True)
+        run_in_background(self, work, on_done=done, on_error=failed)
 
     def delete(self):
         if not self.diagnostico_id:
@@ -1812,9 +1616,17 @@ class DiagnosticoDialog(tk.Toplevel):
             return
         
         if messagebox.askyesno("Confirmar", "¿Eliminar diagnóstico? Esta acción no se puede deshacer"):
-            db.query("DELETE FROM diagnosticos WHERE diagnostico_id=%s", (self.diagnostico_id,))
-            self.on_save()
-            self.destroy()
+            def done(_):
+                self.on_save()
+                self.destroy()
+
+            def failed(exc):
+                self._busy(False)
+                messagebox.showerror("Error", f"No se pudo eliminar el diagnóstico: {exc}")
+
+            self._busy(True)
+            run_in_background(self, db.query, "DELETE FROM diagnosticos WHERE diagnostico_id=%s",
+                              (self.diagnostico_id,), on_done=done, on_error=failed)
 
 # ---------- Frame: Gestión de Usuarios ----------
 class UsuariosFrame(ctk.CTkFrame):
@@ -1832,6 +1644,8 @@ class UsuariosFrame(ctk.CTkFrame):
 
         # Treeview para listar usuarios
         cols = ("usuario_id", "nombre", "correo", "rol", "fecha_creacion")
+        filter_slot = ctk.CTkFrame(self, fg_color="transparent")
+        filter_slot.pack(fill="x", padx=10)
         container = ctk.CTkFrame(self)
         container.pack(fill="both", expand=True, padx=10, pady=10)
 
@@ -1858,21 +1672,33 @@ class UsuariosFrame(ctk.CTkFrame):
 
         self.tree.bind("<Double-1>", self.on_edit)
 
+        # Paginación keyset con orden y filtros en el servidor
+        source = KeysetSource(
+            db,
+            [
+                Column("usuario_id", "usuario_id"),
+                Column("nombre", "nombre", text=True),
+                Column("correo", "correo", null_as="''", text=True),
+                Column("rol", "rol", text=True),
+                Column("fecha_creacion", "created_at", null_as="'-infinity'::timestamptz"),
+            ],
+            "usuarios",
+            pk="usuario_id",
+            default_sort="nombre",
+            table="usuarios",
+            changed_at=("updated_at",),
+        )
+        self.pager = PagedTree(self.tree, vsb, source)
+        self.pager.build_filter_bar(filter_slot).pack(fill="x", pady=(0, 4))
+
     def on_show(self):
         self.refresh()
 
+    def on_hide(self):
+        self.pager.cancel()
+
     def refresh(self):
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-        
-        sql = """
-        SELECT usuario_id, nombre, correo, rol, created_at
-        FROM usuarios 
-        ORDER BY nombre
-        """
-        rows = db.fetchall(sql)
-        for r in rows:
-            self.tree.insert("", "end", values=r)
+        self.pager.refresh()
 
     def open_add_dialog(self):
         # Verificar que solo admin puede crear usuarios
@@ -1968,24 +1794,33 @@ class UsuarioDialog(tk.Toplevel):
         footer = ctk.CTkFrame(parent)
         footer.pack(fill="x", pady=(20,0))
         
-        save_btn = ctk.CTkButton(footer, text="Guardar", command=self.save)
-        save_btn.pack(side="right", padx=6)
+        self.save_btn = ctk.CTkButton(footer, text="Guardar", command=self.save)
+        self.save_btn.pack(side="right", padx=6)
         
-        del_btn = ctk.CTkButton(footer, text="Eliminar", fg_color="red", command=self.delete)
-        del_btn.pack(side="right", padx=6)
+        self.del_btn = ctk.CTkButton(footer, text="Eliminar", fg_color="red", command=self.delete)
+        self.del_btn.pack(side="right", padx=6)
 
         # Espaciador
         ctk.CTkLabel(parent, text="").pack(pady=10)
 
+    def _busy(self, busy):
+        set_busy(self, busy, widgets=(self.save_btn, self.del_btn))
+
     def load(self):
         # Cargar datos del usuario existente
-        sql = "SELECT nombre, correo, rol FROM usuarios WHERE usuario_id = %s"
-        row = db.fetchone(sql, (self.usuario_id,))
-        
+        def failed(exc):
+            self._busy(False)
+            _default_async_error(exc)
+
+        self._busy(True)
+        run_in_background(self, cargadores.usuario, db, self.usuario_id, on_done=self._fill, on_error=failed)
+
+    def _fill(self, row):
+        self._busy(False)
         if row:
-            self.nombre.insert(0, row[0] or "")
-            self.correo.insert(0, row[1] or "")
-            self.rol_var.set(row[2] or "medico")
+            self.nombre.insert(0, row["nombre"] or "")
+            self.correo.insert(0, row["correo"] or "")
+            self.rol_var.set(row["rol"] or "medico")
 
     def save(self):
         # Validaciones
@@ -2020,60 +1855,73 @@ class UsuarioDialog(tk.Toplevel):
                 messagebox.showwarning("Validación", "Las contraseñas no coinciden")
                 return
 
-        # Verificar si el correo ya existe (excepto para el usuario actual)
-        if self.usuario_id:
-            existing = db.fetchone(
-                "SELECT usuario_id FROM usuarios WHERE correo = %s AND usuario_id != %s", 
-                (self.correo.get().strip(), self.usuario_id)
-            )
-        else:
-            existing = db.fetchone(
-                "SELECT usuario_id FROM usuarios WHERE correo = %s", 
-                (self.correo.get().strip(),)
-            )
-        
-        if existing:
-            messagebox.showwarning("Validación", "El correo electrónico ya está registrado")
-            return
-
         # Preparar datos
         datos_base = (
             self.nombre.get().strip(),
             self.correo.get().strip(),
             self.rol_var.get()
         )
-
-        if self.usuario_id:
-            if password:
-                # Actualizar con nueva contraseña
-                hashed_password = hash_password(password)
-                sql = """
-                UPDATE usuarios SET 
-                nombre=%s, correo=%s, rol=%s, hashed_password=%s, updated_at=now()
-                WHERE usuario_id=%s
-                """
-                db.query(sql, datos_base + (hashed_password, self.usuario_id))
+        usuario_id = self.usuario_id
+
+        def work():
+            # Verificar si el correo ya existe (excepto para el usuario actual)
+            if usuario_id:
+                existing = db.fetchone(
+                    "SELECT usuario_id FROM usuarios WHERE correo = %s AND usuario_id != %s", 
+                    (datos_base[1], usuario_id)
+                )
             else:
-                # Actualizar sin cambiar contraseña
+                existing = db.fetchone(
+                    "SELECT usuario_id FROM usuarios WHERE correo = %s", 
+                    (datos_base[1],)
+                )
+            if existing:
+                return "correo_duplicado"
+
+            if usuario_id:
+                if password:
+                    # Actualizar con nueva contraseña
+                    hashed_password = hash_password(password)
+                    sql = """
+                    UPDATE usuarios SET 
+                    nombre=%s, correo=%s, rol=%s, hashed_password=%s, updated_at=now()
+                    WHERE usuario_id=%s
+                    """
+                    db.query(sql, datos_base + (hashed_password, usuario_id))
+                else:
+                    # Actualizar sin cambiar contraseña
+                    sql = """
+                    UPDATE usuarios SET 
+                    nombre=%s, correo=%s, rol=%s, updated_at=now()
+                    WHERE usuario_id=%s
+                    """
+                    db.query(sql, datos_base + (usuario_id,))
+            else:
+                # Insertar nuevo usuario
+                hashed_password = hash_password(password)
                 sql = """
-                UPDATE usuarios SET 
-                nombre=%s, correo=%s, rol=%s, updated_at=now()
-                WHERE usuario_id=%s
+                INSERT INTO usuarios 
+                (nombre, correo, rol, hashed_password)
+                VALUES (%s, %s, %s, %s)
                 """
-                db.query(sql, datos_base + (self.usuario_id,))
-        else:
-            # Insertar nuevo usuario
-            hashed_password = hash_password(password)
-            sql = """
-            INSERT INTO usuarios 
-            (nombre, correo, rol, hashed_password)
-            VALUES (%s, %s, %s, %s)
-            """
-            db.query(sql, datos_base + (hashed_password,))
+                db.query(sql, datos_base + (hashed_password,))
+            return "ok"
 
-        self.on_save()
-        messagebox.showinfo("Éxito", "Usuario guardado correctamente")
-        self.destroy()
+        def done(status):
+            self._busy(False)
+            if status == "correo_duplicado":
+                messagebox.showwarning("Validación", "El correo electrónico ya está registrado")
+                return
+            self.on_save()
+            messagebox.showinfo("Éxito", "Usuario guardado correctamente")
+            self.destroy()
+
+        def failed(exc):
+            self._busy(False)
+            messagebox.showerror("Error", f"No se pudo guardar el usuario: {exc}")
+
+        self._busy(True)
+        run_in_background(self, work, on_done=done, on_error=failed)
 
     def delete(self):
             if not self.usuario_id:
@@ -2086,82 +1934,94 @@ class UsuarioDialog(tk.Toplevel):
                 messagebox.showwarning("Error", "No puedes eliminar tu propio usuario")
                 return
 
-            # Verificar si el usuario tiene registros asociados
-            check_sql = """
-            SELECT COUNT(*) FROM (
-                SELECT 1 FROM encuentros WHERE created_by = %s
-                UNION ALL
-                SELECT 1 FROM diagnosticos WHERE created_by = %s
-                UNION ALL
-                SELECT 1 FROM tratamientos WHERE prescrito_por = %s
-            ) as registros
-            """
-            count = db.fetchone(check_sql, (self.usuario_id, self.usuario_id, self.usuario_id))[0]
-            
-            if count > 0:
-                # Buscar otros médicos disponibles
-                medicos = db.fetchall(
-                    "SELECT usuario_id, nombre FROM usuarios WHERE rol = 'medico' AND usuario_id != %s ORDER BY nombre",
-                    (self.usuario_id,)
-                )
-                
-                if not medicos:
-                    if messagebox.askyesno("Crear Médico", 
-                        "El usuario tiene registros asociados y no hay otros médicos disponibles para reasignarlos.\n" +
-                        "¿Deseas dar de alta un nuevo médico antes de eliminar este usuario?"):
-                        # Abrir diálogo para crear nuevo médico
-                        dlg = UsuarioDialog(self, None, self.on_save)
-                        dlg.rol_var.set("medico")  # Preseleccionar rol médico
-                        dlg.grab_set()
-                        self.wait_window(dlg)  # Esperar a que se cierre la ventana
-                        
-                        # Recargar lista de médicos
-                        medicos = db.fetchall(
-                            "SELECT usuario_id, nombre FROM usuarios WHERE rol = 'medico' AND usuario_id != %s ORDER BY nombre",
-                            (self.usuario_id,)
-                        )
-                    
-                if not medicos:
-                    messagebox.showwarning("Error", 
-                        "No hay médicos disponibles para reasignar los registros.\n" +
-                        "Debes crear un nuevo médico antes de eliminar este usuario.")
+            self._fetch_delete_info(offer_new_medico=True)
+
+    # Registros asociados al usuario y médicos a los que se pueden reasignar
+    CHECK_RECORDS_SQL = """
+    SELECT COUNT(*) FROM (
+        SELECT 1 FROM encuentros WHERE created_by = %s
+        UNION ALL
+        SELECT 1 FROM diagnosticos WHERE created_by = %s
+        UNION ALL
+        SELECT 1 FROM tratamientos WHERE prescrito_por = %s
+    ) as registros
+    """
+    MEDICOS_SQL = "SELECT usuario_id, nombre FROM usuarios WHERE rol = 'medico' AND usuario_id != %s ORDER BY nombre"
+
+    def _fetch_delete_info(self, offer_new_medico):
+        def fetch():
+            count = db.fetchone(self.CHECK_RECORDS_SQL, (self.usuario_id, self.usuario_id, self.usuario_id))[0]
+            medicos = db.fetchall(self.MEDICOS_SQL, (self.usuario_id,))
+            return count, medicos
+
+        def failed(exc):
+            self._busy(False)
+            _default_async_error(exc)
+
+        self._busy(True)
+        run_in_background(self, fetch, on_error=failed,
+                          on_done=lambda r: self._continue_delete(*r, offer_new_medico=offer_new_medico))
+
+    def _continue_delete(self, count, medicos, offer_new_medico=True):
+        self._busy(False)
+        if count > 0:
+            if not medicos:
+                if offer_new_medico and messagebox.askyesno("Crear Médico", 
+                    "El usuario tiene registros asociados y no hay otros médicos disponibles para reasignarlos.\n" +
+                    "¿Deseas dar de alta un nuevo médico antes de eliminar este usuario?"):
+                    # Abrir diálogo para crear nuevo médico
+                    dlg = UsuarioDialog(self, None, self.on_save)
+                    dlg.rol_var.set("medico")  # Preseleccionar rol médico
+                    dlg.grab_set()
+                    self.wait_window(dlg)  # Esperar a que se cierre la ventana
+
+                    # Volver a consultar (en segundo plano) con el médico recién creado
+                    if self.winfo_exists():
+                        self._fetch_delete_info(offer_new_medico=False)
                     return
                 
-                # Crear diálogo de selección de médico
-                seleccion = tk.Toplevel(self)
-                seleccion.title("Reasignar Registros")
-                seleccion.geometry("400x250")
-                
-                frm = ctk.CTkFrame(seleccion)
-                frm.pack(fill="both", expand=True, padx=12, pady=12)
-                
-                mensaje = f"El usuario tiene {count} registros asociados.\n" + \
-                        "Selecciona el médico al que se reasignarán todos los registros:"
-                ctk.CTkLabel(frm, text=mensaje, wraplength=350).pack(pady=(0,10))
+            if not medicos:
+                messagebox.showwarning("Error", 
+                    "No hay médicos disponibles para reasignar los registros.\n" +
+                    "Debes crear un nuevo médico antes de eliminar este usuario.")
+                return
+            
+            # Crear diálogo de selección de médico
+            seleccion = tk.Toplevel(self)
+            seleccion.title("Reasignar Registros")
+            seleccion.geometry("400x250")
+            
+            frm = ctk.CTkFrame(seleccion)
+            frm.pack(fill="both", expand=True, padx=12, pady=12)
+            
+            mensaje = f"El usuario tiene {count} registros asociados.\n" + \
+                    "Selecciona el médico al que se reasignarán todos los registros:"
+            ctk.CTkLabel(frm, text=mensaje, wraplength=350).pack(pady=(0,10))
+            
+            medico_var = tk.StringVar()
+            medicos_cb = ttk.Combobox(frm, textvariable=medico_var, state="readonly")
+            medicos_cb["values"] = [m[1] for m in medicos]
+            medicos_cb.pack(fill="x", pady=10)
+            
+            def confirmar_reasignacion():
+                if not medico_var.get():
+                    messagebox.showwarning("Error", "Debes seleccionar un médico")
+                    return
                 
-                medico_var = tk.StringVar()
-                medicos_cb = ttk.Combobox(frm, textvariable=medico_var, state="readonly")
-                medicos_cb["values"] = [m[1] for m in medicos]
-                medicos_cb.pack(fill="x", pady=10)
+                # Obtener ID del médico seleccionado
+                medico_destino = None
+                for m in medicos:
+                    if m[1] == medico_var.get():
+                        medico_destino = m[0]
+                        break
                 
-                def confirmar_reasignacion():
-                    if not medico_var.get():
-                        messagebox.showwarning("Error", "Debes seleccionar un médico")
-                        return
-                    
-                    # Obtener ID del médico seleccionado
-                    medico_destino = None
-                    for m in medicos:
-                        if m[1] == medico_var.get():
-                            medico_destino = m[0]
-                            break
-                    
-                    if medico_destino:
-                        if messagebox.askyesno("Confirmar", 
-                            "¿Estás seguro de reasignar todos los registros y eliminar al usuario?\n" + 
-                            "Esta acción no se puede deshacer."):
-                            try:
-                                # Reasignar todos los registros
+                if medico_destino:
+                    if messagebox.askyesno("Confirmar", 
+                        "¿Estás seguro de reasignar todos los registros y eliminar al usuario?\n" + 
+                        "Esta acción no se puede deshacer."):
+                        def reasignar():
+                            # Reasignar todos los registros y eliminar en una sola transacción
+                            with db.transaction():
                                 db.query(
                                     "UPDATE encuentros SET created_by = %s WHERE created_by = %s",
                                     (medico_destino, self.usuario_id)
@@ -2174,39 +2034,51 @@ class UsuarioDialog(tk.Toplevel):
                                     "UPDATE tratamientos SET prescrito_por = %s WHERE prescrito_por = %s",
                                     (medico_destino, self.usuario_id)
                                 )
-                                
+
                                 # Eliminar usuario
                                 db.query("DELETE FROM usuarios WHERE usuario_id = %s", (self.usuario_id,))
-                                
-                                messagebox.showinfo("Éxito", 
-                                    "Los registros han sido reasignados y el usuario ha sido eliminado.")
-                                seleccion.destroy()
-                                self.on_save()
-                                self.destroy()
-                            except Exception as e:
-                                messagebox.showerror("Error", 
-                                    f"Ha ocurrido un error al reasignar los registros: {str(e)}")
-                
-                btn_confirmar = ctk.CTkButton(frm, text="Confirmar Reasignación", command=confirmar_reasignacion)
-                btn_confirmar.pack(pady=10)
-                
-                btn_cancelar = ctk.CTkButton(frm, text="Cancelar", 
-                                        fg_color="gray", 
-                                        command=seleccion.destroy)
-                btn_cancelar.pack(pady=5)
-                
-                seleccion.transient(self)  # Hacer la ventana dependiente de la principal
-                seleccion.grab_set()  # Hacer la ventana modal
-                return
+
+                        def done(_):
+                            set_busy(seleccion, False)
+                            messagebox.showinfo("Éxito", 
+                                "Los registros han sido reasignados y el usuario ha sido eliminado.")
+                            seleccion.destroy()
+                            self.on_save()
+                            self.destroy()
+
+                        def failed(e):
+                            set_busy(seleccion, False, widgets=(btn_confirmar,))
+                            messagebox.showerror("Error", 
+                                f"Ha ocurrido un error al reasignar los registros: {str(e)}")
+
+                        set_busy(seleccion, True, widgets=(btn_confirmar,))
+                        run_in_background(seleccion, reasignar, on_done=done, on_error=failed)
             
-            # Si no tiene registros asociados, eliminar directamente
-            if messagebox.askyesno("Confirmar", "¿Eliminar usuario? Esta acción no se puede deshacer"):
-                try:
-                    db.query("DELETE FROM usuarios WHERE usuario_id=%s", (self.usuario_id,))
-                    self.on_save()
-                    self.destroy()
-                except Exception as e:
-                    messagebox.showerror("Error", f"No se pudo eliminar el usuario: {str(e)}")
+            btn_confirmar = ctk.CTkButton(frm, text="Confirmar Reasignación", command=confirmar_reasignacion)
+            btn_confirmar.pack(pady=10)
+            
+            btn_cancelar = ctk.CTkButton(frm, text="Cancelar", 
+                                    fg_color="gray", 
+                                    command=seleccion.destroy)
+            btn_cancelar.pack(pady=5)
+            
+            seleccion.transient(self)  # Hacer la ventana dependiente de la principal
+            seleccion.grab_set()  # Hacer la ventana modal
+            return
+        
+        # Si no tiene registros asociados, eliminar directamente
+        if messagebox.askyesno("Confirmar", "¿Eliminar usuario? Esta acción no se puede deshacer"):
+            def done(_):
+                self.on_save()
+                self.destroy()
+
+            def failed(e):
+                self._busy(False)
+                messagebox.showerror("Error", f"No se pudo eliminar el usuario: {str(e)}")
+
+            self._busy(True)
+            run_in_background(self, db.query, "DELETE FROM usuarios WHERE usuario_id=%s",
+                              (self.usuario_id,), on_done=done, on_error=failed)
 
 
 # ---------- Frame: Login ----------
@@ -2296,7 +2168,7 @@ class LoginFrame(ctk.CTkFrame):
         self.password.pack(pady=15)
 
         # Botón de inicio de sesión más grande y llamativo
-        btn = ctk.CTkButton(
+        self.login_btn = btn = ctk.CTkButton(
             form_container,
             text="Iniciar Sesión",
             width=400,
@@ -2308,7 +2180,7 @@ class LoginFrame(ctk.CTkFrame):
         btn.pack(pady=(25, 15))
 
         # Botón de usuario demo más elegante
-        create_btn = ctk.CTkButton(
+        self.create_btn = create_btn = ctk.CTkButton(
             form_container,
             text="Crear usuario de prueba",
             width=250,
@@ -2320,33 +2192,77 @@ class LoginFrame(ctk.CTkFrame):
         )
         create_btn.pack(pady=(10, 0))
 
+        # Estado de la verificación (bcrypt corre en un hilo del executor)
+        self.status_var = tk.StringVar(value="")
+        ctk.CTkLabel(form_container, textvariable=self.status_var, text_color="gray").pack(pady=(10, 0))
+
+    def _busy(self, busy, mensaje=""):
+        self.status_var.set(mensaje if busy else "")
+        set_busy(self.winfo_toplevel(), busy, widgets=(self.login_btn, self.create_btn))
+
+    def _failed(self, exc):
+        self._busy(False)
+        _default_async_error(exc)
+
     def attempt_login(self):
         email = self.email.get().strip()
         password = self.password.get().strip()
         if not email or not password:
             messagebox.showwarning("Validación", "Introduce correo y contraseña")
             return
-        row = db.fetchone("SELECT usuario_id, nombre, correo, rol, hashed_password FROM usuarios WHERE correo = %s", (email,))
-        if not row:
-            messagebox.showerror("Error", "Usuario no encontrado")
-            return
-        hashed_raw = row[4]
-        if not verify_password(password, hashed_raw):
-            messagebox.showerror("Error", "Contraseña incorrecta o formato de hash inválido")
-            return
-        self.controller.login(row)
+
+        def work():
+            row = db.fetchone("SELECT usuario_id, nombre, correo, rol, hashed_password FROM usuarios WHERE correo = %s", (email,))
+            if not row:
+                return "no_encontrado", None
+            hashed_raw = row[4]
+            if not verify_password(password, hashed_raw):
+                return "clave_invalida", None
+            # Costo distinto del configurado (o formato no canónico): rehacer el hash
+            if needs_rehash(hashed_raw):
+                try:
+                    db.query("UPDATE usuarios SET hashed_password=%s, updated_at=now() WHERE usuario_id=%s",
+                             (hash_password(password), row[0]))
+                except Exception as e:
+                    print("WARN: no se pudo actualizar el hash de contraseña:", e)
+            return "ok", row
+
+        def done(result):
+            self._busy(False)
+            status, row = result
+            if status == "no_encontrado":
+                messagebox.showerror("Error", "Usuario no encontrado")
+                return
+            if status == "clave_invalida":
+                messagebox.showerror("Error", "Contraseña incorrecta o formato de hash inválido")
+                return
+            self.controller.login(row)
+
+        self._busy(True, "Verificando credenciales…")
+        run_in_background(self, work, on_done=done, on_error=self._failed)
 
     def create_demo_user(self):
         # crea un usuario demo con contraseña 'demo123' si no existe
         demo_email = "admin@demo.com"
-        existing = db.fetchone("SELECT usuario_id FROM usuarios WHERE correo=%s", (demo_email,))
-        if existing:
-            messagebox.showinfo("Info", "Usuario demo ya existe")
-            return
-        hashed = hash_password("demo123")
-        db.query("INSERT INTO usuarios (nombre, correo, rol, hashed_password) VALUES (%s,%s,%s,%s)",
-                 ("Admin Demo", demo_email, "admin", hashed))
-        messagebox.showinfo("Creado", "Usuario demo creado. Correo: admin@demo.com Clave: demo123")
+
+        def work():
+            existing = db.fetchone("SELECT usuario_id FROM usuarios WHERE correo=%s", (demo_email,))
+            if existing:
+                return False
+            hashed = hash_password("demo123")
+            db.query("INSERT INTO usuarios (nombre, correo, rol, hashed_password) VALUES (%s,%s,%s,%s)",
+                     ("Admin Demo", demo_email, "admin", hashed))
+            return True
+
+        def done(created):
+            self._busy(False)
+            if not created:
+                messagebox.showinfo("Info", "Usuario demo ya existe")
+                return
+            messagebox.showinfo("Creado", "Usuario demo creado. Correo: admin@demo.com Clave: demo123")
+
+        self._busy(True, "Creando usuario de prueba…")
+        run_in_background(self, work, on_done=done, on_error=self._failed)
 
 # ---------- Frame: Main Menu ----------
 class MainMenuFrame(ctk.CTkFrame):
@@ -2398,15 +2314,164 @@ class MainMenuFrame(ctk.CTkFrame):
             btn_tratamientos = ctk.CTkButton(self.nav, text="Tratamientos", command=lambda: self.controller.show_frame("TratamientosFrame"))
             btn_tratamientos.grid(row=0, column=4, padx=8, pady=8)
             
+            btn_exportar = ctk.CTkButton(self.nav, text="Exportar", command=self.open_export_dialog)
+            btn_exportar.grid(row=0, column=5, padx=8, pady=8)
+
+            btn_tablero = ctk.CTkButton(self.nav, text="Tablero", command=lambda: self.controller.show_frame("DashboardFrame"))
+            btn_tablero.grid(row=0, column=6, padx=8, pady=8)
+
+            btn_cohortes = ctk.CTkButton(self.nav, text="Cohortes", command=lambda: self.controller.show_frame("CohortesFrame"))
+            btn_cohortes.grid(row=0, column=7, padx=8, pady=8)
+
             # Solo mostrar botón de Usuarios si es admin
             if user["rol"] == "admin":
                 btn_usuarios = ctk.CTkButton(self.nav, text="Usuarios", command=lambda: self.controller.show_frame("UsuariosFrame"))
-                btn_usuarios.grid(row=0, column=5, padx=8, pady=8)
+                btn_usuarios.grid(row=0, column=8, padx=8, pady=8)
+
+    def open_export_dialog(self):
+        dlg = ExportacionDialog(self)
+        dlg.grab_set()
 
     def logout(self):
         self.controller.current_user = None
         self.controller.show_frame("LoginFrame")
 
+# ---------- Diálogo: exportación a CSV/JSONL ----------
+class ExportacionDialog(tk.Toplevel):
+    """
+    Exporta una entidad (exportacion.EXPORTS) a un archivo gzip en segundo
+    plano. El hilo de trabajo solo actualiza self._progress; la barra se
+    refresca desde el hilo de Tk con after().
+    """
+    POLL_MS = 200
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Exportar datos")
+        self.geometry("460x360")
+        self.resizable(False, False)
+        self._cancel = threading.Event()
+        self._progress = (0, 0)
+        self._total = None
+        self._running = False
+
+        frm = ctk.CTkFrame(self)
+        frm.pack(fill="both", expand=True, padx=12, pady=12)
+
+        ctk.CTkLabel(frm, text="Datos", anchor="w").pack(fill="x", pady=(4,2))
+        self.entidad_var = tk.StringVar(value="diagnosticos")
+        ttk.Combobox(frm, textvariable=self.entidad_var, state="readonly",
+                     values=sorted(exportacion.EXPORTS)).pack(fill="x")
+
+        ctk.CTkLabel(frm, text="Formato", anchor="w").pack(fill="x", pady=(8,2))
+        self.formato_var = tk.StringVar(value="csv")
+        ttk.Combobox(frm, textvariable=self.formato_var, state="readonly",
+                     values=list(exportacion.FORMATS)).pack(fill="x")
+
+        fechas = ctk.CTkFrame(frm)
+        fechas.pack(fill="x", pady=(8,0))
+        self.desde = ctk.CTkEntry(fechas, placeholder_text="Desde (YYYY-MM-DD)")
+        self.desde.pack(side="left", fill="x", expand=True, padx=(0,4))
+        self.hasta = ctk.CTkEntry(fechas, placeholder_text="Hasta (YYYY-MM-DD)")
+        self.hasta.pack(side="left", fill="x", expand=True, padx=(4,0))
+
+        self.bar = ttk.Progressbar(frm, mode="determinate", maximum=100)
+        self.bar.pack(fill="x", pady=(16,4))
+        self.status_var = tk.StringVar(value="")
+        ctk.CTkLabel(frm, textvariable=self.status_var, anchor="w").pack(fill="x")
+
+        footer = ctk.CTkFrame(frm)
+        footer.pack(fill="x", side="bottom", pady=(12,0))
+        self.export_btn = ctk.CTkButton(footer, text="Exportar…", command=self.start)
+        self.export_btn.pack(side="right", padx=6)
+        self.cancel_btn = ctk.CTkButton(footer, text="Cerrar", fg_color="gray", command=self.on_cancel)
+        self.cancel_btn.pack(side="left", padx=6)
+        self.protocol("WM_DELETE_WINDOW", self.on_cancel)
+
+    def _parse_date(self, entry):
+        text = entry.get().strip()
+        if not text:
+            return None
+        datetime.strptime(text, "%Y-%m-%d")
+        return text
+
+    def start(self):
+        try:
+            desde, hasta = self._parse_date(self.desde), self._parse_date(self.hasta)
+        except ValueError:
+            messagebox.showwarning("Validación", "Las fechas deben tener formato YYYY-MM-DD")
+            return
+        entidad, fmt = self.entidad_var.get(), self.formato_var.get()
+        path = filedialog.asksaveasfilename(
+            parent=self, title="Guardar exportación",
+            initialfile=f"{entidad}_{datetime.now():%Y%m%d}.{fmt}.gz",
+            defaultextension=".gz", filetypes=[("Gzip", "*.gz"), ("Todos", "*.*")])
+        if not path:
+            return
+        self._cancel.clear()
+        self._progress, self._total, self._running = (0, 0), None, True
+        self.export_btn.configure(state="disabled")
+        self.cancel_btn.configure(text="Cancelar")
+        self.bar.configure(mode="indeterminate")
+        self.bar.start(15)
+        self.status_var.set("Contando filas…")
+        run_in_background(self, self._work, entidad, path, fmt, desde, hasta,
+                          on_done=self._finished, on_error=self._failed)
+        self.after(self.POLL_MS, self._poll)
+
+    def _work(self, entidad, path, fmt, desde, hasta):
+        # En el executor: nada de Tk aquí
+        self._total = exportacion.count_rows(db, entidad, desde, hasta)
+
+        def progress(rows, nbytes):
+            self._progress = (rows, nbytes)
+            if self._cancel.is_set():
+                raise exportacion.ExportCancelled()
+
+        return exportacion.export(db, entidad, path, fmt, desde, hasta, progress)
+
+    def _poll(self):
+        if not self._running:
+            return
+        rows, nbytes = self._progress
+        if self._total:
+            if str(self.bar.cget("mode")) != "determinate":
+                self.bar.stop()
+                self.bar.configure(mode="determinate")
+            # En CSV las filas son saltos de línea contados (pueden ser más que las reales)
+            rows = min(rows, self._total)
+            self.bar["value"] = rows * 100.0 / self._total
+            self.status_var.set(f"{rows} de {self._total} filas ({nbytes / 1e6:.1f} MB)")
+        self.after(self.POLL_MS, self._poll)
+
+    def _end(self):
+        self._running = False
+        self.bar.stop()
+        self.bar.configure(mode="determinate")
+        self.export_btn.configure(state="normal")
+        self.cancel_btn.configure(text="Cerrar")
+
+    def _finished(self, result):
+        self._end()
+        self.bar["value"] = 100
+        self.status_var.set(f"{result['filas']} filas exportadas en {result['segundos']} s")
+
+    def _failed(self, exc):
+        self._end()
+        self.bar["value"] = 0
+        if isinstance(exc, exportacion.ExportCancelled):
+            self.status_var.set("Exportación cancelada")
+            return
+        self.status_var.set("Error al exportar")
+        _default_async_error(exc)
+
+    def on_cancel(self):
+        if self._running:
+            self._cancel.set()
+            self.status_var.set("Cancelando…")
+        else:
+            self.destroy()
+
 # ---------- Frame: Pacientes CRUD ----------
 class PacientesFrame(ctk.CTkFrame):
     def __init__(self, parent, controller):
@@ -2434,6 +2499,8 @@ class PacientesFrame(ctk.CTkFrame):
         btn_add.pack(side="right", padx=8)
 
         cols = ("paciente_id", "numero_identificacion", "nombre", "fecha_nacimiento", "sexo", "telefono")
+        filter_slot = ctk.CTkFrame(self, fg_color="transparent")
+        filter_slot.pack(fill="x", padx=10)
         container = ctk.CTkFrame(self)
         container.pack(fill="both", expand=True, padx=10, pady=10)
 
@@ -2450,15 +2517,34 @@ class PacientesFrame(ctk.CTkFrame):
         # doble click para editar mi loco
         self.tree.bind("<Double-1>", self.on_edit)
 
+        # Paginación keyset con orden y filtros en el servidor
+        source = KeysetSource(
+            db,
+            [
+                Column("paciente_id", "paciente_id"),
+                Column("numero_identificacion", "numero_identificacion", null_as="''", text=True),
+                Column("nombre", "nombre", text=True),
+                Column("fecha_nacimiento", "fecha_nacimiento", null_as="'-infinity'::date"),
+                Column("sexo", "sexo", null_as="''", text=True),
+                Column("telefono", "telefono", null_as="''", text=True),
+            ],
+            "pacientes",
+            pk="paciente_id",
+            default_sort="nombre",
+            table="pacientes",
+            changed_at=("updated_at",),
+        )
+        self.pager = PagedTree(self.tree, vsb, source)
+        self.pager.build_filter_bar(filter_slot).pack(fill="x", pady=(0, 4))
+
     def on_show(self):
         self.refresh()
 
+    def on_hide(self):
+        self.pager.cancel()
+
     def refresh(self):
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-        rows = db.fetchall("SELECT paciente_id, numero_identificacion, nombre, fecha_nacimiento, sexo, telefono FROM pacientes ORDER BY nombre")
-        for r in rows:
-            self.tree.insert("", "end", values=r)
+        self.pager.refresh()
 
     def open_add_dialog(self):
         dlg = PacienteDialog(self, None, self.refresh)
@@ -2503,19 +2589,35 @@ class PacienteDialog(tk.Toplevel):
 
         footer = ctk.CTkFrame(frm)
         footer.pack(fill="x", pady=(12,0))
-        save_btn = ctk.CTkButton(footer, text="Guardar", command=self.save)
-        save_btn.pack(side="right", padx=6)
-        del_btn = ctk.CTkButton(footer, text="Eliminar", fg_color="red", command=self.delete)
-        del_btn.pack(side="left", padx=6)
+        self.save_btn = ctk.CTkButton(footer, text="Guardar", command=self.save)
+        self.save_btn.pack(side="right", padx=6)
+        self.del_btn = ctk.CTkButton(footer, text="Eliminar", fg_color="red", command=self.delete)
+        self.del_btn.pack(side="left", padx=6)
 
         if paciente_id:
             self.load()
 
+    def _busy(self, busy):
+        set_busy(self, busy, widgets=(self.save_btn, self.del_btn))
+
+    def _failed(self, exc):
+        self._busy(False)
+        _default_async_error(exc)
+
+    def _done(self, _=None):
+        self.on_save()
+        self.destroy()
+
     def load(self):
-        r = db.fetchone("SELECT numero_identificacion, nombre, fecha_nacimiento, sexo, direccion, telefono FROM pacientes WHERE paciente_id=%s", (self.paciente_id,))
+        self._busy(True)
+        run_in_background(self, cargadores.paciente, db, self.paciente_id,
+                          on_done=self._fill, on_error=self._failed)
+
+    def _fill(self, r):
+        self._busy(False)
         if r:
-            keys = ["numero_identificacion","nombre","fecha_nacimiento","sexo","direccion","telefono"]
-            for k,v in zip(keys, r):
+            for k in self.entries:
+                v = r[k]
                 if v is None:
                     v = ""
                 self.entries[k].insert(0, str(v))
@@ -2526,26 +2628,22 @@ class PacienteDialog(tk.Toplevel):
             messagebox.showwarning("Validación", "El nombre es obligatorio")
             return
         if self.paciente_id:
-            db.query(
-                "UPDATE pacientes SET numero_identificacion=%s, nombre=%s, fecha_nacimiento=%s, sexo=%s, direccion=%s, telefono=%s, updated_at=now() WHERE paciente_id=%s",
-                (data["numero_identificacion"] or None, data["nombre"], data["fecha_nacimiento"] or None, data["sexo"] or None, data["direccion"] or None, data["telefono"] or None, self.paciente_id)
-            )
+            sql = "UPDATE pacientes SET numero_identificacion=%s, nombre=%s, fecha_nacimiento=%s, sexo=%s, direccion=%s, telefono=%s, updated_at=now() WHERE paciente_id=%s"
+            params = (data["numero_identificacion"] or None, data["nombre"], data["fecha_nacimiento"] or None, data["sexo"] or None, data["direccion"] or None, data["telefono"] or None, self.paciente_id)
         else:
-            db.query(
-                "INSERT INTO pacientes (numero_identificacion, nombre, fecha_nacimiento, sexo, direccion, telefono) VALUES (%s,%s,%s,%s,%s,%s)",
-                (data["numero_identificacion"] or None, data["nombre"], data["fecha_nacimiento"] or None, data["sexo"] or None, data["direccion"] or None, data["telefono"] or None)
-            )
-        self.on_save()
-        self.destroy()
+            sql = "INSERT INTO pacientes (numero_identificacion, nombre, fecha_nacimiento, sexo, direccion, telefono) VALUES (%s,%s,%s,%s,%s,%s)"
+            params = (data["numero_identificacion"] or None, data["nombre"], data["fecha_nacimiento"] or None, data["sexo"] or None, data["direccion"] or None, data["telefono"] or None)
+        self._busy(True)
+        run_in_background(self, db.query, sql, params, on_done=self._done, on_error=self._failed)
 
     def delete(self):
         if not self.paciente_id:
             messagebox.showwarning("Info", "No hay paciente a eliminar")
             return
         if messagebox.askyesno("Confirmar", "Eliminar paciente? Esto es irreversible"):
-            db.query("DELETE FROM pacientes WHERE paciente_id=%s", (self.paciente_id,))
-            self.on_save()
-            self.destroy()
+            self._busy(True)
+            run_in_background(self, db.query, "DELETE FROM pacientes WHERE paciente_id=%s",
+                              (self.paciente_id,), on_done=self._done, on_error=self._failed)
 
 
     
@@ -2565,7 +2663,10 @@ class CatalogosFrame(ctk.CTkFrame):
         self.tabs.pack(fill="both", expand=True, padx=12, pady=12)
 
         self.views = {}
+        self.fillers = {}
         self.tab_frames = {}
+        # Versión del catálogo cargada en cada pestaña (ver CatalogStore.version)
+        self._loaded_versions = {}
         
         # Configuración de cada catálogo
         catalogo_config = [
@@ -2612,18 +2713,33 @@ class CatalogosFrame(ctk.CTkFrame):
             tree.bind("<Double-1>", lambda e, t=table: self.on_edit(e, t))
             
             self.views[table] = tree
+            self.fillers[table] = TreeFiller(tree)
     
     def on_show(self):
-        self.refresh_all_tabs()
+        # Solo recargar pestañas cuyo catálogo cambió desde la última carga
+        for table in self.views:
+            if self._loaded_versions.get(table) != catalog_store.version(table):
+                self.refresh_tab(table)
 
     def refresh_all_tabs(self):
         for table in self.views:
             self.refresh_tab(table)
     
+    def on_hide(self):
+        # Lo que quede a medio cargar se vuelve a pedir en el próximo on_show
+        for table, filler in self.fillers.items():
+            filler.cancel()
+            discard_background((id(self), table))
+
     def refresh_tab(self, table):
-        tree = self.views[table]
-        for i in tree.get_children():
-            tree.delete(i)
+        self._loaded_versions.pop(table, None)
+        version = catalog_store.version(table)
+        filler = self.fillers[table]
+        filler.clear()
+
+        def done(rows):
+            # La versión solo se registra cuando la pestaña quedó completa
+            filler.load(rows, on_done=lambda: self._loaded_versions.__setitem__(table, version))
             
         # Consultas específicas para cada tabla
         queries = {
@@ -2636,9 +2752,8 @@ class CatalogosFrame(ctk.CTkFrame):
         
         sql = queries.get(table)
         if sql:
-            rows = db.fetchall(sql)
-            for r in rows:
-                tree.insert("", "end", values=r)
+            # Una clave por pestaña: si se recarga dos veces seguidas solo se pinta la última
+            run_in_background(self, db.fetchall, sql, on_done=done, key=(id(self), table))
 
     def open_add_dialog(self, table):
         dlg = CatalogoDialog(self, table, None, self.refresh_tab)
@@ -2718,34 +2833,37 @@ class CatalogoDialog(tk.Toplevel):
         footer = ctk.CTkFrame(parent)
         footer.pack(fill="x", pady=(20,0))
         
-        save_btn = ctk.CTkButton(footer, text="Guardar", command=self.save)
-        save_btn.pack(side="right", padx=6)
+        self.save_btn = ctk.CTkButton(footer, text="Guardar", command=self.save)
+        self.save_btn.pack(side="right", padx=6)
+        self.buttons = [self.save_btn]
         
         if self.item_id:
             del_btn = ctk.CTkButton(footer, text="Eliminar", fg_color="red", command=self.delete)
             del_btn.pack(side="right", padx=6)
+            self.buttons.append(del_btn)
 
         # Espaciador
         ctk.CTkLabel(parent, text="").pack(pady=10)
 
+    def _busy(self, busy):
+        set_busy(self, busy, widgets=self.buttons)
+
+    def _failed(self, exc):
+        self._busy(False)
+        _default_async_error(exc)
+
     def load(self):
-        # Consulta específica para cada tabla
-        id_column = self.get_id_column()
-        sql = f"SELECT * FROM {self.table} WHERE {id_column} = %s"
-        row = db.fetchone(sql, (self.item_id,))
-        
+        # Solo las columnas del formulario de cada tabla
+        self._busy(True)
+        run_in_background(self, cargadores.catalogo_item, db, self.table, self.item_id,
+                          on_done=self._fill, on_error=self._failed)
+
+    def _fill(self, row):
+        self._busy(False)
         if row:
-            # Mapear campos según la tabla
-            if self.table == "enfermedades":
-                self.entries["codigo_icd"].insert(0, row[1] or "")
-                self.entries["nombre"].insert(0, row[2] or "")
-                if len(row) > 3 and row[3] is not None:  # gravedad
-                    self.entries["gravedad"].insert(0, str(row[3]))
-            elif self.table == "pruebas_lab_catalogo":
-                self.entries["codigo"].insert(0, row[1] or "")
-                self.entries["nombre"].insert(0, row[2] or "")
-            else:
-                self.entries["nombre"].insert(0, row[1] or "")
+            for key, ent in self.entries.items():
+                if row.get(key) is not None:
+                    ent.insert(0, str(row[key]))
 
     def get_id_column(self):
         # Obtener el nombre de la columna ID para cada tabla
@@ -2786,10 +2904,10 @@ class CatalogoDialog(tk.Toplevel):
             )
             if self.item_id:
                 sql = "UPDATE enfermedades SET codigo_icd=%s, nombre=%s, gravedad=%s WHERE enfermedad_id=%s"
-                db.query(sql, data + (self.item_id,))
+                params = data + (self.item_id,)
             else:
                 sql = "INSERT INTO enfermedades (codigo_icd, nombre, gravedad) VALUES (%s, %s, %s)"
-                db.query(sql, data)
+                params = data
                 
         elif self.table == "pruebas_lab_catalogo":
             data = (
@@ -2798,23 +2916,30 @@ class CatalogoDialog(tk.Toplevel):
             )
             if self.item_id:
                 sql = "UPDATE pruebas_lab_catalogo SET codigo=%s, nombre=%s WHERE prueba_lab_id=%s"
-                db.query(sql, data + (self.item_id,))
+                params = data + (self.item_id,)
             else:
                 sql = "INSERT INTO pruebas_lab_catalogo (codigo, nombre) VALUES (%s, %s)"
-                db.query(sql, data)
+                params = data
                 
         else:  # signos_catalogo, sintomas_catalogo, pruebas_post_catalogo
             data = (self.entries["nombre"].get().strip(),)
             if self.item_id:
                 sql = f"UPDATE {self.table} SET nombre=%s WHERE {self.get_id_column()}=%s"
-                db.query(sql, data + (self.item_id,))
+                params = data + (self.item_id,)
             else:
                 sql = f"INSERT INTO {self.table} (nombre) VALUES (%s)"
-                db.query(sql, data)
+                params = data
 
-        self.on_save(self.table)
-        messagebox.showinfo("Éxito", f"{self.get_table_title()} guardado correctamente")
-        self.destroy()
+        def done(_):
+            catalog_store.invalidate(self.table)
+            if self.table in ("enfermedades", "pruebas_lab_catalogo"):
+                recommendation_cache.invalidate()
+            self.on_save(self.table)
+            messagebox.showinfo("Éxito", f"{self.get_table_title()} guardado correctamente")
+            self.destroy()
+
+        self._busy(True)
+        run_in_background(self, db.query, sql, params, on_done=done, on_error=self._failed)
 
     def delete(self):
         if not self.item_id:
@@ -2824,9 +2949,163 @@ class CatalogoDialog(tk.Toplevel):
         if messagebox.askyesno("Confirmar", f"¿Eliminar {self.get_table_title().lower()}? Esta acción no se puede deshacer"):
             id_column = self.get_id_column()
             sql = f"DELETE FROM {self.table} WHERE {id_column}=%s"
-            db.query(sql, (self.item_id,))
-            self.on_save(self.table)
-            self.destroy()
+
+            def done(_):
+                catalog_store.invalidate(self.table)
+                if self.table in ("enfermedades", "pruebas_lab_catalogo"):
+                    recommendation_cache.invalidate()
+                self.on_save(self.table)
+                self.destroy()
+
+            self._busy(True)
+            run_in_background(self, db.query, sql, (self.item_id,), on_done=done, on_error=self._failed)
+
+# ---------- Búsqueda de pacientes mientras se escribe ----------
+PACIENTE_SEARCH_LIMIT = 20
+
+def search_pacientes_ranked(conn_db, q, limit=PACIENTE_SEARCH_LIMIT):
+    """
+    Pacientes que coinciden con `q`, mejor coincidencia primero:
+    id exacto > prefijo de numero_identificacion > similitud trigram del nombre.
+    Usa los índices idx_pacientes_nombre_trgm e idx_pacientes_numero_id_prefijo.
+    """
+    q = q.strip()
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    pid = int(q) if q.isdigit() and len(q) < 10 else None
+    sql = """
+    SELECT paciente_id, nombre, fecha_nacimiento
+    FROM (
+        SELECT paciente_id, nombre, fecha_nacimiento,
+               CASE WHEN paciente_id = %(pid)s THEN 3 ELSE 0 END
+             + CASE WHEN lower(numero_identificacion) LIKE %(prefix)s THEN 2 ELSE 0 END
+             + similarity(nombre, %(q)s) AS score
+        FROM pacientes
+        WHERE nombre %% %(q)s
+           OR nombre ILIKE %(contains)s
+           OR lower(numero_identificacion) LIKE %(prefix)s
+           OR paciente_id = %(pid)s
+    ) candidatos
+    ORDER BY score DESC, nombre
+    LIMIT %(limit)s
+    """
+    return conn_db.fetchall(sql, {
+        "q": q,
+        "pid": pid,
+        "prefix": escaped.lower() + "%",
+        "contains": f"%{escaped}%",
+        "limit": int(limit),
+    })
+
+
+class TypeAheadSearch:
+    """
+    Búsqueda mientras se escribe. Espera DEBOUNCE_MS sin teclear, ejecuta la
+    consulta en un hilo con conexión propia y, si llega un texto nuevo,
+    cancela la consulta en curso en el servidor. Solo se entrega a la UI el
+    resultado de la petición más reciente.
+    """
+    DEBOUNCE_MS = 250
+    POLL_MS = 30
+
+    def __init__(self, widget, search_fn, on_results, on_error=None):
+        self.widget = widget
+        self.search_fn = search_fn
+        self.on_results = on_results
+        self.on_error = on_error
+        # Conexión dedicada: cancelar no afecta a las consultas de la UI
+        self.db = DB(DB_CONFIG, stats=db.stats)
+        self._gen = 0
+        self._after_id = None
+        self._pending = None       # (gen, texto) esperando al hilo
+        self._running_gen = None   # gen de la consulta en ejecución
+        self._running_conn = None  # conexión del hilo de búsqueda (para cancelar)
+        self._result = None        # (gen, filas, error)
+        self._polling = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def schedule(self, text):
+        """Llamar en cada pulsación: reinicia el temporizador de debounce."""
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+        self._after_id = self.widget.after(self.DEBOUNCE_MS, lambda: self.submit(text))
+
+    def submit(self, text):
+        self._after_id = None
+        with self._cond:
+            self._gen += 1
+            self._pending = (self._gen, text)
+            if self._running_gen is not None:
+                self._cancel_running()
+            self._cond.notify()
+        self._start_polling()
+
+    def invalidate(self):
+        """Descarta cualquier resultado pendiente (p. ej. al limpiar el campo)."""
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+        with self._cond:
+            self._gen += 1
+            self._pending = None
+            if self._running_gen is not None:
+                self._cancel_running()
+
+    def _cancel_running(self):
+        conn = self._running_conn
+        try:
+            if conn is not None and not conn.closed:
+                conn.cancel()
+        except Exception:
+            pass
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                gen, text = self._pending
+                self._pending = None
+                self._running_gen = gen
+            rows, error = None, None
+            try:
+                # La conexión es local a este hilo; se publica para poder cancelarla
+                conn = self.db.connect()
+                with self._cond:
+                    self._running_conn = conn
+                    stale = gen != self._gen
+                if not stale:
+                    rows = self.search_fn(self.db, text)
+            except Exception as e:
+                error = e
+            with self._cond:
+                self._running_gen = None
+                self._running_conn = None
+                if gen == self._gen:
+                    self._result = (gen, rows, error)
+
+    def _start_polling(self):
+        if not self._polling:
+            self._polling = True
+            self.widget.after(self.POLL_MS, self._poll)
+
+    def _poll(self):
+        with self._cond:
+            result, self._result = self._result, None
+            busy = self._pending is not None or self._running_gen is not None
+        if result is not None:
+            gen, rows, error = result
+            if gen == self._gen:
+                if error is None:
+                    self.on_results(rows)
+                elif self.on_error:
+                    self.on_error(error)
+        if busy or self._result is not None:
+            self.widget.after(self.POLL_MS, self._poll)
+        else:
+            self._polling = False
+
 
 # ---------- Frame: Encuentros, Diagnósticos y Tratamientos (esqueleto) ----------
 class EncuentrosFrame(ctk.CTkFrame):
@@ -2846,6 +3125,14 @@ class EncuentrosFrame(ctk.CTkFrame):
         btn_search = ctk.CTkButton(search_frame, text="Buscar", command=self.search_pacientes)
         btn_search.pack(side="left")
 
+        # Resultados mientras se escribe
+        self.type_ahead = TypeAheadSearch(
+            self, search_pacientes_ranked, self.show_pacientes,
+            on_error=lambda e: print("WARN: búsqueda de pacientes:", e)
+        )
+        self.paciente_search.bind("<KeyRelease>", self.on_search_key)
+        self.paciente_search.bind("<Return>", lambda e: self.search_pacientes())
+
         # Lista resultados pacientes
         self.pac_tree = ttk.Treeview(self, columns=("paciente_id","nombre","fecha_nacimiento"), show="headings", height=6)
         for c in ("paciente_id","nombre","fecha_nacimiento"):
@@ -2860,6 +3147,8 @@ class EncuentrosFrame(ctk.CTkFrame):
             self.enc_tree.heading(c, text=c)
             self.enc_tree.column(c, width=220)
         self.enc_tree.pack(fill="both", expand=True, padx=12, pady=6)
+        self.pac_filler = TreeFiller(self.pac_tree)
+        self.enc_filler = TreeFiller(self.enc_tree)
 
         btn_frame = ctk.CTkFrame(self)
         btn_frame.pack(fill="x", padx=12, pady=6)
@@ -2869,25 +3158,35 @@ class EncuentrosFrame(ctk.CTkFrame):
 
     def on_show(self):
         # limpiar
-        for i in self.pac_tree.get_children():
-            self.pac_tree.delete(i)
-        for i in self.enc_tree.get_children():
-            self.enc_tree.delete(i)
+        self.pac_filler.clear()
+        self.enc_filler.clear()
+
+    def on_hide(self):
+        self.type_ahead.invalidate()
+        discard_background((id(self), "encuentros"))
+        self.pac_filler.cancel()
+        self.enc_filler.cancel()
+
+    def on_search_key(self, event):
+        if event.keysym in ("Return", "KP_Enter"):
+            return
+        q = self.paciente_search.get().strip()
+        # Con menos de 2 letras el trigram no discrimina; un dígito basta para ids
+        if len(q) < 2 and not q.isdigit():
+            self.type_ahead.invalidate()
+            self.show_pacientes([])
+            return
+        self.type_ahead.schedule(q)
 
     def search_pacientes(self):
         q = self.paciente_search.get().strip()
         if not q:
             messagebox.showwarning("Validación", "Escribe nombre o id para buscar")
             return
-        try:
-            pid = int(q)
-            rows = db.fetchall("SELECT paciente_id, nombre, fecha_nacimiento FROM pacientes WHERE paciente_id=%s", (pid,))
-        except ValueError:
-            rows = db.fetchall("SELECT paciente_id, nombre, fecha_nacimiento FROM pacientes WHERE nombre ILIKE %s ORDER BY nombre", (f"%{q}%",))
-        for i in self.pac_tree.get_children():
-            self.pac_tree.delete(i)
-        for r in rows:
-            self.pac_tree.insert("", "end", values=r)
+        self.type_ahead.submit(q)
+
+    def show_pacientes(self, rows):
+        self.pac_filler.load(rows)
 
     def on_paciente_select(self, event):
         sel = self.pac_tree.selection()
@@ -2895,11 +3194,14 @@ class EncuentrosFrame(ctk.CTkFrame):
             return
         paciente_id = self.pac_tree.item(sel[0], "values")[0]
         # cargar encuentros del paciente
-        for i in self.enc_tree.get_children():
-            self.enc_tree.delete(i)
-        rows = db.fetchall("SELECT encuentro_id, fecha, tipo_encuentro, motivo FROM encuentros WHERE paciente_id=%s ORDER BY fecha DESC", (paciente_id,))
-        for r in rows:
-            self.enc_tree.insert("", "end", values=r)
+        self.enc_filler.clear()
+
+        # Si se cambia de paciente antes de que llegue la respuesta, se descarta
+        run_in_background(
+            self, db.fetchall,
+            "SELECT encuentro_id, fecha, tipo_encuentro, motivo FROM encuentros WHERE paciente_id=%s ORDER BY fecha DESC",
+            (paciente_id,), on_done=self.enc_filler.load, key=(id(self), "encuentros")
+        )
 
     def create_encuentro(self):
         sel = self.pac_tree.selection()
@@ -2950,8 +3252,16 @@ class EncuentroDialog(tk.Toplevel):
         self.motivo = ctk.CTkTextbox(frm, height=120)
         self.motivo.pack(fill="both", pady=6, expand=True)
 
-        btn = ctk.CTkButton(frm, text="Crear", command=self.create)
-        btn.pack(pady=8)
+        self.btn = ctk.CTkButton(frm, text="Crear", command=self.create)
+        self.btn.pack(pady=8)
+
+    def _done(self, _=None):
+        self.on_save()
+        self.destroy()
+
+    def _failed(self, exc):
+        set_busy(self, False, widgets=(self.btn,))
+        _default_async_error(exc)
 
     def create(self):
         tipo = self.tipo.get().strip()
@@ -2961,12 +3271,13 @@ class EncuentroDialog(tk.Toplevel):
             return
         # created_by del usuario actual
         created_by = self.master.controller.current_user["usuario_id"]
-        db.query(
+        set_busy(self, True, widgets=(self.btn,))
+        run_in_background(
+            self, db.query,
             "INSERT INTO encuentros (paciente_id, tipo_encuentro, motivo, created_by) VALUES (%s,%s,%s,%s)",
-            (self.paciente_id, tipo, motivo or None, created_by)
+            (self.paciente_id, tipo, motivo or None, created_by),
+            on_done=self._done, on_error=self._failed
         )
-        self.on_save()
-        self.destroy()
 
 class ObservacionSignoDialog(tk.Toplevel):
     def __init__(self, parent, encuentro_id, on_save):
@@ -2979,12 +3290,10 @@ class ObservacionSignoDialog(tk.Toplevel):
         frm = ctk.CTkFrame(self)
         frm.pack(fill="both", expand=True, padx=12, pady=12)
 
-        # cargar signos
-        signos = db.fetchall("SELECT signo_id, nombre FROM signos_catalogo ORDER BY nombre")
-        self.signos_map = {f"{s[1]}": s[0] for s in signos}
+        self.signos_map = {}
 
         ctk.CTkLabel(frm, text="Signo").pack(anchor="w")
-        self.signo_cb = ttk.Combobox(frm, values=list(self.signos_map.keys()))
+        self.signo_cb = ttk.Combobox(frm, values=())
         self.signo_cb.pack(fill="x", pady=6)
 
         ctk.CTkLabel(frm, text="Valor (texto)").pack(anchor="w")
@@ -2999,15 +3308,37 @@ class ObservacionSignoDialog(tk.Toplevel):
         self.unidad = ctk.CTkEntry(frm)
         self.unidad.pack(fill="x", pady=6)
 
-        btn = ctk.CTkButton(frm, text="Guardar", command=self.save)
-        btn.pack(pady=8)
+        self.btn = ctk.CTkButton(frm, text="Guardar", command=self.save)
+        self.btn.pack(pady=8)
+
+        # Signos desde el catálogo en memoria; si fue invalidado se recarga
+        # en segundo plano (Guardar queda deshabilitado mientras tanto)
+        set_busy(self, True, widgets=(self.btn,))
+        run_in_background(self, catalog_store.get, "signos_catalogo",
+                          on_done=self._set_signos, on_error=self._failed)
+
+    def _set_signos(self, signos):
+        set_busy(self, False, widgets=(self.btn,))
+        self.signos_map = signos.by_name
+        self.signo_cb['values'] = signos.names
+
+    def _done(self, _=None):
+        self.on_save()
+        self.destroy()
+
+    def _failed(self, exc):
+        set_busy(self, False, widgets=(self.btn,))
+        _default_async_error(exc)
 
     def save(self):
         sel = self.signo_cb.get()
         if not sel:
             messagebox.showwarning("Validación", "Selecciona un signo")
             return
-        signo_id = self.signos_map[sel]
+        signo_id = self.signos_map.get(sel)
+        if signo_id is None:
+            messagebox.showwarning("Validación", "El signo no está en el catálogo")
+            return
         valor_texto = self.valor_texto.get().strip() or None
         valor_num = self.valor_num.get().strip() or None
         if valor_num:
@@ -3018,12 +3349,13 @@ class ObservacionSignoDialog(tk.Toplevel):
                 return
         unidad = self.unidad.get().strip() or None
         recorded_by = self.master.controller.current_user["usuario_id"]
-        db.query(
+        set_busy(self, True, widgets=(self.btn,))
+        run_in_background(
+            self, db.query,
             "INSERT INTO observacion_signos (encuentro_id, signo_id, valor_texto, valor_numerico, unidad, recorded_by) VALUES (%s,%s,%s,%s,%s,%s)",
-            (self.encuentro_id, signo_id, valor_texto, valor_num, unidad, recorded_by)
+            (self.encuentro_id, signo_id, valor_texto, valor_num, unidad, recorded_by),
+            on_done=self._done, on_error=self._failed
         )
-        self.on_save()
-        self.destroy()
 
 class ObservacionSintomaDialog(tk.Toplevel):
     def __init__(self, parent, encuentro_id, on_save):
@@ -3036,11 +3368,10 @@ class ObservacionSintomaDialog(tk.Toplevel):
         frm = ctk.CTkFrame(self)
         frm.pack(fill="both", expand=True, padx=12, pady=12)
 
-        sintomas = db.fetchall("SELECT sintoma_id, nombre FROM sintomas_catalogo ORDER BY nombre")
-        self.sintomas_map = {f"{s[1]}": s[0] for s in sintomas}
+        self.sintomas_map = {}
 
         ctk.CTkLabel(frm, text="Síntoma").pack(anchor="w")
-        self.sintoma_cb = ttk.Combobox(frm, values=list(self.sintomas_map.keys()))
+        self.sintoma_cb = ttk.Combobox(frm, values=())
         self.sintoma_cb.pack(fill="x", pady=6)
 
         ctk.CTkLabel(frm, text="Severidad (1-5)").pack(anchor="w")
@@ -3055,15 +3386,35 @@ class ObservacionSintomaDialog(tk.Toplevel):
         self.notas = ctk.CTkTextbox(frm, height=120)
         self.notas.pack(fill="both", pady=6, expand=True)
 
-        btn = ctk.CTkButton(frm, text="Guardar", command=self.save)
-        btn.pack(pady=8)
+        self.btn = ctk.CTkButton(frm, text="Guardar", command=self.save)
+        self.btn.pack(pady=8)
+
+        set_busy(self, True, widgets=(self.btn,))
+        run_in_background(self, catalog_store.get, "sintomas_catalogo",
+                          on_done=self._set_sintomas, on_error=self._failed)
+
+    def _set_sintomas(self, sintomas):
+        set_busy(self, False, widgets=(self.btn,))
+        self.sintomas_map = sintomas.by_name
+        self.sintoma_cb['values'] = sintomas.names
+
+    def _done(self, _=None):
+        self.on_save()
+        self.destroy()
+
+    def _failed(self, exc):
+        set_busy(self, False, widgets=(self.btn,))
+        _default_async_error(exc)
 
     def save(self):
         sel = self.sintoma_cb.get()
         if not sel:
             messagebox.showwarning("Validación", "Selecciona un síntoma")
             return
-        sintoma_id = self.sintomas_map[sel]
+        sintoma_id = self.sintomas_map.get(sel)
+        if sintoma_id is None:
+            messagebox.showwarning("Validación", "El síntoma no está en el catálogo")
+            return
         try:
             sev = int(self.severidad.get().strip()) if self.severidad.get().strip() else None
         except ValueError:
@@ -3072,14 +3423,263 @@ class ObservacionSintomaDialog(tk.Toplevel):
         inicio_fecha = self.inicio.get().strip() or None
         notas = self.notas.get("1.0", "end").strip() or None
         recorded_by = self.master.controller.current_user["usuario_id"]
-        db.query(
+        set_busy(self, True, widgets=(self.btn,))
+        run_in_background(
+            self, db.query,
             "INSERT INTO observacion_sintomas (encuentro_id, sintoma_id, severidad, inicio_fecha, notas, recorded_by) VALUES (%s,%s,%s,%s,%s,%s)",
-            (self.encuentro_id, sintoma_id, sev, inicio_fecha, notas, recorded_by)
+            (self.encuentro_id, sintoma_id, sev, inicio_fecha, notas, recorded_by),
+            on_done=self._done, on_error=self._failed
         )
-        self.on_save()
-        self.destroy()
+
+# ---------- Frame: Tablero ----------
+class DashboardFrame(ctk.CTkFrame):
+    """
+    Resumen de actividad. Solo lee los agregados de analitica.py; al
+    mostrarse los refresca de forma incremental (semanas con cambios).
+    """
+    PANELS = (
+        ("por_enfermedad", "Diagnósticos por enfermedad", ("Enfermedad", "Total")),
+        ("por_medico", "Diagnósticos por médico", ("Médico", "Total")),
+        ("por_semana", "Diagnósticos por semana", ("Semana", "Total")),
+        ("tratamientos_estado", "Tratamientos por estado", ("Estado", "Total")),
+        ("hallazgos", "Hallazgos más frecuentes", ("Tipo", "Hallazgo", "Total")),
+    )
+    WEEKS = ("4", "12", "26", "52")
+
+    def __init__(self, parent, controller):
+        super().__init__(parent)
+        self.controller = controller
+
+        top = ctk.CTkFrame(self)
+        top.pack(fill="x", pady=(8,6))
+        back_btn = ctk.CTkButton(top, text="Volver", command=lambda: controller.show_frame("MainMenuFrame"))
+        back_btn.pack(side="left", padx=8)
+
+        ctk.CTkLabel(top, text="Últimas semanas:").pack(side="left", padx=(16, 4))
+        self.weeks_var = tk.StringVar(value="12")
+        weeks_cb = ttk.Combobox(top, textvariable=self.weeks_var, values=self.WEEKS, state="readonly", width=5)
+        weeks_cb.pack(side="left")
+        weeks_cb.bind("<<ComboboxSelected>>", lambda e: self.load(refresh=False))
+
+        self.btn_refresh = ctk.CTkButton(top, text="Actualizar", command=self.load)
+        self.btn_refresh.pack(side="right", padx=8)
+        self.status_var = tk.StringVar(value="")
+        ctk.CTkLabel(top, textvariable=self.status_var, anchor="e").pack(side="right", padx=8)
+
+        grid = ctk.CTkFrame(self)
+        grid.pack(fill="both", expand=True, padx=10, pady=10)
+        self.trees = {}
+        for i, (name, title, headings) in enumerate(self.PANELS):
+            box = ctk.CTkFrame(grid)
+            box.grid(row=i // 3, column=i % 3, sticky="nsew", padx=6, pady=6)
+            ctk.CTkLabel(box, text=title, anchor="w").pack(fill="x", padx=6, pady=(4, 0))
+            cols = tuple(f"c{j}" for j in range(len(headings)))
+            tree = ttk.Treeview(box, columns=cols, show="headings", height=10)
+            for c, h in zip(cols, headings):
+                tree.heading(c, text=h)
+                tree.column(c, width=80 if h == "Total" else 160, anchor="e" if h == "Total" else "w")
+            tree.pack(fill="both", expand=True, padx=6, pady=6)
+            self.trees[name] = tree
+        for c in range(3):
+            grid.grid_columnconfigure(c, weight=1)
+        for r in range(2):
+            grid.grid_rowconfigure(r, weight=1)
+
+    def on_show(self):
+        self.load()
+
+    def on_hide(self):
+        discard_background((id(self), "tablero"))
+
+    def load(self, refresh=True):
+        weeks = int(self.weeks_var.get() or 12)
+
+        def work():
+            t0 = time.perf_counter()
+            if refresh:
+                analitica.refresh(db)
+            data = analitica.dashboard(db, weeks=weeks)
+            return data, (time.perf_counter() - t0) * 1000.0
+
+        def done(result):
+            data, ms = result
+            self.btn_refresh.configure(state="normal")
+            for name, tree in self.trees.items():
+                tree.delete(*tree.get_children())
+                for row in data.get(name, []):
+                    tree.insert("", "end", values=[str(v) for v in row])
+            self.status_var.set(f"Actualizado {datetime.now():%H:%M:%S} ({ms:.0f} ms)")
+
+        def failed(exc):
+            self.btn_refresh.configure(state="normal")
+            self.status_var.set("")
+            _default_async_error(exc)
+
+        self.btn_refresh.configure(state="disabled")
+        self.status_var.set("Cargando…")
+        run_in_background(self, work, on_done=done, on_error=failed, key=(id(self), "tablero"))
+
+# ---------- Frame: Cohortes ----------
+class CohortesFrame(ctk.CTkFrame):
+    """
+    Pacientes con encuentros que cumplen una expresión de evidencia
+    (cohortes.py), p. ej. "fiebre Y tos Y NO disnea".
+    Se pagina por paciente; "Más" trae la página siguiente.
+    """
+    PAGE_SIZE = 100
+
+    def __init__(self, parent, controller):
+        super().__init__(parent)
+        self.controller = controller
+        self._query = None
+        self._next = None
+
+        top = ctk.CTkFrame(self)
+        top.pack(fill="x", pady=(8,6))
+        back_btn = ctk.CTkButton(top, text="Volver", command=lambda: controller.show_frame("MainMenuFrame"))
+        back_btn.pack(side="left", padx=8)
+
+        self.expr_entry = ctk.CTkEntry(top, placeholder_text="fiebre Y tos Y NO disnea")
+        self.expr_entry.pack(side="left", fill="x", expand=True, padx=8)
+        self.expr_entry.bind("<Return>", lambda e: self.search())
+        ctk.CTkLabel(top, text="Últimos días:").pack(side="left", padx=(8, 4))
+        self.dias_entry = ctk.CTkEntry(top, width=60)
+        self.dias_entry.insert(0, "90")
+        self.dias_entry.pack(side="left")
+        self.btn_search = ctk.CTkButton(top, text="Buscar", command=self.search)
+        self.btn_search.pack(side="left", padx=8)
+
+        ctk.CTkLabel(self, text="Operadores: Y, O, NO, paréntesis; signo:nombre o sintoma:nombre para elegir catálogo.",
+                     anchor="w").pack(fill="x", padx=12)
+
+        cols = ("paciente_id", "numero_identificacion", "nombre", "encuentros", "ultima_fecha")
+        container = ctk.CTkFrame(self)
+        container.pack(fill="both", expand=True, padx=10, pady=10)
+        self.tree = ttk.Treeview(container, columns=cols, show="headings")
+        widths = {"paciente_id": 80, "numero_identificacion": 140, "nombre": 220, "encuentros": 90, "ultima_fecha": 160}
+        for c in cols:
+            self.tree.heading(c, text=c.replace('_', ' ').title())
+            self.tree.column(c, width=widths.get(c, 120), anchor="w")
+        self.tree.pack(side="left", fill="both", expand=True)
+        vsb = ttk.Scrollbar(container, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=vsb.set)
+        vsb.pack(side="right", fill="y")
+        self.filler = TreeFiller(self.tree)
+
+        bottom = ctk.CTkFrame(self)
+        bottom.pack(fill="x", padx=10, pady=(0, 10))
+        self.status_var = tk.StringVar(value="")
+        ctk.CTkLabel(bottom, textvariable=self.status_var, anchor="w").pack(side="left", padx=8)
+        self.btn_more = ctk.CTkButton(bottom, text="Más", command=self.load_more, state="disabled")
+        self.btn_more.pack(side="right", padx=8)
+
+    def on_hide(self):
+        self.filler.cancel()
+        discard_background((id(self), "cohorte"))
+
+    def _run(self, after, with_counts):
+        query = self._query
+
+        def work():
+            resolver = CatalogResolver(catalog_store)
+            return cohortes.cohort(db, query["expr"], dias=query["dias"], after=after, limit=self.PAGE_SIZE,
+                                   resolver=resolver, with_counts=with_counts)
+
+        def done(result):
+            self.btn_search.configure(state="normal")
+            if with_counts:
+                query["totales"] = (result["total_pacientes"], result["encuentros"])
+            self._next = result["siguiente"]
+            self.btn_more.configure(state="normal" if self._next is not None else "disabled")
+            rows = [(r[0], r[1], r[2], r[3], r[4].strftime("%Y-%m-%d %H:%M") if r[4] else "")
+                    for r in result["pacientes"]]
+            pacientes, encuentros = query.get("totales", (None, None))
+            status = (f"{pacientes} pacientes, {encuentros} encuentros — {result['ms']:.0f} ms"
+                      if pacientes is not None else "")
+
+            def filled():
+                shown = len(self.tree.get_children())
+                self.status_var.set(f"{status} (mostrando {shown})")
+            if after:
+                self.filler.append(rows, on_done=filled)
+            else:
+                self.filler.load(rows, on_done=filled)
+
+        def failed(exc):
+            self.btn_search.configure(state="normal")
+            self.status_var.set("")
+            if isinstance(exc, cohortes.CohortError):
+                messagebox.showwarning("Cohorte", str(exc))
+            else:
+                _default_async_error(exc)
+
+        self.btn_search.configure(state="disabled")
+        self.btn_more.configure(state="disabled")
+        self.status_var.set("Buscando…")
+        run_in_background(self, work, on_done=done, on_error=failed, key=(id(self), "cohorte"))
+
+    def search(self):
+        expr = self.expr_entry.get().strip()
+        if not expr:
+            messagebox.showwarning("Validación", "Escribe una expresión de evidencia")
+            return
+        dias = self.dias_entry.get().strip()
+        if dias and not dias.isdigit():
+            messagebox.showwarning("Validación", "Días inválidos")
+            return
+        self._query = {"expr": expr, "dias": int(dias) if dias else None}
+        self._next = None
+        self.filler.clear()
+        self._run(after=None, with_counts=True)
+
+    def load_more(self):
+        if self._query is not None and self._next is not None:
+            self._run(after=self._next, with_counts=False)
+
+# Frames del stack principal; App los crea al pedirlos por primera vez
+FRAME_CLASSES = {
+    F.__name__: F
+    for F in (LoginFrame, MainMenuFrame, PacientesFrame, CatalogosFrame, EncuentrosFrame,
+              DiagnosticosFrame, TratamientosFrame, DashboardFrame, CohortesFrame, UsuariosFrame)
+}
 
 # ---------- Inicio de la app ----------
+def install_tracing(tracer):
+    """
+    Cronometra (DIAG_TRACE) on_show de los frames, la construcción de los
+    diálogos, run_inference/save y, como desglose dentro de ellos, SQL,
+    motor de inferencia y actualización de la tabla de resultados.
+    """
+    for cls in FRAME_CLASSES.values():
+        tracer.instrument(cls, "on_show", "vista", f"{cls.__name__}.on_show")
+    dialogs = [c for c in globals().values()
+               if isinstance(c, type) and issubclass(c, tk.Toplevel) and c.__module__ == __name__]
+    for cls in dialogs:
+        tracer.instrument(cls, "__init__", "dialogo", f"{cls.__name__}.__init__")
+        tracer.instrument(cls, "save", "accion", f"{cls.__name__}.save")
+    tracer.instrument(DiagnosticoDialog, "run_inference", "accion")
+    tracer.instrument(DiagnosticoDialog, "update_results_table", "widgets")
+    tracer.instrument(InferenceEngine, "infer", "motor")
+    # Llamadas muy frecuentes: solo histograma y desglose del tramo padre
+    tracer.instrument(Rule, "match_score_ignore_required", "motor", write=False)
+    tracer.instrument(DB, "_execute", "sql", "DB._execute", write=False)
+
+
 if __name__ == "__main__":
+    # DIAG_DB_STATS=ruta.json vuelca las métricas SQL al salir
+    if os.environ.get("DIAG_DB_STATS"):
+        atexit.register(db.stats.dump, os.environ["DIAG_DB_STATS"])
+    # DIAG_TRACE=ruta.jsonl activa la medición de lag y tiempos de interfaz
+    tracer = instrumentacion.tracer_from_env()
+    # DIAG_AUDIT=db|off|ruta.jsonl: destino del registro de inferencias
+    audit_logger = auditoria.logger_from_env(db)
+    if audit_logger is not None:
+        atexit.register(audit_logger.close)
+    if tracer is not None:
+        install_tracing(tracer)
+        atexit.register(tracer.close)
+        atexit.register(tracer.report)
     app = App()
+    if tracer is not None:
+        instrumentacion.lag_monitor_from_env(app, tracer).start()
     app.mainloop()
@@ -0,0 +1,231 @@
+# analitica.py
+"""
+Agregados semanales para el tablero (DashboardFrame): diagnósticos por
+enfermedad, médico y tipo; tratamientos por estado; signos y síntomas
+observados.
+
+Los agregados viven en tablas agg_* (migración 12) y se refrescan de
+forma incremental: cada agregado guarda en agregados_estado la marca de
+su último refresco y solo se recalculan las semanas con filas creadas o
+modificadas desde esa marca (menos REFRESH_MARGIN, para las
+transacciones que confirman tarde). La marca se compara con la hora de
+inserción de la fila, no con la fecha por la que se agrupa: una
+observación importada hoy con recorded_at de hace meses ensucia la
+semana de hace meses. Los borrados dejan en filas_eliminadas la semana
+de la fila, que también se recalcula. Una semana se recalcula entera
+(DELETE + INSERT de su GROUP BY, acotado por el índice de la fecha), así
+que repetirla no duplica conteos.
+
+    python analitica.py refrescar            # incremental
+    python analitica.py reconstruir          # desde cero
+    python analitica.py tablero 12           # resumen de las últimas 12 semanas
+
+El tablero solo lee las tablas agg_* (más los catálogos para los nombres).
+Sin dependencias de GUI.
+"""
+import sys
+import time
+from datetime import timedelta
+
+REFRESH_MARGIN = timedelta(minutes=5)
+
+
+class Aggregate:
+    """
+    Agregado semanal de `source` (alias `a`) por la fecha `created`.
+    `groups` son pares (expresión, columna destino); `changed` es la
+    columna updated_at si las filas de origen se modifican; `inserted` es
+    la hora de inserción cuando `created` puede venir con fecha pasada
+    (por defecto la misma `created`).
+    """
+
+    def __init__(self, nombre, table, source, created, groups, changed=None, inserted=None):
+        self.nombre = nombre
+        self.table = table
+        self.source = source
+        self.created = created
+        self.groups = list(groups)
+        self.changed = changed
+        self.inserted = inserted or created
+
+    def _insert(self, from_clause, where=""):
+        cols = ", ".join(col for _, col in self.groups)
+        exprs = ", ".join(expr for expr, _ in self.groups)
+        return f"""
+            INSERT INTO {self.table} (semana, {cols}, total)
+            SELECT date_trunc('week', a.{self.created})::date, {exprs}, count(*)
+            FROM {from_clause}
+            {where}
+            GROUP BY {", ".join(str(i) for i in range(1, len(self.groups) + 2))}
+        """
+
+    def rebuild_statements(self):
+        return [
+            (f"DELETE FROM {self.table}", None),
+            (self._insert(f"{self.source} a", f"WHERE a.{self.created} IS NOT NULL"), None),
+        ]
+
+    def dirty_weeks_query(self, since):
+        """Semanas (de `created`) con filas insertadas, modificadas o borradas desde `since`."""
+        sql = (f"SELECT date_trunc('week', {self.created})::date FROM {self.source}"
+               f" WHERE {self.inserted} >= %s AND {self.created} IS NOT NULL")
+        params = [since]
+        if self.changed:
+            sql += (f" UNION SELECT date_trunc('week', {self.created})::date FROM {self.source}"
+                    f" WHERE {self.changed} >= %s AND {self.created} IS NOT NULL")
+            params.append(since)
+        # Lápidas: semana de la fila borrada (NULL si no tenía fecha y no contaba)
+        sql += (" UNION SELECT semana FROM filas_eliminadas"
+                " WHERE tabla = %s AND eliminado_at >= %s AND semana IS NOT NULL")
+        params.extend((self.source, since))
+        return sql, tuple(params)
+
+    def refresh_weeks_statements(self, weeks):
+        # Cada semana se recorre por rango sobre el índice de la fecha
+        from_clause = (f"unnest(%s::date[]) AS w(semana) JOIN {self.source} a"
+                       f" ON a.{self.created} >= w.semana AND a.{self.created} < w.semana + 7")
+        return [
+            (f"DELETE FROM {self.table} WHERE semana = ANY(%s::date[])", (weeks,)),
+            (self._insert(from_clause), (weeks,)),
+        ]
+
+
+AGGREGATES = [
+    Aggregate(
+        "diagnosticos", "agg_diagnosticos_semana", "diagnosticos", "created_at",
+        [("COALESCE(a.enfermedad_id, 0)", "enfermedad_id"),
+         ("COALESCE(a.created_by, 0)", "usuario_id"),
+         ("COALESCE(a.tipo, '')", "tipo")],
+        changed="updated_at",
+    ),
+    Aggregate(
+        "tratamientos", "agg_tratamientos_semana", "tratamientos", "created_at",
+        [("COALESCE(a.estado, '')", "estado")],
+        changed="updated_at",
+    ),
+    Aggregate(
+        "observacion_signos", "agg_signos_semana", "observacion_signos", "recorded_at",
+        [("a.signo_id", "signo_id")],
+        inserted="created_at",
+    ),
+    Aggregate(
+        "observacion_sintomas", "agg_sintomas_semana", "observacion_sintomas", "recorded_at",
+        [("a.sintoma_id", "sintoma_id")],
+        inserted="created_at",
+    ),
+]
+
+
+def _refresh_one(db, agg, full=False):
+    """Refresca un agregado. Devuelve "omitido", "completo" o el número de semanas."""
+    with db.transaction():
+        db.query("INSERT INTO agregados_estado (nombre) VALUES (%s) ON CONFLICT (nombre) DO NOTHING", (agg.nombre,))
+        # Otro proceso refrescando el mismo agregado: no esperar, ya lo deja al día
+        row = db.fetchone(
+            "SELECT marca, clock_timestamp() FROM agregados_estado WHERE nombre = %s FOR UPDATE SKIP LOCKED",
+            (agg.nombre,))
+        if row is None:
+            return "omitido"
+        marca, now = row
+        since = marca - REFRESH_MARGIN if marca is not None else None
+        if since is None or full:
+            statements, result = agg.rebuild_statements(), "completo"
+        else:
+            sql, params = agg.dirty_weeks_query(since)
+            weeks = [r[0] for r in db.fetchall(sql, params)]
+            statements, result = (agg.refresh_weeks_statements(weeks) if weeks else []), len(weeks)
+        for sql, params in statements:
+            db.query(sql, params)
+        db.query("UPDATE agregados_estado SET marca = %s, refrescado_at = clock_timestamp() WHERE nombre = %s",
+                 (now, agg.nombre))
+    return result
+
+
+def refresh(db, full=False, aggregates=None):
+    """
+    Refresca los agregados (incremental salvo full=True). Devuelve
+    {nombre: (resultado, ms)}; cada agregado va en su propia transacción.
+    """
+    report = {}
+    for agg in aggregates or AGGREGATES:
+        t0 = time.perf_counter()
+        result = _refresh_one(db, agg, full=full)
+        report[agg.nombre] = (result, round((time.perf_counter() - t0) * 1000.0, 1))
+    return report
+
+
+# ---------- Lecturas del tablero (solo tablas agg_*) ----------
+_SINCE = "date_trunc('week', current_date)::date - %s * 7"
+
+DASHBOARD_QUERIES = {
+    "por_enfermedad": f"""
+        SELECT COALESCE(en.nombre, '(sin enfermedad)'), sum(a.total)::bigint AS n
+        FROM agg_diagnosticos_semana a LEFT JOIN enfermedades en ON en.enfermedad_id = a.enfermedad_id
+        WHERE a.semana >= {_SINCE}
+        GROUP BY 1 ORDER BY n DESC, 1 LIMIT %s""",
+    "por_medico": f"""
+        SELECT COALESCE(u.nombre, '(sin médico)'), sum(a.total)::bigint AS n
+        FROM agg_diagnosticos_semana a LEFT JOIN usuarios u ON u.usuario_id = a.usuario_id
+        WHERE a.semana >= {_SINCE}
+        GROUP BY 1 ORDER BY n DESC, 1 LIMIT %s""",
+    "por_semana": f"""
+        SELECT a.semana, sum(a.total)::bigint
+        FROM agg_diagnosticos_semana a
+        WHERE a.semana >= {_SINCE}
+        GROUP BY 1 ORDER BY 1 DESC LIMIT %s""",
+    "tratamientos_estado": f"""
+        SELECT COALESCE(NULLIF(a.estado, ''), '(sin estado)'), sum(a.total)::bigint AS n
+        FROM agg_tratamientos_semana a
+        WHERE a.semana >= {_SINCE}
+        GROUP BY 1 ORDER BY n DESC, 1 LIMIT %s""",
+    "hallazgos": f"""
+        SELECT tipo, nombre, n FROM (
+            SELECT 'signo' AS tipo, sc.nombre, sum(a.total)::bigint AS n
+            FROM agg_signos_semana a JOIN signos_catalogo sc ON sc.signo_id = a.signo_id
+            WHERE a.semana >= {_SINCE} GROUP BY sc.nombre
+            UNION ALL
+            SELECT 'síntoma', st.nombre, sum(a.total)::bigint
+            FROM agg_sintomas_semana a JOIN sintomas_catalogo st ON st.sintoma_id = a.sintoma_id
+            WHERE a.semana >= {_SINCE} GROUP BY st.nombre
+        ) h ORDER BY n DESC, nombre LIMIT %s""",
+}
+
+
+def dashboard(db, weeks=12, top=10):
+    """Datos del tablero de las últimas `weeks` semanas (incluida la actual)."""
+    back = max(0, int(weeks) - 1)
+    data = {}
+    for name, sql in DASHBOARD_QUERIES.items():
+        if name == "por_semana":
+            params = (back, back + 1)
+        elif name == "hallazgos":
+            params = (back, back, top)
+        else:
+            params = (back, top)
+        data[name] = db.fetchall(sql, params)
+    return data
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    cmd = argv[0] if argv else ""
+    if cmd in ("refrescar", "reconstruir"):
+        from database import db
+        for nombre, (result, ms) in refresh(db, full=cmd == "reconstruir").items():
+            detail = f"{result} semanas" if isinstance(result, int) else result
+            print(f"{nombre:22} {detail:>12} {ms:>9} ms")
+        return 0
+    if cmd == "tablero":
+        from database import db
+        data = dashboard(db, weeks=int(argv[1]) if len(argv) > 1 else 12)
+        for name, rows in data.items():
+            print(f"== {name}")
+            for r in rows:
+                print("  " + "\t".join(str(v) for v in r))
+        return 0
+    print(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+# asincrono.py
+"""
+Ejecución de acceso a datos fuera del hilo que llama.
+
+DBExecutor es un pool de hilos; cada hilo obtiene su propia conexión de
+database.DB (las conexiones son locales al hilo). Devuelve Futures para
+la GUI (que los entrega con after(), ver TkAsync en Diagnostico_medico.py)
+y ofrece corrutinas para servicios asyncio sin interfaz:
+
+    adb = AsyncDB(db)
+    filas = await adb.fetchall("SELECT ...", (x,))
+    await adb.run_in_transaction(lambda db: ...)
+"""
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WORKERS = int(os.environ.get("DIAG_DB_WORKERS", "4"))
+
+
+class DBExecutor:
+    def __init__(self, max_workers=DEFAULT_WORKERS, name="db"):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+    def submit(self, fn, *args, **kwargs):
+        """Ejecuta fn(*args, **kwargs) en un hilo del pool. Devuelve un Future."""
+        return self._pool.submit(fn, *args, **kwargs)
+
+    async def run(self, fn, *args, **kwargs):
+        """Versión asyncio de submit: await executor.run(fn, ...)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self, wait=False):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_executor():
+    """Executor compartido por el proceso (se crea al primer uso)."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = DBExecutor()
+        return _default
+
+
+class AsyncDB:
+    """Fachada asyncio sobre DB: mismas operaciones, ejecutadas en el executor."""
+
+    def __init__(self, db, executor=None):
+        self.db = db
+        self.executor = executor or default_executor()
+
+    async def query(self, sql, params=None, fetch=False):
+        return await self.executor.run(self.db.query, sql, params, fetch)
+
+    async def fetchall(self, sql, params=None):
+        return await self.executor.run(self.db.fetchall, sql, params)
+
+    async def fetchone(self, sql, params=None):
+        return await self.executor.run(self.db.fetchone, sql, params)
+
+    async def run_in_transaction(self, fn, *args, **kwargs):
+        """
+        Ejecuta fn(db, *args, **kwargs) dentro de db.transaction() en un único
+        hilo del pool (una transacción no puede repartirse entre hilos).
+        """
+        def work():
+            with self.db.transaction():
+                return fn(self.db, *args, **kwargs)
+        return await self.executor.run(work)
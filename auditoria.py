@@ -0,0 +1,221 @@
+# auditoria.py
+"""
+Registro de auditoría de las inferencias: quién la pidió, para qué
+paciente/encuentro, con qué evidencia, con qué versión de las reglas y
+qué ranking devolvió el motor.
+
+log() solo encola la entrada en memoria (nunca espera: si la cola está
+llena la entrada se descarta y se cuenta en `dropped`). Un hilo escritor
+la vacía por lotes de BATCH_SIZE entradas o cada FLUSH_MS, lo que ocurra
+antes, hacia:
+- la tabla auditoria_inferencias (migración 11; solo admite INSERT), con
+  un único INSERT de varias filas por lote. Si la base falla el lote va
+  al JSONL de respaldo para no perderlo;
+- o archivos JSONL que rotan al superar DIAG_AUDIT_MAX_MB.
+
+DIAG_AUDIT elige el destino: "db" (por defecto), "off", o una ruta .jsonl.
+
+    python auditoria.py ultimas 20     # últimas entradas de la tabla
+
+Sin dependencias de GUI.
+"""
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+MAX_QUEUE = 10000
+BATCH_SIZE = 200
+FLUSH_MS = 1000
+FALLBACK_PATH = "auditoria_respaldo.jsonl"
+
+_COLUMNS = ("ts", "usuario_id", "paciente_id", "encuentro_id", "evidencia",
+            "version_reglas", "resultado", "duracion_ms")
+
+
+def inference_entry(usuario_id, paciente_id, encuentro_id, raw_signs, raw_symptoms,
+                    signs, symptoms, rules_version, result, duration_ms, top=10):
+    """
+    Entrada de auditoría de una inferencia. `result` es el dict de
+    motor.differential(); del ranking se guardan las `top` primeras.
+    """
+    sources = result.get("sources", {})
+    ranking = [
+        {"enfermedad": str(eid), "probabilidad": round(float(prob), 2),
+         "origen": sources.get(eid, result.get("mode"))}
+        for eid, prob, _details in result.get("combined", [])[:top]
+    ]
+    return {
+        "ts": time.time(),
+        "usuario_id": usuario_id,
+        "paciente_id": paciente_id,
+        "encuentro_id": encuentro_id,
+        "evidencia": {
+            "signos": sorted(raw_signs), "sintomas": sorted(raw_symptoms),
+            "signos_normalizados": sorted(signs), "sintomas_normalizados": sorted(symptoms),
+        },
+        "version_reglas": rules_version,
+        "resultado": {"modo": result.get("mode"), "total": len(result.get("combined", [])), "ranking": ranking},
+        "duracion_ms": round(duration_ms, 3),
+    }
+
+
+class JsonlSink:
+    """Archivos JSONL con rotación por tamaño (ruta, ruta.1, ruta.2...)."""
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, max_files=5):
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self.max_files = max(1, int(max_files))
+
+    def _rotate(self):
+        for i in range(self.max_files - 1, 0, -1):
+            src = self.path if i == 1 else f"{self.path}.{i - 1}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i}")
+        if self.max_files == 1 and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def write(self, entries):
+        lines = "".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in entries)
+        with open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(lines)
+            size = fh.tell()
+        if size >= self.max_bytes:
+            self._rotate()
+
+
+class DBSink:
+    """Tabla auditoria_inferencias; un INSERT de varias filas por lote."""
+
+    def __init__(self, db, fallback=None):
+        self.db = db
+        self.fallback = fallback or JsonlSink(FALLBACK_PATH)
+
+    def write(self, entries):
+        row = "(to_timestamp(%s), %s, %s, %s, %s::jsonb, %s, %s::jsonb, %s)"
+        params = []
+        for e in entries:
+            params.extend((
+                e["ts"], e["usuario_id"], e["paciente_id"], e["encuentro_id"],
+                json.dumps(e["evidencia"], ensure_ascii=False), e["version_reglas"],
+                json.dumps(e["resultado"], ensure_ascii=False), e["duracion_ms"],
+            ))
+        sql = (f"INSERT INTO auditoria_inferencias ({', '.join(_COLUMNS)}) VALUES "
+               + ", ".join([row] * len(entries)))
+        try:
+            self.db.query(sql, tuple(params))
+        except Exception as e:
+            print(f"WARN: auditoría no guardada en la base ({e}); {len(entries)} entradas a {self.fallback.path}")
+            self.fallback.write(entries)
+
+
+class AuditLogger:
+    """
+    Cola en memoria + hilo escritor. log() es seguro desde cualquier hilo y
+    no bloquea; close() vacía lo pendiente (se registra con atexit).
+    """
+
+    def __init__(self, sink, max_queue=MAX_QUEUE, batch_size=BATCH_SIZE, flush_ms=FLUSH_MS):
+        self.sink = sink
+        self.batch_size = max(1, int(batch_size))
+        self.flush_s = max(1, int(flush_ms)) / 1000.0
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._stop = threading.Event()
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name="auditoria", daemon=True)
+        self._thread.start()
+
+    def log(self, entry):
+        if self._stop.is_set():
+            return False
+        try:
+            self._queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _next_batch(self):
+        """Espera la primera entrada (hasta flush_s) y junta las demás ya encoladas."""
+        try:
+            batch = [self._queue.get(timeout=self.flush_s)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_s
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        try:
+            self.sink.write(batch)
+            self.written += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"WARN: se perdieron {len(batch)} entradas de auditoría: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+        # Vaciado final
+        while True:
+            batch = []
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if not batch:
+                break
+            self._write(batch)
+
+    def close(self, timeout=5.0):
+        self._stop.set()
+        self._thread.join(timeout)
+        if self.dropped:
+            print(f"WARN: {self.dropped} entradas de auditoría descartadas (cola llena)")
+
+
+def logger_from_env(db):
+    """AuditLogger según DIAG_AUDIT ("db", "off" o ruta .jsonl), o None si está desactivado."""
+    target = os.environ.get("DIAG_AUDIT", "db").strip()
+    if target.lower() in ("off", "0", "no", ""):
+        return None
+    if target.lower() == "db":
+        sink = DBSink(db)
+    else:
+        sink = JsonlSink(target, max_bytes=float(os.environ.get("DIAG_AUDIT_MAX_MB", "10")) * 1024 * 1024,
+                         max_files=int(os.environ.get("DIAG_AUDIT_FILES", "5")))
+    return AuditLogger(sink)
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if argv and argv[0] == "ultimas":
+        limit = int(argv[1]) if len(argv) > 1 else 20
+        from database import db
+        rows = db.fetchall(
+            "SELECT auditoria_id, ts, usuario_id, paciente_id, encuentro_id, version_reglas, resultado::text "
+            "FROM auditoria_inferencias ORDER BY auditoria_id DESC LIMIT %s", (limit,))
+        for r in rows:
+            print(*r, sep="\t")
+        return 0
+    print(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
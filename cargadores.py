@@ -0,0 +1,133 @@
+# cargadores.py
+"""
+Cargadores de los diálogos de edición.
+
+Cada función trae en una sola consulta el registro a editar, sus campos
+de presentación (nombre del paciente, de la enfermedad, etiqueta del
+encuentro...) y las opciones de los combobox relacionados, de modo que
+abrir un diálogo cuesta un único viaje a la BD sin importar cuántos
+datos muestre. Las listas de opciones llegan como json_agg (psycopg2
+las convierte en listas de Python).
+
+No depende de la GUI; devuelve dicts y listas de (id, etiqueta).
+"""
+
+# Etiquetas calculadas en SQL: las opciones del combobox y el valor
+# seleccionado salen de la misma expresión y siempre coinciden.
+ENCUENTRO_LABEL = "to_char({a}.fecha, 'YYYY-MM-DD HH24:MI') || ' - ' || COALESCE({a}.tipo_encuentro, '')"
+DIAGNOSTICO_LABEL = (
+    "COALESCE({p}.nombre, '?') || ' - ' || COALESCE({e}.nombre, '?')"
+    " || ' (' || COALESCE(to_char({d}.created_at, 'YYYY-MM-DD HH24:MI'), '') || ')'"
+)
+
+# tabla -> (columna id, campos del formulario en orden)
+CATALOG_FIELDS = {
+    "enfermedades": ("enfermedad_id", ("codigo_icd", "nombre", "gravedad")),
+    "signos_catalogo": ("signo_id", ("nombre",)),
+    "sintomas_catalogo": ("sintoma_id", ("nombre",)),
+    "pruebas_lab_catalogo": ("prueba_lab_id", ("codigo", "nombre")),
+    "pruebas_post_catalogo": ("prueba_post_id", ("nombre",)),
+}
+
+
+def _options(raw):
+    """json_agg de pares [id, etiqueta] -> lista de tuplas."""
+    return [(item[0], item[1]) for item in (raw or [])]
+
+
+def _record(names, values):
+    """dict con los campos del registro, o None si no existe (id nulo)."""
+    if values[0] is None:
+        return None
+    return dict(zip(names, values))
+
+
+def encuentros_de_paciente(db, paciente_id):
+    """Opciones (encuentro_id, etiqueta) de un paciente, más recientes primero."""
+    label = ENCUENTRO_LABEL.format(a="x")
+    return db.fetchall(
+        f"SELECT encuentro_id, {label} FROM encuentros x WHERE paciente_id = %s ORDER BY fecha DESC",
+        (paciente_id,)
+    )
+
+
+def diagnostico_form(db, diagnostico_id=None):
+    """
+    Datos de DiagnosticoDialog: opciones de pacientes, el diagnóstico (si
+    diagnostico_id no es None) con sus nombres para mostrar y los
+    encuentros de su paciente.
+    """
+    enc_label = ENCUENTRO_LABEL.format(a="x")
+    row = db.fetchone(
+        f"""
+        SELECT
+          (SELECT COALESCE(json_agg(json_build_array(pp.paciente_id, pp.nombre) ORDER BY pp.nombre), '[]'::json)
+             FROM pacientes pp) AS pacientes,
+          d.diagnostico_id, d.paciente_id, p.nombre, d.encuentro_id, d.enfermedad_id, enf.nombre,
+          d.tipo, d.probabilidad, d.notas,
+          (SELECT COALESCE(json_agg(json_build_array(x.encuentro_id, {enc_label}) ORDER BY x.fecha DESC), '[]'::json)
+             FROM encuentros x WHERE x.paciente_id = d.paciente_id) AS encuentros
+        FROM (SELECT 1) AS uno
+        LEFT JOIN diagnosticos d ON d.diagnostico_id = %s
+        LEFT JOIN pacientes p ON p.paciente_id = d.paciente_id
+        LEFT JOIN enfermedades enf ON enf.enfermedad_id = d.enfermedad_id
+        """,
+        (diagnostico_id,)
+    )
+    registro = _record(
+        ("diagnostico_id", "paciente_id", "paciente", "encuentro_id", "enfermedad_id",
+         "enfermedad", "tipo", "probabilidad", "notas"),
+        row[1:10]
+    )
+    encuentros = _options(row[10])
+    if registro is not None:
+        registro["encuentro"] = dict(encuentros).get(registro["encuentro_id"])
+    return {"pacientes": _options(row[0]), "encuentros": encuentros, "registro": registro}
+
+
+def tratamiento_form(db, tratamiento_id=None):
+    """
+    Datos de TratamientoDialog: opciones de diagnósticos (más recientes
+    primero) y el tratamiento con la etiqueta de su diagnóstico.
+    """
+    diag_label = DIAGNOSTICO_LABEL.format(d="dd", p="pp", e="ee")
+    row = db.fetchone(
+        f"""
+        SELECT
+          (SELECT COALESCE(json_agg(json_build_array(dd.diagnostico_id, {diag_label}) ORDER BY dd.created_at DESC), '[]'::json)
+             FROM diagnosticos dd
+             LEFT JOIN pacientes pp ON pp.paciente_id = dd.paciente_id
+             LEFT JOIN enfermedades ee ON ee.enfermedad_id = dd.enfermedad_id) AS diagnosticos,
+          t.tratamiento_id, t.diagnostico_id, t.nombre, t.descripcion, t.inicio_fecha, t.fin_fecha, t.estado
+        FROM (SELECT 1) AS uno
+        LEFT JOIN tratamientos t ON t.tratamiento_id = %s
+        """,
+        (tratamiento_id,)
+    )
+    diagnosticos = _options(row[0])
+    registro = _record(
+        ("tratamiento_id", "diagnostico_id", "nombre", "descripcion", "inicio_fecha", "fin_fecha", "estado"),
+        row[1:8]
+    )
+    if registro is not None:
+        registro["diagnostico"] = dict(diagnosticos).get(registro["diagnostico_id"])
+    return {"diagnosticos": diagnosticos, "registro": registro}
+
+
+def paciente(db, paciente_id):
+    names = ("paciente_id", "numero_identificacion", "nombre", "fecha_nacimiento", "sexo", "direccion", "telefono")
+    row = db.fetchone(f"SELECT {', '.join(names)} FROM pacientes WHERE paciente_id = %s", (paciente_id,))
+    return dict(zip(names, row)) if row else None
+
+
+def usuario(db, usuario_id):
+    names = ("usuario_id", "nombre", "correo", "rol")
+    row = db.fetchone(f"SELECT {', '.join(names)} FROM usuarios WHERE usuario_id = %s", (usuario_id,))
+    return dict(zip(names, row)) if row else None
+
+
+def catalogo_item(db, table, item_id):
+    """Campos del formulario de CatalogoDialog para un elemento del catálogo `table`."""
+    id_column, fields = CATALOG_FIELDS[table]
+    row = db.fetchone(f"SELECT {', '.join(fields)} FROM {table} WHERE {id_column} = %s", (item_id,))
+    return dict(zip(fields, row)) if row else None
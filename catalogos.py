@@ -0,0 +1,274 @@
+# catalogos.py
+"""
+Almacén de catálogos en memoria, compartido por todo el proceso.
+
+Se precarga una vez al iniciar sesión y guarda mapas compactos id <-> nombre
+para enfermedades, signos, síntomas y pruebas de laboratorio. Los diálogos
+leen de aquí en lugar de consultar la BD; CatalogoDialog invalida solo el
+catálogo que modificó y este se recarga la próxima vez que se pida.
+
+También mantiene el mapa id de regla -> enfermedad_id (DiseaseMap), que
+se construye una vez, se guarda en la tabla regla_enfermedad_map y
+permite resolver los candidatos de la inferencia con una búsqueda O(1).
+CatalogResolver traduce nombres de signo/síntoma a su id (importación CSV
+y expresiones de cohortes).
+"""
+import threading
+import unicodedata
+
+# tabla -> consulta (id, nombre) en el orden en que se muestran
+CATALOG_QUERIES = {
+    "enfermedades": "SELECT enfermedad_id, nombre FROM enfermedades ORDER BY nombre",
+    "signos_catalogo": "SELECT signo_id, nombre FROM signos_catalogo ORDER BY nombre",
+    "sintomas_catalogo": "SELECT sintoma_id, nombre FROM sintomas_catalogo ORDER BY nombre",
+    "pruebas_lab_catalogo": "SELECT prueba_lab_id, nombre FROM pruebas_lab_catalogo ORDER BY nombre",
+}
+
+
+class Catalog:
+    """Mapa inmutable id <-> nombre de un catálogo."""
+    __slots__ = ("table", "names", "by_name", "by_id")
+
+    def __init__(self, table, rows):
+        self.table = table
+        self.by_id = {r[0]: r[1] for r in rows}
+        # Si hay nombres repetidos gana el primero (mismo criterio que los combobox)
+        by_name = {}
+        for rid, nombre in rows:
+            by_name.setdefault(f"{nombre}", rid)
+        self.by_name = by_name
+        self.names = tuple(by_name.keys())
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def id_for(self, nombre):
+        return self.by_name.get(nombre)
+
+    def name_for(self, rid):
+        return self.by_id.get(rid)
+
+
+# Alias explícitos: id de regla -> código ICD-10 del catálogo (o nombre).
+# Las reglas usan ids de texto libre que no siempre coinciden con el nombre.
+RULE_DISEASE_ALIASES = {
+    "Neumonia": "J18.9",
+    "Bronquitis": "J20.9",
+    "Asma": "J45.90",
+    "Gripe": "J10.1",
+    "Resfriado": "J00",
+    "Sepsis": "A41.9",
+    "IAM": "I21.9",
+    "Apendicitis": "K35.80",
+    "ITU": "N39.0",
+    "Meningitis": "G00.9",
+    "Dengue": "A90",
+    "Pancreatitis": "K85.9",
+    "Hipoglucemia": "E16.2",
+}
+
+
+def fold(text):
+    """Clave de comparación: sin acentos, casefold y espacios colapsados."""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.casefold().split())
+
+
+class DiseaseMap:
+    """
+    Mapa id de regla -> enfermedad_id. `unresolved` lista los ids de regla
+    que no se pudieron vincular con el catálogo.
+    """
+
+    def __init__(self, by_rule, unresolved=()):
+        self.by_rule = dict(by_rule)
+        self._by_fold = {fold(k): v for k, v in self.by_rule.items()}
+        self.unresolved = sorted(unresolved)
+
+    def resolve(self, rule_id):
+        if rule_id is None:
+            return None
+        eid = self.by_rule.get(rule_id)
+        if eid is None:
+            eid = self._by_fold.get(fold(rule_id))
+        return eid
+
+
+def build_disease_map(rows, rule_ids, aliases=None):
+    """
+    rows: (enfermedad_id, codigo_icd, nombre, gravedad) del catálogo.
+    Devuelve (DiseaseMap, {rule_id: método}). Orden de resolución: alias
+    explícito (código ICD o nombre), el propio id como código ICD, nombre
+    exacto sin acentos y, por último, nombre que empieza por / contiene el
+    id (gana la mayor gravedad).
+    """
+    aliases = RULE_DISEASE_ALIASES if aliases is None else aliases
+    by_icd = {}
+    by_name = {}
+    for eid, icd, nombre, _grav in rows:
+        if icd:
+            by_icd.setdefault(fold(icd), eid)
+        by_name.setdefault(fold(nombre), eid)
+    by_gravedad = sorted(rows, key=lambda r: -(r[3] or 0))
+
+    def lookup(key):
+        k = fold(key)
+        return by_icd.get(k) or by_name.get(k)
+
+    by_rule, metodos, unresolved = {}, {}, []
+    for rid in rule_ids:
+        eid, metodo = None, None
+        if rid in aliases:
+            eid, metodo = lookup(aliases[rid]), "alias"
+        if eid is None:
+            eid, metodo = lookup(rid), "nombre"
+        if eid is None:
+            k = fold(rid)
+            for row in by_gravedad:
+                n = fold(row[2])
+                if n.startswith(k) or k in n:
+                    eid, metodo = row[0], "aproximado"
+                    break
+        if eid is None:
+            unresolved.append(rid)
+        else:
+            by_rule[rid] = eid
+            metodos[rid] = metodo
+    return DiseaseMap(by_rule, unresolved), metodos
+
+
+class CatalogStore:
+    def __init__(self, db, queries=None):
+        self.db = db
+        self.queries = dict(queries or CATALOG_QUERIES)
+        self._catalogs = {}
+        self._disease_map = None
+        self._disease_map_stale = False
+        # Versión por tabla: cambia en cada invalidación (útil para vistas que cachean)
+        self._versions = {t: 0 for t in self.queries}
+        self._lock = threading.RLock()
+        # Una sola reconstrucción del mapa a la vez (precarga y diálogos)
+        self._build_lock = threading.Lock()
+
+    def load_all(self):
+        for table in self.queries:
+            self.reload(table)
+
+    def reload(self, table):
+        rows = self.db.fetchall(self.queries[table])
+        cat = Catalog(table, rows)
+        with self._lock:
+            self._catalogs[table] = cat
+        return cat
+
+    def get(self, table):
+        """Devuelve el catálogo; si no está cargado (o fue invalidado) lo carga."""
+        with self._lock:
+            cat = self._catalogs.get(table)
+        if cat is None:
+            cat = self.reload(table)
+        return cat
+
+    def invalidate(self, table):
+        """Descarta solo el catálogo `table`; las demás entradas siguen válidas."""
+        with self._lock:
+            self._catalogs.pop(table, None)
+            self._versions[table] = self._versions.get(table, 0) + 1
+            if table == "enfermedades":
+                # El mapa persistido puede apuntar a filas cambiadas: reconstruir
+                # (también si se estaba construyendo en ese momento)
+                self._disease_map = None
+                self._disease_map_stale = True
+
+    def loaded_disease_map(self):
+        """El mapa ya cargado, o None. No consulta la BD (seguro en el hilo de Tk)."""
+        with self._lock:
+            return self._disease_map
+
+    def disease_map(self, rule_ids):
+        """
+        Mapa id de regla -> enfermedad_id. Se lee de regla_enfermedad_map si
+        cubre todos los ids; si no (o si cambiaron las enfermedades) se
+        reconstruye desde el catálogo y se guardan solo las diferencias.
+        Consulta la BD: llamar fuera del hilo de Tk. Si otro hilo ya lo está
+        construyendo, espera y usa ese resultado.
+        """
+        dm = self.loaded_disease_map()
+        if dm is not None:
+            return dm
+        with self._build_lock:
+            with self._lock:
+                dm = self._disease_map
+                stale = self._disease_map_stale
+                version = self._versions.get("enfermedades", 0)
+            if dm is not None:
+                return dm
+            rule_ids = list(rule_ids)
+            rows = self.db.fetchall("SELECT rule_key, enfermedad_id FROM regla_enfermedad_map")
+            persisted = {k: v for k, v in rows}
+            if not stale and all(rid in persisted for rid in rule_ids):
+                dm = DiseaseMap(persisted)
+            else:
+                dm = self._rebuild_disease_map(rule_ids, persisted)
+            with self._lock:
+                # Si se invalidó mientras se construía, la próxima llamada lo rehace
+                if self._versions.get("enfermedades", 0) == version:
+                    self._disease_map = dm
+                    self._disease_map_stale = False
+        return dm
+
+    def _rebuild_disease_map(self, rule_ids, persisted):
+        """Reconstruye el mapa y escribe solo las filas que cambiaron respecto de `persisted`."""
+        rows = self.db.fetchall("SELECT enfermedad_id, codigo_icd, nombre, gravedad FROM enfermedades")
+        dm, metodos = build_disease_map(rows, rule_ids)
+        gone = [rid for rid in persisted if rid not in dm.by_rule]
+        changed = [(rid, eid) for rid, eid in dm.by_rule.items() if persisted.get(rid) != eid]
+        if gone or changed:
+            with self.db.transaction():
+                if gone:
+                    self.db.query("DELETE FROM regla_enfermedad_map WHERE rule_key = ANY(%s)", (gone,))
+                for rid, eid in changed:
+                    # ON CONFLICT: otra instancia de la aplicación pudo escribirla a la vez
+                    self.db.query(
+                        "INSERT INTO regla_enfermedad_map (rule_key, enfermedad_id, metodo) VALUES (%s, %s, %s)"
+                        " ON CONFLICT (rule_key) DO UPDATE SET enfermedad_id = EXCLUDED.enfermedad_id,"
+                        " metodo = EXCLUDED.metodo, updated_at = now()",
+                        (rid, eid, metodos[rid])
+                    )
+        if dm.unresolved:
+            print("WARN: reglas sin enfermedad en el catálogo:", ", ".join(map(str, dm.unresolved)))
+        return dm
+
+    def version(self, table):
+        with self._lock:
+            return self._versions.get(table, 0)
+
+    def clear(self):
+        with self._lock:
+            for table in list(self._catalogs):
+                self._catalogs.pop(table, None)
+                self._versions[table] = self._versions.get(table, 0) + 1
+            self._disease_map = None
+
+
+class CatalogResolver:
+    """
+    Nombre de signo/síntoma -> id, con un mapa precargado una sola vez.
+    Compara sin acentos ni mayúsculas; también acepta la clave del motor
+    con guiones bajos (p. ej. 'dolor_pecho').
+    """
+
+    def __init__(self, store):
+        self.maps = {}
+        for clase, table in (("signo", "signos_catalogo"), ("sintoma", "sintomas_catalogo")):
+            catalog = store.get(table)
+            mapping = {}
+            for rid, nombre in catalog.by_id.items():
+                mapping.setdefault(fold(nombre), rid)
+            self.maps[clase] = mapping
+
+    def resolve(self, clase, nombre):
+        mapping = self.maps[clase]
+        key = fold(nombre)
+        return mapping.get(key) or mapping.get(key.replace("_", " "))
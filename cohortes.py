@@ -0,0 +1,354 @@
+# cohortes.py
+"""
+Cohortes por combinaciones de evidencia: expresiones booleanas sobre
+signos y síntomas observados en los encuentros, p. ej.
+
+    fiebre Y tos Y NO disnea
+    (nauseas O vomito) AND NOT signo:sat_o2
+    "dolor abdominal" -fiebre            (adyacentes = Y; -x = NO x)
+
+Operadores: Y/AND/&, O/OR/|, NO/NOT/!/-, paréntesis. Un nombre se busca
+en los dos catálogos (sin acentos ni mayúsculas); con el prefijo signo: o
+sintoma: solo en uno.
+
+La expresión se compila a una condición SQL sobre evidencia_encuentros
+(migración 13: un arreglo de signo_id y otro de sintoma_id por
+encuentro, con índices GIN, mantenidos por triggers de sentencia):
+- los términos positivos unidos por Y se agrupan en un solo
+  `signos @> ARRAY[...]`, los unidos por O en `signos && ARRAY[...]`;
+- NO se aplica sobre la subexpresión (los arreglos nunca son NULL).
+Sin esa tabla (o con modo="exists") se compila a semi-joins EXISTS sobre
+observacion_signos/observacion_sintomas.
+
+El resultado es la lista de pacientes con al menos un encuentro que
+cumple, paginada por paciente_id (keyset), con los totales de encuentros
+y pacientes.
+
+    python cohortes.py "fiebre Y tos Y NO disnea" --dias 90
+    python cohortes.py "tos O disnea" --modo exists --sql
+
+Sin dependencias de GUI.
+"""
+import argparse
+import re
+import sys
+import time
+
+MODES = ("arrays", "exists")
+DEFAULT_LIMIT = 50
+
+_TOKEN = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|([^\s()"]+))')
+_AND = {"y", "and", "&", "&&"}
+_OR = {"o", "or", "|", "||"}
+_NOT = {"no", "not", "!"}
+_CLASES = {"signo": "signo", "signos": "signo", "sintoma": "sintoma", "sintomas": "sintoma",
+           "síntoma": "sintoma", "síntomas": "sintoma"}
+_COLUMN = {"signo": "signos", "sintoma": "sintomas"}
+_EXISTS = {
+    "signo": "EXISTS (SELECT 1 FROM observacion_signos os WHERE os.encuentro_id = ev.encuentro_id"
+             " AND os.signo_id = ANY(%s::int[]))",
+    "sintoma": "EXISTS (SELECT 1 FROM observacion_sintomas ob WHERE ob.encuentro_id = ev.encuentro_id"
+               " AND ob.sintoma_id = ANY(%s::int[]))",
+}
+
+
+class CohortError(ValueError):
+    """Expresión mal formada o con hallazgos que no están en el catálogo."""
+
+
+# ---------- Análisis de la expresión ----------
+def tokenize(text):
+    tokens, pos = [], 0
+    text = text or ""
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if m is None or m.end() == pos:
+            if text[pos:].strip():
+                raise CohortError(f"carácter inesperado en la posición {pos + 1}")
+            break
+        pos = m.end()
+        if m.group(1):
+            tokens.append(("(", "("))
+        elif m.group(2):
+            tokens.append((")", ")"))
+        elif m.group(3) is not None:
+            tokens.append(("nombre", m.group(3)))
+        else:
+            word = m.group(4)
+            low = word.lower()
+            if low in _AND:
+                tokens.append(("y", word))
+            elif low in _OR:
+                tokens.append(("o", word))
+            elif low in _NOT:
+                tokens.append(("no", word))
+            elif word.startswith(("-", "!")) and len(word) > 1:
+                tokens.append(("no", word[0]))
+                tokens.append(("nombre", word[1:]))
+            else:
+                tokens.append(("nombre", word))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.i = 0
+
+    def peek(self):
+        return self.tokens[self.i][0] if self.i < len(self.tokens) else None
+
+    def take(self):
+        tok = self.tokens[self.i]
+        self.i += 1
+        return tok
+
+    def parse(self):
+        if not self.tokens:
+            raise CohortError("la expresión está vacía")
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise CohortError(f"sobra '{self.tokens[self.i][1]}'")
+        return node
+
+    def parse_or(self):
+        items = [self.parse_and()]
+        while self.peek() == "o":
+            self.take()
+            items.append(self.parse_and())
+        return items[0] if len(items) == 1 else ("or", items)
+
+    def parse_and(self):
+        items = [self.parse_not()]
+        while self.peek() in ("y", "no", "nombre", "("):
+            if self.peek() == "y":
+                self.take()
+            items.append(self.parse_not())
+        return items[0] if len(items) == 1 else ("and", items)
+
+    def parse_not(self):
+        if self.peek() == "no":
+            self.take()
+            return ("not", self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self):
+        kind = self.peek()
+        if kind is None:
+            raise CohortError("la expresión termina antes de tiempo")
+        if kind == "(":
+            self.take()
+            node = self.parse_or()
+            if self.peek() != ")":
+                raise CohortError("falta ')'")
+            self.take()
+            return node
+        if kind != "nombre":
+            raise CohortError(f"se esperaba un hallazgo y llegó '{self.tokens[self.i][1]}'")
+        word = self.take()[1]
+        clase = None
+        prefix, sep, rest = word.partition(":")
+        if sep and prefix.lower() in _CLASES and rest:
+            clase, word = _CLASES[prefix.lower()], rest
+        return ("atom", clase, word)
+
+
+def parse(text):
+    """Árbol de la expresión: ("atom", clase|None, nombre), ("not", x), ("and"|"or", [..])."""
+    return _Parser(tokenize(text)).parse()
+
+
+# ---------- Compilación a SQL ----------
+def _resolve(node, resolver):
+    """Sustituye los nombres por {clase: [ids]}; error si alguno no existe."""
+    kind = node[0]
+    if kind == "atom":
+        _, clase, nombre = node
+        refs = {}
+        for c in ((clase,) if clase else ("signo", "sintoma")):
+            rid = resolver.resolve(c, nombre)
+            if rid is not None:
+                refs[c] = [rid]
+        if not refs:
+            donde = f"el catálogo de {clase}s" if clase else "los catálogos de signos ni síntomas"
+            raise CohortError(f"'{nombre}' no está en {donde}")
+        return ("ref", refs)
+    if kind == "not":
+        return ("not", _resolve(node[1], resolver))
+    return (kind, [_resolve(n, resolver) for n in node[1]])
+
+
+def _term(clase, ids, op, mode):
+    if mode == "exists":
+        # op "all" con varios ids: un EXISTS por id
+        if op == "all" and len(ids) > 1:
+            return " AND ".join([_EXISTS[clase]] * len(ids)), [[i] for i in ids]
+        return _EXISTS[clase], [list(ids)]
+    sql_op = "@>" if op == "all" else "&&"
+    return f"ev.{_COLUMN[clase]} {sql_op} %s::int[]", [list(ids)]
+
+
+def _ref_sql(refs, mode):
+    parts, params = [], []
+    for clase in sorted(refs):
+        sql, p = _term(clase, refs[clase], "any", mode)
+        parts.append(sql)
+        params.extend(p)
+    return (parts[0] if len(parts) == 1 else "(" + " OR ".join(parts) + ")"), params
+
+
+def _compile(node, mode):
+    kind = node[0]
+    if kind == "ref":
+        return _ref_sql(node[1], mode)
+    if kind == "not":
+        sql, params = _compile(node[1], mode)
+        return f"NOT ({sql})", params
+    # Y / O: los términos de una sola clase se agrupan en un único operador de arreglo
+    op = "all" if kind == "and" else "any"
+    merged, rest = {}, []
+    for child in node[1]:
+        if child[0] == "ref" and len(child[1]) == 1:
+            (clase, ids), = child[1].items()
+            bucket = merged.setdefault(clase, [])
+            bucket.extend(i for i in ids if i not in bucket)
+        else:
+            rest.append(child)
+    parts, params = [], []
+    for clase in sorted(merged):
+        sql, p = _term(clase, merged[clase], op, mode)
+        parts.append(sql)
+        params.extend(p)
+    for child in rest:
+        sql, p = _compile(child, mode)
+        parts.append(f"({sql})" if child[0] in ("and", "or") else sql)
+        params.extend(p)
+    joiner = " AND " if kind == "and" else " OR "
+    return joiner.join(parts), params
+
+
+def compile_expression(text, resolver, mode="arrays"):
+    """(condición SQL sobre el alias `ev`, parámetros) de la expresión."""
+    if mode not in MODES:
+        raise ValueError(f"modo desconocido: {mode}")
+    return _compile(_resolve(parse(text), resolver), mode)
+
+
+def _source(mode):
+    return "evidencia_encuentros ev" if mode == "arrays" else "encuentros ev"
+
+
+def _filters(where, params, dias=None, desde=None, hasta=None):
+    where, params = [f"({where})"], list(params)
+    if dias:
+        where.append("ev.fecha >= now() - %s * interval '1 day'")
+        params.append(int(dias))
+    if desde:
+        where.append("ev.fecha >= %s")
+        params.append(desde)
+    if hasta:
+        where.append("ev.fecha < (%s::date + 1)")
+        params.append(hasta)
+    return " AND ".join(where), params
+
+
+def build_queries(text, resolver, mode="arrays", dias=None, desde=None, hasta=None,
+                  after=None, limit=DEFAULT_LIMIT):
+    """
+    Consultas de conteo y de página. Devuelve
+    ((sql_conteo, params), (sql_pagina, params)).
+    """
+    cond, params = compile_expression(text, resolver, mode)
+    cond, params = _filters(cond, params, dias, desde, hasta)
+    src = _source(mode)
+    count_sql = f"SELECT count(*), count(DISTINCT ev.paciente_id) FROM {src} WHERE {cond}"
+    page_sql = f"""
+        SELECT p.paciente_id, p.numero_identificacion, p.nombre, c.encuentros, c.ultima_fecha
+        FROM (SELECT ev.paciente_id, count(*) AS encuentros, max(ev.fecha) AS ultima_fecha
+              FROM {src}
+              WHERE {cond} AND ev.paciente_id > %s
+              GROUP BY ev.paciente_id
+              ORDER BY ev.paciente_id
+              LIMIT %s) c
+        JOIN pacientes p ON p.paciente_id = c.paciente_id
+        ORDER BY c.paciente_id"""
+    page_params = tuple(params) + (int(after or 0), int(limit) + 1)
+    return (count_sql, tuple(params)), (page_sql, page_params)
+
+
+_arrays_available = None
+
+
+def default_mode(db):
+    """'arrays' si existe evidencia_encuentros (migración 13), si no 'exists'."""
+    global _arrays_available
+    if _arrays_available is None:
+        _arrays_available = db.fetchone("SELECT to_regclass('evidencia_encuentros') IS NOT NULL")[0]
+    return "arrays" if _arrays_available else "exists"
+
+
+def cohort(db, text, dias=None, desde=None, hasta=None, after=None, limit=DEFAULT_LIMIT,
+           mode=None, resolver=None, store=None, with_counts=True):
+    """
+    Pacientes de la cohorte a partir de `after` (paciente_id de la página
+    anterior). Devuelve {"pacientes", "siguiente", "encuentros",
+    "total_pacientes", "modo", "ms"}; `siguiente` es None en la última
+    página. with_counts=False omite los totales (páginas siguientes).
+    """
+    if resolver is None:
+        from catalogos import CatalogResolver, CatalogStore
+        if store is None:
+            store = CatalogStore(db)
+        resolver = CatalogResolver(store)
+    mode = mode or default_mode(db)
+    t0 = time.perf_counter()
+    (count_sql, count_params), (page_sql, page_params) = build_queries(
+        text, resolver, mode, dias, desde, hasta, after, limit)
+    rows = db.fetchall(page_sql, page_params)
+    more = len(rows) > limit
+    rows = rows[:limit]
+    result = {"pacientes": rows, "siguiente": rows[-1][0] if more else None, "modo": mode,
+              "encuentros": None, "total_pacientes": None}
+    if with_counts:
+        result["encuentros"], result["total_pacientes"] = db.fetchone(count_sql, count_params)
+    result["ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pacientes con encuentros que cumplen una expresión de evidencia.")
+    parser.add_argument("expresion")
+    parser.add_argument("--dias", type=int, help="solo encuentros de los últimos N días")
+    parser.add_argument("--desde", help="fecha inicial YYYY-MM-DD")
+    parser.add_argument("--hasta", help="fecha final YYYY-MM-DD (inclusive)")
+    parser.add_argument("--limite", type=int, default=DEFAULT_LIMIT)
+    parser.add_argument("--despues", type=int, help="paciente_id de la página anterior")
+    parser.add_argument("--modo", choices=MODES)
+    parser.add_argument("--sql", action="store_true", help="muestra la consulta y EXPLAIN ANALYZE")
+    args = parser.parse_args(argv)
+
+    from database import db
+    from catalogos import CatalogResolver, CatalogStore
+    resolver = CatalogResolver(CatalogStore(db))
+    mode = args.modo or default_mode(db)
+    try:
+        if args.sql:
+            (count_sql, params), _ = build_queries(args.expresion, resolver, mode, args.dias, args.desde, args.hasta)
+            print(count_sql, params)
+            for (line,) in db.fetchall("EXPLAIN ANALYZE " + count_sql, params):
+                print(line)
+            return 0
+        result = cohort(db, args.expresion, args.dias, args.desde, args.hasta, args.despues,
+                        args.limite, mode=mode, resolver=resolver)
+    except CohortError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+    for row in result["pacientes"]:
+        print(*row, sep="\t")
+    print(f"INFO: {result['total_pacientes']} pacientes, {result['encuentros']} encuentros "
+          f"({result['modo']}, {result['ms']} ms); siguiente={result['siguiente']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+# database.py
+"""
+Capa de acceso a datos sin dependencias de GUI: configuración, clase DB
+(instrumentada con metricas_db y con transacciones) y la instancia
+compartida `db`. La usan tanto la aplicación Tk como los servicios sin
+interfaz.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from metricas_db import QueryStats, is_explainable
+
+# ---------- Configuración DB ----------
+DB_CONFIG = {
+    "host": "localhost",
+    "port": 5432,
+    "dbname": "medic_database",
+    "user": "postgres",
+    "password": ""
+}
+
+# ---------- Helper DB ----------
+class DB:
+    """
+    Acceso a PostgreSQL. Cada hilo usa su propia conexión (y su propio estado
+    de transacción), así que la misma instancia sirve al hilo de Tk y a los
+    hilos del executor de asincrono.py sin compartir cursores.
+    """
+
+    def __init__(self, config, stats=None):
+        self.config = config
+        self._local = threading.local()
+        # Métricas por sentencia (latencia, filas, errores, consultas lentas)
+        self.stats = stats or QueryStats()
+
+    @property
+    def conn(self):
+        return getattr(self._local, "conn", None)
+
+    @property
+    def _tx_depth(self):
+        return getattr(self._local, "tx_depth", 0)
+
+    @_tx_depth.setter
+    def _tx_depth(self, value):
+        self._local.tx_depth = value
+
+    def connect(self):
+        conn = self.conn
+        if conn is None or conn.closed:
+            import psycopg2  # diferido: solo se carga al abrir la primera conexión
+            conn = psycopg2.connect(**self.config)
+            conn.autocommit = True
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """Cierra la conexión del hilo actual."""
+        conn = self.conn
+        if conn is not None and not conn.closed:
+            conn.close()
+        self._local.conn = None
+
+    @contextmanager
+    def transaction(self):
+        """
+        Agrupa varias sentencias en una sola transacción (un único COMMIT).
+        Ante cualquier excepción hace ROLLBACK y la relanza. Los bloques
+        anidados se unen a la transacción externa.
+        """
+        conn = self.connect()
+        if self._tx_depth:
+            self._tx_depth += 1
+            try:
+                yield self
+            finally:
+                self._tx_depth -= 1
+            return
+
+        conn.autocommit = False
+        self._tx_depth = 1
+        try:
+            yield self
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._tx_depth = 0
+            if not conn.closed:
+                conn.autocommit = True
+
+    def _execute(self, sql, params, fetch):
+        """Ejecuta la sentencia midiendo su latencia. fetch: None | 'all' | 'one'."""
+        conn = self.connect()
+        with conn.cursor() as cur:
+            t0 = time.perf_counter()
+            try:
+                cur.execute(sql, params or ())
+                if fetch == "all":
+                    result = cur.fetchall()
+                    rows = len(result)
+                elif fetch == "one":
+                    result = cur.fetchone()
+                    rows = 1 if result is not None else 0
+                else:
+                    result = None
+                    rows = cur.rowcount
+            except Exception as e:
+                self.stats.record_error(sql, (time.perf_counter() - t0) * 1000.0, e)
+                raise
+            elapsed_ms = (time.perf_counter() - t0) * 1000.0
+            self.stats.record(sql, elapsed_ms, rows)
+            if self.stats.is_slow(elapsed_ms):
+                self.stats.record_slow(sql, params, elapsed_ms, self._explain(cur, sql, params))
+            return result
+
+    def _explain(self, cur, sql, params):
+        # EXPLAIN sin ANALYZE: no vuelve a ejecutar la sentencia
+        if not is_explainable(sql):
+            return None
+        # Dentro de una transacción, un EXPLAIN fallido no debe abortarla
+        in_tx = self._tx_depth > 0
+        try:
+            if in_tx:
+                cur.execute("SAVEPOINT diag_explain")
+            cur.execute("EXPLAIN " + sql, params or ())
+            plan = "\n".join(r[0] for r in cur.fetchall())
+            if in_tx:
+                cur.execute("RELEASE SAVEPOINT diag_explain")
+            return plan
+        except Exception as e:
+            if in_tx:
+                try:
+                    cur.execute("ROLLBACK TO SAVEPOINT diag_explain")
+                except Exception:
+                    pass
+            return f"(EXPLAIN no disponible: {e})"
+
+    def query(self, sql, params=None, fetch=False):
+        return self._execute(sql, params, "all" if fetch else None)
+
+    def fetchall(self, sql, params=None):
+        return self._execute(sql, params, "all")
+
+    def fetchone(self, sql, params=None):
+        return self._execute(sql, params, "one")
+
+db = DB(DB_CONFIG)
@@ -0,0 +1,654 @@
+# evaluacion.py
+"""
+Evaluación de un conjunto de reglas contra casos históricos: encuentros
+con diagnóstico confirmado (tipo "Definitivo" por defecto) cuya evidencia
+se vuelve a pasar por motor.differential().
+
+Métricas por conjunto de reglas:
+- aciertos top-1 / top-k (algún diagnóstico confirmado entre los k
+  primeros) y rango recíproco medio;
+- calibración de la probabilidad del primer candidato: tabla por
+  deciles (probabilidad media frente a acierto observado), ECE y Brier;
+- confusión por enfermedad (confirmada -> primer candidato) con
+  precisión y sensibilidad.
+Con --comparar se evalúan dos conjuntos sobre los mismos casos y se
+cuentan los casos que cada uno acierta y el otro no.
+
+Los casos se leen en streaming (cursor de servidor o JSONL, gzip
+opcional) y se reparten por lotes entre procesos; como mucho 2*workers
+lotes están en vuelo, así la memoria no depende del número de casos.
+
+    python evaluacion.py casos casos.jsonl.gz --desde 2024-01-01
+    python evaluacion.py reglas actuales.json
+    python evaluacion.py evaluar --casos casos.jsonl.gz --comparar nuevas.json --workers 8
+    python evaluacion.py evaluar --comparar nuevas.json --json informe.json   # casos desde la base
+
+Formato de casos (una línea por encuentro; la primera puede traer el
+catálogo de enfermedades para vincular los ids de las reglas):
+    {"enfermedades": [[enfermedad_id, codigo_icd, nombre, gravedad], ...]}
+    {"id": 17, "signos": [["Sat O2", 88, null], ["Temperatura corporal", 38.6, null]],
+     "sintomas": ["Fiebre", "Tos"], "confirmados": [3]}
+Sin esa línea, "confirmados" se compara directamente con el
+enfermedad_id de las reglas. Un signo es [nombre, valor_numerico,
+valor_texto] o solo el nombre.
+
+Los nombres del catálogo no son las claves del motor: SINTOMAS_VOCAB
+traduce los síntomas, SIGNOS_UMBRALES convierte los signos vitales en
+hallazgos según su valor (Sat O2 < 92 -> hipoxia, temperatura >= 38 ->
+fiebre_obj...) y un nombre que ya coincide con una clave del motor se
+usa tal cual. Lo que no se puede traducir se cuenta por caso y se
+informa junto a las líneas con error.
+
+Sin dependencias de GUI.
+"""
+import argparse
+import gzip
+import importlib.util
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+
+from catalogos import build_disease_map, fold
+
+TOP_K = (1, 3, 5)
+CALIBRATION_BINS = 10
+ITERSIZE = 5000
+NO_PREDICTION = "(ninguna)"
+MEMO_SIZE = 100000  # combinaciones de evidencia recordadas por proceso
+
+# Catálogo de síntomas (nombre plegado) -> clave del motor
+SINTOMAS_VOCAB = {
+    "fiebre": "fiebre",
+    "tos": "tos",
+    "dolor abdominal": "dolor_abdominal",
+    "nauseas": "nausea",
+    "vomito": "vomito",
+    "cefalea": "cefalea",
+    "cansancio": "fatiga",
+    "disnea": "disnea",
+    "mialgias": "dolor_muscular",
+}
+
+# Signos vitales: (comparación, umbral, clase, clave); gana el primero que se cumple
+SIGNOS_UMBRALES = {
+    "temperatura corporal": [(">=", 38.0, "signo", "fiebre_obj")],
+    "frecuencia cardiaca": [(">", 100, "signo", "taquicardia"), ("<", 60, "signo", "bradicardia")],
+    "presion arterial sistolica": [("<", 90, "signo", "hipotension"), (">=", 140, "signo", "hipertension")],
+    "presion arterial diastolica": [("<", 60, "signo", "hipotension"), (">=", 90, "signo", "hipertension")],
+    "frecuencia respiratoria": [(">", 20, "signo", "taquipnea"), ("<", 12, "signo", "bradipnea")],
+    "sat o2": [("<", 92, "signo", "hipoxia")],
+    "glasgow": [("<=", 8, "sintoma", "perdida_conciencia"), ("<", 15, "sintoma", "confusion")],
+}
+
+# Nivel de conciencia (AVPU, primera letra del texto)
+AVPU = {"a": None, "v": ("sintoma", "confusion"), "p": ("sintoma", "perdida_conciencia"),
+        "u": ("sintoma", "perdida_conciencia")}
+
+# Signos sin equivalente en el motor: no aportan evidencia ni cuentan como sin traducir
+SIGNOS_IGNORADOS = {"peso", "talla"}
+
+_COMPARE = {
+    "<": lambda v, t: v < t,
+    "<=": lambda v, t: v <= t,
+    ">": lambda v, t: v > t,
+    ">=": lambda v, t: v >= t,
+}
+
+CASES_QUERY = """
+    SELECT e.encuentro_id, COALESCE(s.hallazgos, '[]'::json), COALESCE(t.nombres, '{}'), d.ids
+    FROM (SELECT encuentro_id, array_agg(DISTINCT enfermedad_id) AS ids
+          FROM diagnosticos
+          WHERE encuentro_id IS NOT NULL AND enfermedad_id IS NOT NULL
+            AND lower(tipo) = ANY(%s)
+          GROUP BY encuentro_id) d
+    JOIN encuentros e ON e.encuentro_id = d.encuentro_id
+    LEFT JOIN LATERAL (SELECT json_agg(json_build_array(sc.nombre, os.valor_numerico, os.valor_texto)
+                                ORDER BY sc.nombre) AS hallazgos
+                       FROM observacion_signos os JOIN signos_catalogo sc ON sc.signo_id = os.signo_id
+                       WHERE os.encuentro_id = e.encuentro_id) s ON TRUE
+    LEFT JOIN LATERAL (SELECT array_agg(DISTINCT st.nombre) AS nombres
+                       FROM observacion_sintomas ob JOIN sintomas_catalogo st ON st.sintoma_id = ob.sintoma_id
+                       WHERE ob.encuentro_id = e.encuentro_id) t ON TRUE
+    {where}
+    ORDER BY e.encuentro_id
+"""
+
+
+# ---------- Conjuntos de reglas ----------
+def rule_to_dict(rule):
+    return {
+        "rule_id": rule.rule_id,
+        "enfermedad_id": rule.enfermedad_id,
+        "required_signs": sorted(rule.required_signs),
+        "required_symptoms": sorted(rule.required_symptoms),
+        "optional_signs": rule.optional_signs,
+        "optional_symptoms": rule.optional_symptoms,
+        "rule_weight": rule.rule_weight,
+        "sign_vs_symptom_balance": rule.sign_vs_symptom_balance,
+    }
+
+
+def load_rules(spec):
+    """
+    Reglas a partir de "actual" (motor.RULES), un .json con una lista de
+    reglas (formato de rule_to_dict) o un .py que defina RULES.
+    """
+    from motor import RULES, Rule
+    if spec in (None, "", "actual"):
+        return list(RULES)
+    if spec.endswith(".json"):
+        with open(spec, encoding="utf-8") as fh:
+            return [Rule(**d) for d in json.load(fh)]
+    if spec.endswith(".py"):
+        module_spec = importlib.util.spec_from_file_location("reglas_evaluadas", spec)
+        module = importlib.util.module_from_spec(module_spec)
+        module_spec.loader.exec_module(module)
+        return list(module.RULES)
+    raise ValueError(f"conjunto de reglas desconocido: {spec} (use 'actual', .json o .py)")
+
+
+def label_map(disease_rows, rule_sets):
+    """enfermedad_id de regla -> id del catálogo (texto), para todas las reglas evaluadas."""
+    if not disease_rows:
+        return {}
+    rule_ids = sorted({str(r.enfermedad_id) for rules in rule_sets for r in rules})
+    dm, _ = build_disease_map([tuple(r) for r in disease_rows], rule_ids)
+    if dm.unresolved:
+        print("WARN: reglas sin enfermedad en el catálogo (nunca aciertan):", ", ".join(dm.unresolved),
+              file=sys.stderr)
+    return {rid: str(eid) for rid, eid in dm.by_rule.items()}
+
+
+# ---------- Métricas ----------
+class Metrics:
+    """Contadores de un conjunto de reglas; merge() suma los de otro lote."""
+
+    def __init__(self):
+        self.cases = 0
+        self.no_prediction = 0
+        self.hits = Counter()          # k -> casos con acierto en el top-k
+        self.rr_sum = 0.0              # suma de 1/rango del primer acierto
+        self.brier_sum = 0.0
+        self.bins = [[0, 0.0, 0] for _ in range(CALIBRATION_BINS)]  # [n, suma prob, aciertos]
+        self.confusion = Counter()     # (confirmada, predicha) -> casos
+
+    def add(self, truth, ranked):
+        """truth: set de etiquetas confirmadas; ranked: [(etiqueta, prob_pct)] ordenado."""
+        self.cases += 1
+        if not ranked:
+            self.no_prediction += 1
+            self.confusion[(min(truth), NO_PREDICTION)] += 1
+            return False
+        rank = next((i for i, (label, _) in enumerate(ranked, 1) if label in truth), None)
+        for k in TOP_K:
+            if rank is not None and rank <= k:
+                self.hits[k] += 1
+        if rank is not None:
+            self.rr_sum += 1.0 / rank
+        top_label, top_prob = ranked[0]
+        hit = rank == 1
+        p = min(max(top_prob / 100.0, 0.0), 1.0)
+        self.brier_sum += (p - (1.0 if hit else 0.0)) ** 2
+        b = self.bins[min(int(p * CALIBRATION_BINS), CALIBRATION_BINS - 1)]
+        b[0] += 1
+        b[1] += p
+        b[2] += 1 if hit else 0
+        self.confusion[(top_label if hit else min(truth), top_label)] += 1
+        return hit
+
+    def merge(self, other):
+        self.cases += other.cases
+        self.no_prediction += other.no_prediction
+        self.hits.update(other.hits)
+        self.rr_sum += other.rr_sum
+        self.brier_sum += other.brier_sum
+        for mine, theirs in zip(self.bins, other.bins):
+            mine[0] += theirs[0]
+            mine[1] += theirs[1]
+            mine[2] += theirs[2]
+        self.confusion.update(other.confusion)
+        return self
+
+    def to_dict(self, names=None):
+        names = names or {}
+        n = self.cases or 1
+        predicted = sum(b[0] for b in self.bins)
+        calibration, ece = [], 0.0
+        for i, (count, prob_sum, hits) in enumerate(self.bins):
+            if not count:
+                continue
+            mean_p, observed = prob_sum / count, hits / count
+            ece += count * abs(mean_p - observed)
+            calibration.append({"desde": i / CALIBRATION_BINS, "hasta": (i + 1) / CALIBRATION_BINS, "casos": count,
+                                "prob_media": round(mean_p, 4), "acierto": round(observed, 4)})
+        support, predicted_as, correct = Counter(), Counter(), Counter()
+        for (truth, pred), c in self.confusion.items():
+            support[truth] += c
+            predicted_as[pred] += c
+            if truth == pred:
+                correct[truth] += c
+        per_disease = []
+        for label in sorted(support, key=lambda k: (-support[k], k)):
+            per_disease.append({
+                "enfermedad": label, "nombre": names.get(label, label), "casos": support[label],
+                "sensibilidad": round(correct[label] / support[label], 4),
+                "precision": round(correct[label] / predicted_as[label], 4) if predicted_as[label] else None,
+                "confundida_con": [
+                    {"enfermedad": pred, "nombre": names.get(pred, pred), "casos": c}
+                    for (truth, pred), c in self.confusion.most_common()
+                    if truth == label and pred != label
+                ][:5],
+            })
+        return {
+            "casos": self.cases,
+            "sin_prediccion": self.no_prediction,
+            **{f"top{k}": round(self.hits[k] / n, 4) for k in TOP_K},
+            "mrr": round(self.rr_sum / n, 4),
+            "brier_top1": round(self.brier_sum / predicted, 4) if predicted else None,
+            "ece_top1": round(ece / predicted, 4) if predicted else None,
+            "calibracion": calibration,
+            "por_enfermedad": per_disease,
+            "confusion": [{"confirmada": t, "predicha": p, "casos": c}
+                          for (t, p), c in sorted(self.confusion.items(), key=lambda x: (-x[1], x[0]))],
+        }
+
+
+# ---------- Trabajo por lotes (en cada proceso) ----------
+_worker = {}
+
+
+def engine_vocabulary(rule_sets=()):
+    """Clave del motor -> clase ("signo"/"sintoma"): listas del motor más las claves de las reglas."""
+    from motor import SIGNOS_LIST, SINTOMAS_LIST
+    known = {key: "sintoma" for key, _ in SINTOMAS_LIST}
+    known.update((key, "signo") for key, _ in SIGNOS_LIST)
+    for rules in rule_sets:
+        for r in rules:
+            for key in list(r.required_symptoms) + list(r.optional_symptoms):
+                known.setdefault(key, "sintoma")
+            for key in list(r.required_signs) + list(r.optional_signs):
+                known.setdefault(key, "signo")
+    return known
+
+
+def _init_worker(rule_sets, labels, max_rank):
+    from motor import InferenceEngine
+    _worker["engines"] = [InferenceEngine(rules=rules) for rules in rule_sets]
+    _worker["known"] = engine_vocabulary(rule_sets)
+    _worker["labels"] = labels
+    _worker["max_rank"] = max_rank
+    # Los casos históricos repiten combinaciones de evidencia: el ranking
+    # de cada combinación se calcula una vez por proceso
+    _worker["memo"] = {}
+
+
+def evidence_key(nombre):
+    """Nombre del catálogo ('Rales respiratorios') -> clave del motor ('rales_respiratorios')."""
+    return fold(nombre).replace(" ", "_")
+
+
+def _sign_finding(nombre, valor, texto):
+    """
+    (clase, clave) de un signo vital según su valor; None si el valor es
+    normal. KeyError si el signo no tiene regla o le falta el valor.
+    """
+    if nombre in SIGNOS_UMBRALES:
+        if valor is None:
+            raise KeyError(nombre)
+        valor = float(valor)
+        for op, limit, clase, key in SIGNOS_UMBRALES[nombre]:
+            if _COMPARE[op](valor, limit):
+                return clase, key
+        return None
+    if nombre == "nivel de conciencia":
+        return AVPU[fold(texto or "")[:1]]
+    raise KeyError(nombre)
+
+
+def translate_evidence(signos, sintomas, known):
+    """
+    Hallazgos del catálogo -> (signos, síntomas) con claves del motor y
+    la lista de nombres que no se pudieron traducir. `known` es el
+    vocabulario de engine_vocabulary().
+    """
+    from motor import SYNONYMS
+    found = {"signo": set(), "sintoma": set()}
+    unmapped = []
+
+    def direct(nombre):
+        # Nombre que ya es (o tiene sinónimo de) una clave del motor
+        key = evidence_key(nombre)
+        key = SYNONYMS.get(key, key)
+        if key in known:
+            found[known[key]].add(key)
+            return True
+        return False
+
+    for item in signos:
+        if isinstance(item, str):
+            item = (item,)
+        nombre, valor, texto = (list(item) + [None, None])[:3]
+        folded = fold(nombre)
+        if folded in SIGNOS_IGNORADOS:
+            continue
+        try:
+            finding = _sign_finding(folded, valor, texto)
+        except KeyError:
+            if not direct(nombre):
+                unmapped.append(nombre)
+            continue
+        if finding is not None:
+            found[finding[0]].add(finding[1])
+    for nombre in sintomas:
+        key = SINTOMAS_VOCAB.get(fold(nombre))
+        if key is not None:
+            found["sintoma"].add(key)
+        elif not direct(nombre):
+            unmapped.append(nombre)
+    return found["signo"], found["sintoma"], unmapped
+
+
+def _parse_case(item):
+    """(id, signos, sintomas, confirmados) desde una línea JSON o una tupla de la base."""
+    if isinstance(item, str):
+        record = json.loads(item)
+        item = (record.get("id"), record.get("signos") or (), record.get("sintomas") or (),
+                record.get("confirmados") or ())
+    return item
+
+
+def _evaluate_batch(items):
+    """Métricas de un lote para cada conjunto de reglas + comparación pareada del top-1."""
+    from motor import differential, normalize_set
+    engines, labels, max_rank, memo = _worker["engines"], _worker["labels"], _worker["max_rank"], _worker["memo"]
+    metrics = [Metrics() for _ in engines]
+    paired = Counter()
+    errors = 0
+    unmapped = Counter()     # nombre -> hallazgos sin traducir
+    unmapped_cases = 0
+    for item in items:
+        try:
+            _id, signos, sintomas, confirmados = _parse_case(item)
+            truth = {str(c) for c in confirmados}
+            if not truth:
+                continue
+            signs, symptoms, missing = translate_evidence(signos, sintomas, _worker["known"])
+            signs, symptoms = normalize_set(signs), normalize_set(symptoms)
+        except (ValueError, TypeError, AttributeError):
+            errors += 1
+            continue
+        if missing:
+            unmapped_cases += 1
+            unmapped.update(missing)
+        key = (frozenset(signs), frozenset(symptoms))
+        rankings = memo.get(key)
+        if rankings is None:
+            rankings = [
+                [(labels.get(str(eid), f"regla:{eid}") if labels else str(eid), prob)
+                 for eid, prob, _ in differential(engine, signs, symptoms)["combined"][:max_rank]]
+                for engine in engines
+            ]
+            if len(memo) >= MEMO_SIZE:
+                memo.clear()
+            memo[key] = rankings
+        hits = [m.add(truth, ranked) for m, ranked in zip(metrics, rankings)]
+        if len(hits) == 2:
+            paired[(hits[0], hits[1])] += 1
+    return metrics, paired, errors, unmapped, unmapped_cases
+
+
+# ---------- Lectura de casos ----------
+def _open_text(path):
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def file_cases(fh):
+    """(filas del catálogo de enfermedades o None, iterador de líneas de casos)."""
+    first = ""
+    for line in fh:
+        first = line.strip()
+        if first:
+            break
+    header = None
+    if first.startswith('{"enfermedades"'):
+        header = json.loads(first)["enfermedades"]
+        first = ""
+
+    def lines():
+        if first:
+            yield first
+        for line in fh:
+            line = line.strip()
+            if line:
+                yield line
+    return header, lines()
+
+
+def _cases_sql(tipos, desde=None, hasta=None):
+    where, params = [], [[t.lower() for t in tipos]]
+    if desde:
+        where.append("e.fecha >= %s")
+        params.append(desde)
+    if hasta:
+        where.append("e.fecha < (%s::date + 1)")
+        params.append(hasta)
+    return CASES_QUERY.format(where=("WHERE " + " AND ".join(where)) if where else ""), tuple(params)
+
+
+def db_disease_rows(db):
+    return db.fetchall("SELECT enfermedad_id, codigo_icd, nombre, gravedad FROM enfermedades ORDER BY enfermedad_id")
+
+
+def db_cases(db, tipos=("definitivo",), desde=None, hasta=None):
+    """Casos desde la base con un cursor de servidor (bloques de ITERSIZE)."""
+    sql, params = _cases_sql(tipos, desde, hasta)
+    with db.transaction():
+        conn = db.connect()
+        with conn.cursor(name="diag_evaluacion") as cur:
+            cur.itersize = ITERSIZE
+            cur.execute(sql, params)
+            for encuentro_id, signos, sintomas, ids in cur:
+                yield (encuentro_id, list(signos), list(sintomas), list(ids))
+
+
+def export_cases(db, path, tipos=("definitivo",), desde=None, hasta=None):
+    """Escribe los casos (y el catálogo de enfermedades en la primera línea) a JSONL."""
+    rows = db_disease_rows(db)
+    written = 0
+    tmp = path + ".parcial"
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(tmp, "wt", encoding="utf-8") as fh:
+        fh.write(json.dumps({"enfermedades": [list(r) for r in rows]}, ensure_ascii=False, default=str) + "\n")
+        for encuentro_id, signos, sintomas, ids in db_cases(db, tipos, desde, hasta):
+            fh.write(json.dumps({"id": encuentro_id, "signos": signos, "sintomas": sintomas,
+                                 "confirmados": ids}, ensure_ascii=False) + "\n")
+            written += 1
+    os.replace(tmp, path)
+    return written
+
+
+# ---------- Evaluación ----------
+def _batches(items, size, limit=None):
+    batch, seen = [], 0
+    for item in items:
+        if limit is not None and seen >= limit:
+            break
+        seen += 1
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def evaluate(cases, rule_sets, disease_rows=None, workers=1, batch_size=500, limit=None, progress=None):
+    """
+    Evalúa uno o dos conjuntos de reglas (lista de listas de Rule) sobre
+    `cases` (líneas JSON o tuplas). Devuelve {"conjuntos": [Metrics...],
+    "pareado": Counter, "errores", "sin_mapear": Counter por nombre,
+    "casos_sin_mapear", "segundos", "nombres"}.
+    """
+    labels = label_map(disease_rows, rule_sets)
+    names = {str(r[0]): r[2] for r in disease_rows or ()}
+    # Ranking completo: el rango recíproco necesita ver más allá del top-k
+    max_rank = None
+    totals = [Metrics() for _ in rule_sets]
+    paired, errors = Counter(), 0
+    unmapped, unmapped_cases = Counter(), 0
+    t0 = time.perf_counter()
+
+    def collect(result):
+        nonlocal errors, unmapped_cases
+        metrics, pair, errs, missing, missing_cases = result
+        for total, m in zip(totals, metrics):
+            total.merge(m)
+        paired.update(pair)
+        errors += errs
+        unmapped.update(missing)
+        unmapped_cases += missing_cases
+        if progress is not None:
+            progress(totals[0].cases, time.perf_counter() - t0)
+
+    batches = _batches(cases, batch_size, limit)
+    if workers <= 1:
+        _init_worker(rule_sets, labels, max_rank)
+        for batch in batches:
+            collect(_evaluate_batch(batch))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(rule_sets, labels, max_rank)) as pool:
+            pending = deque()
+            for batch in batches:
+                pending.append(pool.submit(_evaluate_batch, batch))
+                while len(pending) >= 2 * workers:
+                    collect(pending.popleft().result())
+            while pending:
+                collect(pending.popleft().result())
+    return {"conjuntos": totals, "pareado": paired, "errores": errors,
+            "sin_mapear": unmapped, "casos_sin_mapear": unmapped_cases,
+            "segundos": round(time.perf_counter() - t0, 2), "nombres": names}
+
+
+def report_dict(result, labels_of_sets):
+    sets = [dict(nombre=name, **m.to_dict(result["nombres"]))
+            for name, m in zip(labels_of_sets, result["conjuntos"])]
+    out = {"conjuntos": sets, "errores": result["errores"],
+           "sin_mapear": {"casos": result["casos_sin_mapear"], "hallazgos": sum(result["sin_mapear"].values()),
+                          "nombres": [{"nombre": n, "veces": c} for n, c in result["sin_mapear"].most_common(20)]},
+           "segundos": result["segundos"]}
+    if len(sets) == 2:
+        p = result["pareado"]
+        out["comparacion_top1"] = {
+            "ambos_aciertan": p[(True, True)], "solo_a": p[(True, False)],
+            "solo_b": p[(False, True)], "ninguno": p[(False, False)],
+        }
+    return out
+
+
+def print_report(report, out=sys.stdout):
+    sets = report["conjuntos"]
+    width = max(14, *(len(s["nombre"]) for s in sets))
+    rows = [("casos", "casos"), ("sin predicción", "sin_prediccion")]
+    rows += [(f"top-{k}", f"top{k}") for k in TOP_K]
+    rows += [("MRR", "mrr"), ("Brier top-1", "brier_top1"), ("ECE top-1", "ece_top1")]
+    print(f"{'':<16}" + "".join(f"{s['nombre']:>{width + 2}}" for s in sets), file=out)
+    for title, key in rows:
+        print(f"{title:<16}" + "".join(f"{s[key]!s:>{width + 2}}" for s in sets), file=out)
+    if "comparacion_top1" in report:
+        c = report["comparacion_top1"]
+        print(f"\ntop-1 pareado: ambos {c['ambos_aciertan']}, solo A {c['solo_a']}, "
+              f"solo B {c['solo_b']}, ninguno {c['ninguno']}", file=out)
+    for s in sets:
+        print(f"\n== {s['nombre']}: calibración (prob. media -> acierto)", file=out)
+        for b in s["calibracion"]:
+            print(f"  {b['desde']:.1f}-{b['hasta']:.1f}  n={b['casos']:<8} {b['prob_media']:.3f} -> {b['acierto']:.3f}",
+                  file=out)
+        print(f"== {s['nombre']}: por enfermedad (casos, sensibilidad, precisión, confusiones)", file=out)
+        for d in s["por_enfermedad"][:20]:
+            confusions = ", ".join(f"{c['nombre']}×{c['casos']}" for c in d["confundida_con"][:3])
+            print(f"  {str(d['nombre'])[:30]:<30} {d['casos']:>7} {d['sensibilidad']:>7} {d['precision']!s:>7}  {confusions}",
+                  file=out)
+    print(f"\nINFO: {report['segundos']} s, {report['errores']} líneas con error", file=out)
+    missing = report["sin_mapear"]
+    if missing["hallazgos"]:
+        names = ", ".join(f"{n['nombre']}×{n['veces']}" for n in missing["nombres"][:10])
+        print(f"WARN: {missing['casos']} casos con hallazgos sin traducir al motor "
+              f"({missing['hallazgos']} hallazgos: {names})", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluación de reglas contra casos históricos.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_casos = sub.add_parser("casos", help="exporta los casos confirmados a JSONL")
+    p_casos.add_argument("ruta")
+    p_reglas = sub.add_parser("reglas", help="escribe las reglas actuales como JSON (para editarlas)")
+    p_reglas.add_argument("ruta")
+    p_eval = sub.add_parser("evaluar", help="evalúa uno o dos conjuntos de reglas")
+    p_eval.add_argument("--casos", help="JSONL de casos (por defecto se leen de la base)")
+    p_eval.add_argument("--reglas", default="actual", help="conjunto A: 'actual', .json o .py")
+    p_eval.add_argument("--comparar", help="conjunto B a comparar con A")
+    p_eval.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    p_eval.add_argument("--batch", type=int, default=500)
+    p_eval.add_argument("--limite", type=int, help="máximo de casos")
+    p_eval.add_argument("--json", help="guarda el informe completo en este archivo")
+    for p in (p_casos, p_eval):
+        p.add_argument("--desde", help="fecha inicial YYYY-MM-DD")
+        p.add_argument("--hasta", help="fecha final YYYY-MM-DD (inclusive)")
+        p.add_argument("--tipos", default="definitivo", help="tipos de diagnóstico confirmados, separados por coma")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "reglas":
+        with open(args.ruta, "w", encoding="utf-8") as fh:
+            json.dump([rule_to_dict(r) for r in load_rules("actual")], fh, ensure_ascii=False, indent=2)
+        return 0
+
+    tipos = [t.strip() for t in args.tipos.split(",") if t.strip()]
+    if args.cmd == "casos":
+        from database import db
+        n = export_cases(db, args.ruta, tipos, args.desde, args.hasta)
+        print(f"INFO: {n} casos -> {args.ruta}")
+        return 0
+
+    rule_sets = [load_rules(args.reglas)]
+    set_names = [f"A:{args.reglas}"]
+    if args.comparar:
+        rule_sets.append(load_rules(args.comparar))
+        set_names.append(f"B:{args.comparar}")
+
+    def progress(n, seconds):
+        print(f"\r{n} casos, {n / max(seconds, 1e-9):.0f}/s", end="", file=sys.stderr, flush=True)
+
+    fh = None
+    try:
+        if args.casos:
+            fh = _open_text(args.casos)
+            disease_rows, cases = file_cases(fh)
+        else:
+            from database import db
+            disease_rows = db_disease_rows(db)
+            cases = db_cases(db, tipos, args.desde, args.hasta)
+        result = evaluate(cases, rule_sets, disease_rows, workers=max(1, args.workers),
+                          batch_size=max(1, args.batch), limit=args.limite, progress=progress)
+    finally:
+        if fh is not None and fh is not sys.stdin:
+            fh.close()
+    print(file=sys.stderr)
+    report = report_dict(result, set_names)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as out:
+            json.dump(report, out, ensure_ascii=False, indent=2, default=str)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
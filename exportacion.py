@@ -0,0 +1,224 @@
+# exportacion.py
+"""
+Exportación de pacientes, encuentros (con sus observaciones), diagnósticos
+y tratamientos a CSV o JSONL comprimidos con gzip.
+
+Los datos no pasan por listas en memoria:
+- CSV: COPY (SELECT ...) TO STDOUT escribe directamente en el archivo gzip;
+- JSONL: un cursor de servidor (con nombre) trae las filas ya convertidas
+  a JSON por PostgreSQL en bloques de ITERSIZE.
+La memoria usada es constante sin importar cuántas filas haya.
+
+    python exportacion.py diagnosticos salida.csv.gz --desde 2024-01-01 --hasta 2024-12-31
+    python exportacion.py encuentros salida.jsonl.gz
+
+progress(filas, bytes) se llama cada pocos miles de filas; si lanza
+ExportCancelled la exportación se detiene y no queda archivo parcial.
+Sin dependencias de GUI.
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+
+ITERSIZE = 2000
+PROGRESS_EVERY = 5000  # filas entre avisos de progreso
+
+FORMATS = ("csv", "jsonl")
+
+# nombre -> (SELECT sin filtro de fechas, columna de fecha para el filtro, orden)
+EXPORTS = {
+    "pacientes": (
+        """SELECT p.paciente_id, p.numero_identificacion, p.nombre, p.fecha_nacimiento, p.sexo,
+                  p.direccion, p.telefono, p.created_at, p.updated_at
+           FROM pacientes p""",
+        "p.created_at",
+        "p.paciente_id",
+    ),
+    "encuentros": (
+        """SELECT e.encuentro_id, e.paciente_id, p.numero_identificacion, p.nombre AS paciente,
+                  e.fecha, e.tipo_encuentro, e.motivo,
+                  (SELECT COALESCE(json_agg(json_build_object(
+                              'signo', sc.nombre, 'valor_texto', os.valor_texto,
+                              'valor_numerico', os.valor_numerico, 'unidad', os.unidad,
+                              'registrado', os.recorded_at) ORDER BY os.recorded_at), '[]'::json)
+                     FROM observacion_signos os JOIN signos_catalogo sc ON sc.signo_id = os.signo_id
+                    WHERE os.encuentro_id = e.encuentro_id) AS signos,
+                  (SELECT COALESCE(json_agg(json_build_object(
+                              'sintoma', st.nombre, 'severidad', ob.severidad,
+                              'inicio', ob.inicio_fecha, 'notas', ob.notas,
+                              'registrado', ob.recorded_at) ORDER BY ob.recorded_at), '[]'::json)
+                     FROM observacion_sintomas ob JOIN sintomas_catalogo st ON st.sintoma_id = ob.sintoma_id
+                    WHERE ob.encuentro_id = e.encuentro_id) AS sintomas
+           FROM encuentros e
+           JOIN pacientes p ON p.paciente_id = e.paciente_id""",
+        "e.fecha",
+        "e.encuentro_id",
+    ),
+    "diagnosticos": (
+        """SELECT d.diagnostico_id, d.paciente_id, p.numero_identificacion, p.nombre AS paciente,
+                  d.encuentro_id, d.enfermedad_id, en.codigo_icd, en.nombre AS enfermedad,
+                  d.tipo, d.probabilidad, d.fuente, d.regla_id, d.notas, d.created_at
+           FROM diagnosticos d
+           LEFT JOIN pacientes p ON p.paciente_id = d.paciente_id
+           LEFT JOIN enfermedades en ON en.enfermedad_id = d.enfermedad_id""",
+        "d.created_at",
+        "d.diagnostico_id",
+    ),
+    "tratamientos": (
+        """SELECT t.tratamiento_id, t.diagnostico_id, d.paciente_id, p.numero_identificacion,
+                  p.nombre AS paciente, en.nombre AS enfermedad, t.nombre, t.descripcion,
+                  t.inicio_fecha, t.fin_fecha, t.estado, t.created_at
+           FROM tratamientos t
+           LEFT JOIN diagnosticos d ON d.diagnostico_id = t.diagnostico_id
+           LEFT JOIN pacientes p ON p.paciente_id = d.paciente_id
+           LEFT JOIN enfermedades en ON en.enfermedad_id = d.enfermedad_id""",
+        "t.created_at",
+        "t.tratamiento_id",
+    ),
+}
+
+
+class ExportCancelled(Exception):
+    """Lanzada por el callback de progreso para detener la exportación."""
+
+
+def build_query(entity, desde=None, hasta=None):
+    """
+    SELECT de la exportación con el filtro de fechas (desde inclusive,
+    hasta inclusive por día). Devuelve (sql, params).
+    """
+    try:
+        select, date_col, order = EXPORTS[entity]
+    except KeyError:
+        raise ValueError(f"exportación desconocida: {entity}") from None
+    where, params = [], []
+    if desde:
+        where.append(f"{date_col} >= %s")
+        params.append(desde)
+    if hasta:
+        where.append(f"{date_col} < (%s::date + 1)")
+        params.append(hasta)
+    sql = select
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + f" ORDER BY {order}", tuple(params)
+
+
+def count_rows(db, entity, desde=None, hasta=None):
+    """Total de filas a exportar (para mostrar porcentaje)."""
+    sql, params = build_query(entity, desde, hasta)
+    return db.fetchone(f"SELECT count(*) FROM ({sql}) AS x", params)[0]
+
+
+def format_for_path(path):
+    name = path[:-3] if path.endswith(".gz") else path
+    return "jsonl" if name.endswith((".jsonl", ".json")) else "csv"
+
+
+class _CountingWriter:
+    """Envoltura del archivo gzip que cuenta filas/bytes y avisa el progreso."""
+
+    def __init__(self, fh, progress):
+        self.fh = fh
+        self.progress = progress
+        self.rows = 0
+        self.bytes = 0
+        self._next = PROGRESS_EVERY
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.fh.write(data)
+        self.bytes += len(data)
+        # En CSV un campo entre comillas puede contener saltos de línea:
+        # durante la copia el conteo de filas es aproximado (el final lo da
+        # el COPY), el de bytes exacto
+        self.rows += data.count(b"\n")
+        if self.progress is not None and self.rows >= self._next:
+            self._next = self.rows + PROGRESS_EVERY
+            self.progress(self.rows, self.bytes)
+        return len(data)
+
+
+def _copy_csv(db, sql, params, writer):
+    """Copia el resultado como CSV; devuelve las filas copiadas (o None si el driver no lo informa)."""
+    conn = db.connect()
+    with conn.cursor() as cur:
+        # COPY no admite parámetros: se incrustan ya escapados con mogrify
+        query = cur.mogrify(sql, params).decode("utf-8")
+        cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", writer)
+        return cur.rowcount if cur.rowcount >= 0 else None
+
+
+def _stream_jsonl(db, sql, params, writer):
+    with db.transaction():
+        conn = db.connect()
+        with conn.cursor(name="diag_exportacion") as cur:
+            cur.itersize = ITERSIZE
+            cur.execute(f"SELECT row_to_json(x)::text FROM ({sql}) AS x", params)
+            for (line,) in cur:
+                writer.write(line + "\n")
+
+
+def export(db, entity, path, fmt=None, desde=None, hasta=None, progress=None):
+    """
+    Exporta `entity` a `path` (gzip). Se escribe en un archivo temporal
+    que se renombra al terminar. Devuelve {"filas", "bytes", "segundos", "ruta"}.
+    """
+    fmt = fmt or format_for_path(path)
+    if fmt not in FORMATS:
+        raise ValueError(f"formato desconocido: {fmt}")
+    sql, params = build_query(entity, desde, hasta)
+    tmp = path + ".parcial"
+    t0 = time.perf_counter()
+    try:
+        with gzip.open(tmp, "wb", compresslevel=6) as fh:
+            writer = _CountingWriter(fh, progress)
+            copied = None
+            if fmt == "csv":
+                copied = _copy_csv(db, sql, params, writer)
+            else:
+                _stream_jsonl(db, sql, params, writer)
+        os.replace(tmp, path)
+    except BaseException as e:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        if isinstance(e, ExportCancelled):
+            # Un COPY interrumpido deja la conexión en estado incierto: descartarla
+            db.close()
+        raise
+    if copied is not None:
+        rows = copied
+    else:
+        rows = writer.rows - (1 if fmt == "csv" else 0)  # sin la cabecera
+    if progress is not None:
+        progress(rows, writer.bytes)
+    return {"filas": rows, "bytes": writer.bytes, "segundos": round(time.perf_counter() - t0, 3), "ruta": path}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta datos clínicos a CSV/JSONL gzip.")
+    parser.add_argument("entidad", choices=sorted(EXPORTS))
+    parser.add_argument("ruta", help="archivo de salida (.csv.gz o .jsonl.gz)")
+    parser.add_argument("--formato", choices=FORMATS, default=None)
+    parser.add_argument("--desde", help="fecha inicial YYYY-MM-DD")
+    parser.add_argument("--hasta", help="fecha final YYYY-MM-DD (inclusive)")
+    args = parser.parse_args(argv)
+
+    from database import db
+
+    def progress(rows, nbytes):
+        print(f"\r{rows} filas, {nbytes / 1e6:.1f} MB", end="", file=sys.stderr, flush=True)
+
+    result = export(db, args.entidad, args.ruta, args.formato, args.desde, args.hasta, progress)
+    print(file=sys.stderr)
+    print(f"INFO: {result['filas']} filas en {result['segundos']} s -> {result['ruta']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
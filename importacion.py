@@ -0,0 +1,391 @@
+# importacion.py
+"""
+Importación masiva desde CSV de pacientes y de observaciones históricas
+(signos y síntomas).
+
+El archivo se lee en bloques de CHUNK_ROWS filas. Cada fila se valida y
+normaliza en Python (fechas, sexo, longitudes, nombres de catálogo
+resueltos con un mapa precargado); las válidas se cargan con COPY en una
+tabla temporal de staging y al final se fusionan con sentencias por
+conjuntos:
+
+- pacientes: INSERT ... ON CONFLICT (numero_identificacion) DO UPDATE
+  (si el archivo repite una identificación, gana la última línea);
+- observaciones: se crea el encuentro (paciente, fecha) si no existe y se
+  insertan las observaciones que aún no estén registradas en él, así que
+  reimportar el mismo archivo no duplica datos.
+
+Una fila inválida no detiene la importación: queda en el informe de
+errores con su número de línea (y en un CSV de errores si se pide). Todo
+lo válido se fusiona en una sola transacción.
+
+    python importacion.py pacientes pacientes.csv --errores errores.csv
+    python importacion.py observaciones historico.csv --usuario 1
+
+Columnas (cabecera obligatoria, sin distinguir mayúsculas):
+    pacientes:      numero_identificacion, nombre, fecha_nacimiento, sexo, direccion, telefono
+    observaciones:  numero_identificacion, fecha, tipo_encuentro, clase (signo|sintoma),
+                    hallazgo, valor_texto, valor_numerico, unidad, severidad, inicio_fecha, notas
+Sin dependencias de GUI.
+"""
+import argparse
+import csv
+import io
+import sys
+import time
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from catalogos import CatalogResolver, CatalogStore, fold
+
+CHUNK_ROWS = 5000
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y")
+DATETIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M",
+                    "%d/%m/%Y %H:%M") + DATE_FORMATS
+SEXO_VALUES = {"m": "M", "masculino": "M", "hombre": "M", "h": "M",
+               "f": "F", "femenino": "F", "mujer": "F",
+               "o": "O", "otro": "O"}
+
+
+class RowError(ValueError):
+    """Error de validación de una fila (el mensaje va al informe)."""
+
+
+class ImportReport:
+    """Resultado de una importación: contadores y errores por línea."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.read = 0
+        self.valid = 0
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.encounters = 0  # encuentros creados (observaciones)
+        self.errors = []   # [(linea, mensaje, fila original)]
+        self.seconds = 0.0
+
+    def error(self, line, message, row=None):
+        self.errors.append((line, message, row or {}))
+
+    def to_dict(self):
+        return {
+            "tipo": self.kind, "leidas": self.read, "validas": self.valid,
+            "insertadas": self.inserted, "actualizadas": self.updated, "omitidas": self.skipped,
+            "encuentros_creados": self.encounters,
+            "errores": len(self.errors), "segundos": round(self.seconds, 3),
+        }
+
+    def write_errors(self, path):
+        with open(path, "w", newline="", encoding="utf-8") as fh:
+            w = csv.writer(fh)
+            w.writerow(["linea", "error", "fila"])
+            for line, message, row in self.errors:
+                w.writerow([line, message, ";".join(f"{k}={v}" for k, v in row.items())])
+
+
+# ---------- Normalización de campos ----------
+def _text(row, key, max_len=None, required=False):
+    value = (row.get(key) or "").strip()
+    value = " ".join(value.split()) if value else value
+    if required and not value:
+        raise RowError(f"{key}: obligatorio")
+    if max_len and len(value) > max_len:
+        raise RowError(f"{key}: supera {max_len} caracteres")
+    return value or None
+
+
+def _parse_date(value, key, formats=DATE_FORMATS):
+    value = (value or "").strip()
+    if not value:
+        return None
+    for fmt in formats:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise RowError(f"{key}: fecha no reconocida '{value}'")
+
+
+def _date(row, key):
+    parsed = _parse_date(row.get(key), key)
+    if parsed is None:
+        return None
+    if parsed.date() > date.today():
+        raise RowError(f"{key}: fecha futura")
+    return parsed.date()
+
+
+def _number(row, key):
+    value = (row.get(key) or "").strip().replace(",", ".")
+    if not value:
+        return None
+    try:
+        n = Decimal(value)
+    except InvalidOperation:
+        raise RowError(f"{key}: no es un número '{value}'") from None
+    # NaN/Infinity: int() fallaría fuera de RowError y NUMERIC (< PG 14) no los admite
+    if not n.is_finite():
+        raise RowError(f"{key}: no es un número finito '{value}'")
+    return n
+
+
+def _small_int(row, key, low, high):
+    n = _number(row, key)
+    if n is None:
+        return None
+    # El rango primero: int() de un exponente enorme es costoso
+    if not (low <= n <= high) or n != int(n):
+        raise RowError(f"{key}: debe ser un entero entre {low} y {high}")
+    return int(n)
+
+
+def normalize_paciente(row):
+    sexo = _text(row, "sexo")
+    if sexo is not None:
+        sexo = SEXO_VALUES.get(fold(sexo))
+        if sexo is None:
+            raise RowError("sexo: use M, F u O")
+    return (
+        _text(row, "numero_identificacion", 100, required=True),
+        _text(row, "nombre", 200, required=True),
+        _date(row, "fecha_nacimiento"),
+        sexo,
+        _text(row, "direccion"),
+        _text(row, "telefono", 50),
+    )
+
+
+def normalize_observacion(row, resolver):
+    clase = fold(row.get("clase") or "")
+    clase = {"signos": "signo", "sintomas": "sintoma"}.get(clase, clase)
+    if clase not in ("signo", "sintoma"):
+        raise RowError("clase: use 'signo' o 'sintoma'")
+    hallazgo = _text(row, "hallazgo", required=True)
+    hallazgo_id = resolver.resolve(clase, hallazgo)
+    if hallazgo_id is None:
+        raise RowError(f"hallazgo: '{hallazgo}' no está en el catálogo de {clase}s")
+    fecha = _parse_date(row.get("fecha"), "fecha", DATETIME_FORMATS)
+    if fecha is None:
+        raise RowError("fecha: obligatoria")
+    return (
+        _text(row, "numero_identificacion", 100, required=True),
+        fecha,
+        _text(row, "tipo_encuentro", 50) or "Importado",
+        clase,
+        hallazgo_id,
+        _text(row, "valor_texto"),
+        _number(row, "valor_numerico"),
+        _text(row, "unidad", 50),
+        _small_int(row, "severidad", 0, 10),
+        _date(row, "inicio_fecha"),
+        _text(row, "notas"),
+    )
+
+
+# ---------- Staging y fusión ----------
+STAGING = {
+    "pacientes": (
+        """CREATE TEMP TABLE stg_pacientes (
+             linea INT, numero_identificacion VARCHAR(100), nombre VARCHAR(200), fecha_nacimiento DATE,
+             sexo CHAR(1), direccion TEXT, telefono VARCHAR(50)
+           ) ON COMMIT DROP""",
+        "stg_pacientes (linea, numero_identificacion, nombre, fecha_nacimiento, sexo, direccion, telefono)",
+    ),
+    "observaciones": (
+        """CREATE TEMP TABLE stg_observaciones (
+             linea INT, numero_identificacion VARCHAR(100), fecha TIMESTAMP WITH TIME ZONE,
+             tipo_encuentro VARCHAR(50), clase VARCHAR(10), hallazgo_id INT, valor_texto TEXT,
+             valor_numerico NUMERIC, unidad VARCHAR(50), severidad SMALLINT, inicio_fecha DATE, notas TEXT
+           ) ON COMMIT DROP""",
+        "stg_observaciones (linea, numero_identificacion, fecha, tipo_encuentro, clase, hallazgo_id,"
+        " valor_texto, valor_numerico, unidad, severidad, inicio_fecha, notas)",
+    ),
+}
+
+MERGE_PACIENTES = """
+INSERT INTO pacientes AS p (numero_identificacion, nombre, fecha_nacimiento, sexo, direccion, telefono)
+SELECT DISTINCT ON (numero_identificacion)
+       numero_identificacion, nombre, fecha_nacimiento, sexo, direccion, telefono
+FROM stg_pacientes
+ORDER BY numero_identificacion, linea DESC
+ON CONFLICT (numero_identificacion) DO UPDATE SET
+  nombre = EXCLUDED.nombre,
+  fecha_nacimiento = COALESCE(EXCLUDED.fecha_nacimiento, p.fecha_nacimiento),
+  sexo = COALESCE(EXCLUDED.sexo, p.sexo),
+  direccion = COALESCE(EXCLUDED.direccion, p.direccion),
+  telefono = COALESCE(EXCLUDED.telefono, p.telefono)
+RETURNING (xmax = 0) AS insertada
+"""
+
+# Líneas cuyo paciente no existe: se informan y no se importan
+MISSING_PATIENTS = """
+SELECT s.linea, s.numero_identificacion FROM stg_observaciones s
+WHERE NOT EXISTS (SELECT 1 FROM pacientes p WHERE p.numero_identificacion = s.numero_identificacion)
+ORDER BY s.linea
+"""
+
+# Las fusiones devuelven solo la cantidad de filas insertadas
+MERGE_ENCUENTROS = """
+WITH ins AS (
+  INSERT INTO encuentros (paciente_id, fecha, tipo_encuentro, motivo, created_by)
+  SELECT DISTINCT ON (p.paciente_id, s.fecha) p.paciente_id, s.fecha, s.tipo_encuentro, 'Importación CSV', %s
+  FROM stg_observaciones s
+  JOIN pacientes p ON p.numero_identificacion = s.numero_identificacion
+  WHERE NOT EXISTS (SELECT 1 FROM encuentros e WHERE e.paciente_id = p.paciente_id AND e.fecha = s.fecha)
+  ORDER BY p.paciente_id, s.fecha, s.linea
+  RETURNING 1
+)
+SELECT count(*) FROM ins
+"""
+
+# Solo los encuentros de los pares (paciente, fecha) del lote, no toda la tabla
+_STG_ENCUENTRO = """
+WITH enc AS (
+  SELECT DISTINCT ON (paciente_id, fecha) encuentro_id, paciente_id, fecha
+  FROM encuentros
+  WHERE (paciente_id, fecha) IN (
+    SELECT p.paciente_id, s.fecha FROM stg_observaciones s
+    JOIN pacientes p ON p.numero_identificacion = s.numero_identificacion
+    WHERE s.clase = %s)
+  ORDER BY paciente_id, fecha, encuentro_id
+),
+obs AS (
+  SELECT DISTINCT ON (enc.encuentro_id, s.hallazgo_id) enc.encuentro_id, s.*
+  FROM stg_observaciones s
+  JOIN pacientes p ON p.numero_identificacion = s.numero_identificacion
+  JOIN enc ON enc.paciente_id = p.paciente_id AND enc.fecha = s.fecha
+  WHERE s.clase = %s
+  ORDER BY enc.encuentro_id, s.hallazgo_id, s.linea DESC
+),
+"""
+
+MERGE_SIGNOS = _STG_ENCUENTRO + """
+ins AS (
+  INSERT INTO observacion_signos (encuentro_id, signo_id, valor_texto, valor_numerico, unidad, recorded_by, recorded_at)
+  SELECT o.encuentro_id, o.hallazgo_id, o.valor_texto, o.valor_numerico, o.unidad, %s, o.fecha
+  FROM obs o
+  WHERE NOT EXISTS (SELECT 1 FROM observacion_signos x WHERE x.encuentro_id = o.encuentro_id AND x.signo_id = o.hallazgo_id)
+  RETURNING 1
+)
+SELECT count(*) FROM ins
+"""
+
+MERGE_SINTOMAS = _STG_ENCUENTRO + """
+ins AS (
+  INSERT INTO observacion_sintomas (encuentro_id, sintoma_id, severidad, inicio_fecha, notas, recorded_by, recorded_at)
+  SELECT o.encuentro_id, o.hallazgo_id, o.severidad, o.inicio_fecha, o.notas, %s, o.fecha
+  FROM obs o
+  WHERE NOT EXISTS (SELECT 1 FROM observacion_sintomas x WHERE x.encuentro_id = o.encuentro_id AND x.sintoma_id = o.hallazgo_id)
+  RETURNING 1
+)
+SELECT count(*) FROM ins
+"""
+
+
+def _copy_rows(db, target, rows):
+    """Carga filas ya normalizadas con COPY ... FROM STDIN (CSV en memoria, un bloque)."""
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    for r in rows:
+        w.writerow(["" if v is None else (v.isoformat() if hasattr(v, "isoformat") else v) for v in r])
+    buf.seek(0)
+    with db.connect().cursor() as cur:
+        # Cadena vacía sin comillas = NULL (FORMAT csv por defecto)
+        cur.copy_expert(f"COPY {target} FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def _read_chunks(fh, size):
+    reader = csv.DictReader(fh)
+    if reader.fieldnames is None:
+        return
+    reader.fieldnames = [fold(f).replace(" ", "_") for f in reader.fieldnames]
+    chunk = []
+    for row in reader:
+        chunk.append((reader.line_num, row))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_csv(db, kind, fh, usuario_id=None, chunk_rows=CHUNK_ROWS, progress=None, store=None):
+    """
+    Importa el CSV abierto en `fh`. kind: "pacientes" | "observaciones".
+    progress(filas_leidas) se llama tras cada bloque. Devuelve ImportReport.
+    """
+    if kind not in STAGING:
+        raise ValueError(f"tipo de importación desconocido: {kind}")
+    report = ImportReport(kind)
+    t0 = time.perf_counter()
+    if kind == "observaciones":
+        resolver = CatalogResolver(store or CatalogStore(db))
+        normalize = lambda row: normalize_observacion(row, resolver)
+    else:
+        normalize = normalize_paciente
+    create_sql, target = STAGING[kind]
+
+    with db.transaction():
+        db.query(create_sql)
+        for chunk in _read_chunks(fh, chunk_rows):
+            valid = []
+            for line, row in chunk:
+                report.read += 1
+                try:
+                    valid.append((line,) + normalize(row))
+                except RowError as e:
+                    report.error(line, str(e), row)
+            if valid:
+                _copy_rows(db, target, valid)
+                report.valid += len(valid)
+            if progress is not None:
+                progress(report.read)
+
+        if kind == "pacientes":
+            flags = db.fetchall(MERGE_PACIENTES)
+            report.inserted = sum(1 for (f,) in flags if f)
+            report.updated = len(flags) - report.inserted
+            report.skipped = report.valid - len(flags)  # repetidas en el archivo
+        else:
+            for line, ident in db.fetchall(MISSING_PATIENTS):
+                report.error(line, f"numero_identificacion: paciente '{ident}' no existe")
+            report.encounters = db.fetchone(MERGE_ENCUENTROS, (usuario_id,))[0]
+            report.inserted = (db.fetchone(MERGE_SIGNOS, ("signo", "signo", usuario_id))[0]
+                               + db.fetchone(MERGE_SINTOMAS, ("sintoma", "sintoma", usuario_id))[0])
+            missing = sum(1 for _, m, _ in report.errors if m.startswith("numero_identificacion: paciente"))
+            report.skipped = report.valid - missing - report.inserted  # ya registradas o repetidas
+    report.errors.sort(key=lambda e: e[0])
+    report.seconds = time.perf_counter() - t0
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importa pacientes u observaciones desde CSV.")
+    parser.add_argument("tipo", choices=sorted(STAGING))
+    parser.add_argument("archivo")
+    parser.add_argument("--usuario", type=int, default=None, help="usuario_id que registra los datos")
+    parser.add_argument("--errores", default=None, help="CSV donde escribir las filas rechazadas")
+    parser.add_argument("--bloque", type=int, default=CHUNK_ROWS, help="filas por bloque")
+    args = parser.parse_args(argv)
+
+    from database import db
+
+    def progress(n):
+        print(f"\r{n} filas leídas", end="", file=sys.stderr, flush=True)
+
+    with open(args.archivo, newline="", encoding="utf-8-sig") as fh:
+        report = import_csv(db, args.tipo, fh, args.usuario, max(1, args.bloque), progress)
+    print(file=sys.stderr)
+    for line, message, _ in report.errors[:20]:
+        print(f"WARN: línea {line}: {message}")
+    if len(report.errors) > 20:
+        print(f"WARN: ... y {len(report.errors) - 20} errores más")
+    if args.errores and report.errors:
+        report.write_errors(args.errores)
+    print("INFO:", ", ".join(f"{k}={v}" for k, v in report.to_dict().items()))
+    return 0 if not report.errors else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
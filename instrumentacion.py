@@ -0,0 +1,241 @@
+# instrumentacion.py
+"""
+Instrumentación opcional de la interfaz: latencia del bucle de eventos de
+Tk y tiempos de las acciones del usuario.
+
+Se activa con DIAG_TRACE=ruta.jsonl (sin la variable no se instala nada y
+no cuesta nada). Con ella:
+
+- un latido con after() mide cuánto se retrasa el bucle de eventos
+  respecto de lo programado (lag); los retrasos mayores que
+  DIAG_TRACE_LAG_MS (50 por defecto) se escriben en la traza;
+- on_show de los frames, la construcción de los diálogos, run_inference
+  y save quedan cronometrados. Cada tramo desglosa el tiempo de los
+  tramos anidados por tipo (sql, motor, widgets...), para saber
+  a dónde se fue el tiempo de un clic;
+- la traza JSONL rota al superar DIAG_TRACE_MAX_MB (5 por defecto) y se
+  conservan DIAG_TRACE_FILES archivos (3);
+- al salir se imprimen (y se añaden a la traza) los percentiles por acción.
+
+No depende de la GUI: el latido recibe cualquier objeto con after().
+"""
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from metricas_db import LatencyHistogram
+
+# Cubetas más finas que las de SQL: el lag y los clics viven entre 1 ms y segundos
+BUCKETS_MS = (1, 2, 5, 10, 16, 33, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class Tracer:
+    """
+    Registro de tramos cronometrados. record() y span() son seguros entre
+    hilos; el anidamiento de tramos es por hilo.
+    """
+
+    def __init__(self, path=None, max_bytes=5 * 1024 * 1024, max_files=3):
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self.max_files = max(1, int(max_files))
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._local = threading.local()
+        self._fh = None
+
+    # ---------- Escritura de la traza ----------
+    def _open(self):
+        if self._fh is None and self.path:
+            self._fh = open(self.path, "a", encoding="utf-8")
+        return self._fh
+
+    def _rotate(self):
+        self._fh.close()
+        self._fh = None
+        for i in range(self.max_files - 1, 0, -1):
+            src = self.path if i == 1 else f"{self.path}.{i - 1}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i}")
+        if self.max_files == 1:
+            os.remove(self.path)  # sin historial: se empieza de nuevo
+
+    def write(self, entry):
+        if not self.path:
+            return
+        line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            try:
+                fh = self._open()
+                fh.write(line)
+                fh.flush()
+                if fh.tell() >= self.max_bytes:
+                    self._rotate()
+            except OSError as e:
+                print("WARN: no se pudo escribir la traza:", e)
+                self.path = None
+
+    # ---------- Tramos ----------
+    def record(self, kind, name, ms, write=True, **extra):
+        """Registra una medición en el histograma de (kind, name) y en la traza."""
+        with self._lock:
+            hist = self._histograms.get((kind, name))
+            if hist is None:
+                hist = self._histograms[(kind, name)] = LatencyHistogram(BUCKETS_MS)
+            hist.add(ms)
+        if write:
+            entry = {"ts": round(time.time(), 3), "tipo": kind, "nombre": name, "ms": round(ms, 3),
+                     "hilo": threading.current_thread().name}
+            entry.update(extra)
+            self.write(entry)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def span(self, kind, name, write=True):
+        """
+        Cronometra el bloque. Si está anidado en otro tramo del mismo hilo,
+        su tiempo se suma al desglose del padre bajo `kind`. Con write=False
+        solo cuenta en el histograma y en el padre (para llamadas muy
+        frecuentes, p. ej. cada consulta SQL).
+        """
+        stack = self._stack()
+        frame = {"hijos": {}}
+        stack.append(frame)
+        t0 = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            ms = (time.perf_counter() - t0) * 1000.0
+            stack.pop()
+            if stack:
+                parent = stack[-1]["hijos"]
+                parent[kind] = parent.get(kind, 0.0) + ms
+            extra = {}
+            if frame["hijos"]:
+                extra["hijos"] = {k: round(v, 3) for k, v in frame["hijos"].items()}
+            if error:
+                extra["error"] = error
+            self.record(kind, name, ms, write=write, **extra)
+
+    def wrap(self, kind, name, write=True):
+        """Decorador: cronometra cada llamada a la función."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def timed(*args, **kwargs):
+                with self.span(kind, name, write=write):
+                    return fn(*args, **kwargs)
+            timed.__wrapped_by_tracer__ = True
+            return timed
+        return decorator
+
+    def instrument(self, owner, attr, kind, name=None, write=True):
+        """Reemplaza owner.attr (clase o módulo) por su versión cronometrada."""
+        fn = owner.__dict__.get(attr) if isinstance(owner, type) else getattr(owner, attr, None)
+        if fn is None or getattr(fn, "__wrapped_by_tracer__", False):
+            return False
+        label = name or f"{getattr(owner, '__name__', owner)}.{attr}"
+        setattr(owner, attr, self.wrap(kind, label, write=write)(fn))
+        return True
+
+    # ---------- Resumen ----------
+    def summary(self):
+        """{"tipo nombre": {count, p50_ms, p95_ms, p99_ms, max_ms, mean_ms}}"""
+        with self._lock:
+            items = list(self._histograms.items())
+        result = {}
+        for (kind, name), hist in sorted(items):
+            d = hist.to_dict()
+            result[f"{kind} {name}"] = {k: d[k] for k in ("count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms")}
+        return result
+
+    def report(self):
+        """Imprime el resumen de percentiles y lo añade a la traza."""
+        summary = self.summary()
+        if not summary:
+            return summary
+        width = max(len(k) for k in summary)
+        print("INFO: tiempos de interfaz (ms)")
+        print(f"  {'':<{width}}  {'n':>6} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>9}")
+        for key, d in summary.items():
+            print(f"  {key:<{width}}  {d['count']:>6} {d['p50_ms']!s:>7} {d['p95_ms']!s:>7} "
+                  f"{d['p99_ms']!s:>7} {d['max_ms']!s:>9}")
+        self.write({"ts": round(time.time(), 3), "tipo": "resumen", "datos": summary})
+        return summary
+
+    def close(self):
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+class LagMonitor:
+    """
+    Latido del bucle de eventos: programa un after(interval_ms) y mide
+    cuánto más tarde de lo previsto se ejecuta. Ese retraso es el tiempo
+    que la interfaz estuvo bloqueada sin atender eventos.
+    """
+
+    def __init__(self, widget, tracer, interval_ms=100, report_over_ms=50):
+        self.widget = widget
+        self.tracer = tracer
+        self.interval_ms = int(interval_ms)
+        self.report_over_ms = float(report_over_ms)
+        self._job = None
+        self._expected = None
+
+    def start(self):
+        self._schedule()
+        return self
+
+    def stop(self):
+        if self._job is not None:
+            try:
+                self.widget.after_cancel(self._job)
+            except Exception:
+                pass
+            self._job = None
+
+    def _schedule(self):
+        self._expected = time.perf_counter() + self.interval_ms / 1000.0
+        self._job = self.widget.after(self.interval_ms, self._beat)
+
+    def _beat(self):
+        lag_ms = max(0.0, (time.perf_counter() - self._expected) * 1000.0)
+        self.tracer.record("lag", "bucle_tk", lag_ms, write=lag_ms >= self.report_over_ms)
+        self._schedule()
+
+
+def enabled():
+    return bool(os.environ.get("DIAG_TRACE"))
+
+
+def tracer_from_env():
+    """Tracer configurado con DIAG_TRACE*, o None si no está activado."""
+    if not enabled():
+        return None
+    return Tracer(
+        os.environ["DIAG_TRACE"],
+        max_bytes=float(os.environ.get("DIAG_TRACE_MAX_MB", "5")) * 1024 * 1024,
+        max_files=int(os.environ.get("DIAG_TRACE_FILES", "3")),
+    )
+
+
+def lag_monitor_from_env(widget, tracer):
+    return LagMonitor(
+        widget, tracer,
+        interval_ms=int(os.environ.get("DIAG_TRACE_TICK_MS", "100")),
+        report_over_ms=float(os.environ.get("DIAG_TRACE_LAG_MS", "50")),
+    )
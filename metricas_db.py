@@ -0,0 +1,204 @@
+# metricas_db.py
+"""
+Métricas de la capa de datos: histogramas de latencia por sentencia SQL
+(clave = texto SQL normalizado), filas devueltas/afectadas, errores y un
+registro de consultas lentas que incluye su plan EXPLAIN.
+
+No depende de la GUI ni de psycopg2; DB solo llama a record()/record_error().
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+
+# Límites superiores de cada cubeta del histograma (milisegundos)
+BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+DEFAULT_SLOW_MS = float(os.environ.get("DIAG_SLOW_QUERY_MS", "200"))
+DEFAULT_SLOW_LOG = os.environ.get("DIAG_SLOW_QUERY_LOG") or None
+
+_RE_STRING = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_SPACES = re.compile(r"\s+")
+_RE_IN_LIST = re.compile(r"\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))+\s*\)")
+
+# Solo estas sentencias admiten EXPLAIN (DDL no)
+_EXPLAINABLE = ("select", "insert", "update", "delete", "with")
+
+
+def normalize_sql(sql):
+    """Normaliza el texto SQL para agrupar ejecuciones de la misma sentencia."""
+    s = _RE_STRING.sub("?", str(sql))
+    s = _RE_NUMBER.sub("?", s)
+    s = _RE_SPACES.sub(" ", s).strip()
+    s = _RE_IN_LIST.sub("(...)", s)
+    return s
+
+
+def is_explainable(sql):
+    head = str(sql).lstrip().split(None, 1)
+    return bool(head) and head[0].lower() in _EXPLAINABLE
+
+
+class LatencyHistogram:
+    """Histograma de latencias con cubetas fijas (ms) y percentiles aproximados."""
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # última cubeta = +inf
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = None
+        self.max_ms = None
+
+    def add(self, ms):
+        idx = len(self.buckets)
+        for i, upper in enumerate(self.buckets):
+            if ms <= upper:
+                idx = i
+                break
+        self.counts[idx] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.min_ms = ms if self.min_ms is None else min(self.min_ms, ms)
+        self.max_ms = ms if self.max_ms is None else max(self.max_ms, ms)
+
+    def percentile(self, p):
+        """
+        Límite superior de la cubeta que contiene el percentil p, sin pasar
+        del máximo observado.
+        """
+        if not self.count:
+            return None
+        target = p / 100.0 * self.count
+        acc = 0
+        upper = self.max_ms
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= target:
+                if i < len(self.buckets):
+                    upper = self.buckets[i]
+                break
+        return round(min(upper, self.max_ms), 3)
+
+    def to_dict(self):
+        labels = [f"<={b}" for b in self.buckets] + [f">{self.buckets[-1]}"]
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else None,
+            "min_ms": None if self.min_ms is None else round(self.min_ms, 3),
+            "max_ms": None if self.max_ms is None else round(self.max_ms, 3),
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "buckets": {lbl: c for lbl, c in zip(labels, self.counts) if c},
+        }
+
+
+class _StatementStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.rows = 0
+        self.errors = 0
+        self.last_error = None
+
+
+class QueryStats:
+    """
+    Acumula métricas por sentencia normalizada. Es seguro entre hilos.
+    slow_ms: umbral a partir del cual una sentencia va al registro de lentas.
+    slow_log_path: si se indica, cada consulta lenta se agrega como línea JSONL.
+    """
+
+    def __init__(self, slow_ms=DEFAULT_SLOW_MS, slow_log_path=DEFAULT_SLOW_LOG, slow_log_size=200):
+        self.slow_ms = float(slow_ms)
+        self.slow_log_path = slow_log_path
+        self.slow_log = deque(maxlen=slow_log_size)
+        self.enabled = True
+        self.started_at = time.time()
+        self._stmts = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        st = self._stmts.get(key)
+        if st is None:
+            st = self._stmts[key] = _StatementStats()
+        return st
+
+    def is_slow(self, elapsed_ms):
+        return self.enabled and elapsed_ms >= self.slow_ms
+
+    def record(self, sql, elapsed_ms, rows=0):
+        if not self.enabled:
+            return
+        key = normalize_sql(sql)
+        with self._lock:
+            st = self._get(key)
+            st.latency.add(elapsed_ms)
+            if rows and rows > 0:
+                st.rows += rows
+
+    def record_error(self, sql, elapsed_ms, exc):
+        if not self.enabled:
+            return
+        key = normalize_sql(sql)
+        with self._lock:
+            st = self._get(key)
+            st.latency.add(elapsed_ms)
+            st.errors += 1
+            st.last_error = f"{type(exc).__name__}: {exc}".strip()
+
+    def record_slow(self, sql, params, elapsed_ms, plan=None):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "sql": normalize_sql(sql),
+            "params": repr(params)[:500] if params else None,
+            "elapsed_ms": round(elapsed_ms, 3),
+            "plan": plan,
+        }
+        with self._lock:
+            self.slow_log.append(entry)
+        if self.slow_log_path:
+            try:
+                with open(self.slow_log_path, "a", encoding="utf-8") as fh:
+                    fh.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            except OSError as e:
+                print("WARN: no se pudo escribir el registro de consultas lentas:", e)
+
+    def reset(self):
+        with self._lock:
+            self._stmts.clear()
+            self.slow_log.clear()
+            self.started_at = time.time()
+
+    def snapshot(self):
+        """Copia serializable a JSON de las métricas actuales."""
+        with self._lock:
+            statements = []
+            for key, st in self._stmts.items():
+                item = {"sql": key, "rows": st.rows, "errors": st.errors}
+                if st.last_error:
+                    item["last_error"] = st.last_error
+                item.update(st.latency.to_dict())
+                statements.append(item)
+            slow = list(self.slow_log)
+        statements.sort(key=lambda s: s["total_ms"], reverse=True)
+        return {
+            "since": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            "taken_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "slow_ms": self.slow_ms,
+            "statements": statements,
+            "slow_queries": slow,
+        }
+
+    def dump(self, path):
+        """Escribe snapshot() como JSON en `path`."""
+        data = self.snapshot()
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(data, fh, ensure_ascii=False, indent=2, default=str)
+        os.replace(tmp, path)
+        return path
@@ -0,0 +1,847 @@
+# migraciones.py
+"""
+Migraciones de esquema versionadas.
+
+Cada migración tiene un número de versión único y se registra en la tabla
+schema_version al aplicarse; apply_pending() ejecuta solo las que faltan,
+en orden ascendente y dentro de una misma transacción.
+
+Las versiones 1-3 crean el esquema base (sql.sql), las tablas de
+recomendaciones y su semilla; con la BD al día el arranque solo hace una
+lectura de schema_version.
+
+Uso por consola:
+    python migraciones.py migrate   # aplica pendientes
+    python migraciones.py check     # verifica con EXPLAIN que se usan los índices
+"""
+import json
+import os
+import re
+import sys
+
+from recomendaciones import RECOMMENDATIONS_FUNCTION
+from seguridad import canonicalize_stored_hashes
+
+
+class Migration:
+    """
+    Una migración: lista de sentencias SQL y/o una función func(db) para
+    pasos que requieren lógica en Python.
+    """
+
+    def __init__(self, version, nombre, statements=(), func=None):
+        self.version = int(version)
+        self.nombre = nombre
+        self.statements = list(statements)
+        self.func = func
+
+    def apply(self, db):
+        for sql in self.statements:
+            db.query(sql)
+        if self.func is not None:
+            self.func(db)
+
+
+SCHEMA_VERSION_DDL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+  version INT PRIMARY KEY,
+  nombre VARCHAR(200) NOT NULL,
+  applied_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+)
+"""
+
+# ---------- 0001: esquema base (sql.sql) ----------
+BASE_SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sql.sql")
+
+_RE_CREATE_TABLE = re.compile(r"\bCREATE\s+TABLE\s+(?!IF\s+NOT\s+EXISTS)", re.IGNORECASE)
+
+
+def _split_sql(text):
+    """Separa un script en sentencias (el esquema no tiene ';' dentro de literales)."""
+    text = "\n".join(l for l in text.splitlines() if not l.strip().startswith("--"))
+    return [stmt.strip() for stmt in text.split(";") if stmt.strip()]
+
+
+def apply_base_schema(db, path=BASE_SCHEMA_FILE):
+    """
+    Ejecuta sql.sql con CREATE TABLE IF NOT EXISTS, de modo que también
+    sirve para bases creadas a mano con ese mismo script.
+    """
+    with open(path, encoding="utf-8") as fh:
+        script = fh.read()
+    for stmt in _split_sql(script):
+        db.query(_RE_CREATE_TABLE.sub("CREATE TABLE IF NOT EXISTS ", stmt))
+
+
+# ---------- 0002: tablas de recomendaciones por enfermedad ----------
+RECOMMENDATION_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS enfermedad_tratamientos_recomendados (
+        id SERIAL PRIMARY KEY,
+        enfermedad_id INT NOT NULL REFERENCES enfermedades(enfermedad_id) ON DELETE CASCADE,
+        tratamiento TEXT NOT NULL,
+        indicaciones TEXT,
+        tipo VARCHAR(50), -- farmacologico / no_farmacologico / procedimiento
+        prioridad SMALLINT, -- 1 alta, 2 media, 3 baja
+        UNIQUE (enfermedad_id, tratamiento)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS enfermedad_pruebas_recomendadas (
+        id SERIAL PRIMARY KEY,
+        enfermedad_id INT NOT NULL REFERENCES enfermedades(enfermedad_id) ON DELETE CASCADE,
+        prueba_lab_id INT NOT NULL REFERENCES pruebas_lab_catalogo(prueba_lab_id) ON DELETE CASCADE,
+        nota TEXT,
+        urgencia SMALLINT, -- 1 urgente, 2 prioritaria, 3 rutina
+        UNIQUE (enfermedad_id, prueba_lab_id)
+    )
+    """,
+    # Alternativa: pruebas/estudios en texto (cuando no existan en catálogo)
+    """
+    CREATE TABLE IF NOT EXISTS enfermedad_pruebas_texto_recomendadas (
+        id SERIAL PRIMARY KEY,
+        enfermedad_id INT NOT NULL REFERENCES enfermedades(enfermedad_id) ON DELETE CASCADE,
+        nombre TEXT NOT NULL,
+        nota TEXT,
+        urgencia SMALLINT,
+        UNIQUE (enfermedad_id, nombre)
+    )
+    """,
+]
+
+
+# ---------- 0003: semilla de recomendaciones (tratamientos y pruebas) ----------
+RECOMMENDATION_SEEDS = [
+    {
+        "name": "Neumon",
+        "tx": [
+            ("Amoxicilina-clavulánico", "500/125 mg cada 8h por 5-7 días", "farmacologico", 2),
+            ("Azitromicina", "500 mg día 1, luego 250 mg/día 4 días", "farmacologico", 2),
+            ("Reposo e hidratación", "Ingesta de líquidos y reposo relativo", "no_farmacologico", 3)
+        ],
+        "labs": [
+            ("Hemograma", "Leucocitosis orienta a infección bacteriana", 2),
+            ("Proteína C reactiva", "Inflamación sistémica", 2),
+            ("Radiografía de tórax", "Valorar consolidaciones y patrón alveolar", 1)
+        ]
+    },
+    {
+        "name": "Bronquitis",
+        "tx": [
+            ("Antitusígenos", "Si tos seca molesta (p. ej., dextrometorfano)", "farmacologico", 3),
+            ("Broncodilatador inhalado", "Salbutamol 1-2 disparos cada 6-8h si sibilancias", "farmacologico", 2)
+        ],
+        "labs": [
+            ("Hemograma", "Descartar infección bacteriana significativa", 3)
+        ]
+    },
+    {
+        "name": "Asma",
+        "tx": [
+            ("Salbutamol inhalado", "2-4 inhalaciones cada 20 min x 1h, luego según respuesta", "farmacologico", 1),
+            ("Corticoide sistémico", "Prednisona 40-50 mg/día por 5-7 días en exacerbación", "farmacologico", 1)
+        ],
+        "labs": [
+            ("Sat O2", "Oximetría de pulso para valorar hipoxemia", 1)
+        ]
+    },
+    {
+        "name": "Sepsis",
+        "tx": [
+            ("Antibióticos de amplio espectro", "Administrar en la primera hora", "farmacologico", 1),
+            ("Líquidos IV", "Cristaloides 30 ml/kg en la primera hora", "procedimiento", 1)
+        ],
+        "labs": [
+            ("Hemocultivos", "Antes de antibióticos si es posible", 1),
+            ("Lactato", "Marcador pronóstico", 1),
+            ("Función renal", "Urea y creatinina", 2)
+        ]
+    },
+    {
+        "name": "Infarto agudo de miocardio",
+        "tx": [
+            ("AAS", "160-325 mg masticable una sola vez (si no contraindicado)", "farmacologico", 1),
+            ("Nitroglicerina", "0.4 mg SL cada 5 min x 3 si TA lo permite", "farmacologico", 1)
+        ],
+        "labs": [
+            ("Troponina", "Biomarcador de daño miocárdico", 1),
+            ("ECG", "Electrocardiograma de 12 derivaciones", 1)
+        ]
+    },
+    {
+        "name": "Apendicitis",
+        "tx": [
+            ("Cirugía: apendicectomía", "Derivar a cirugía general", "procedimiento", 1),
+            ("Antibióticos", "Ceftriaxona + metronidazol preoperatorio", "farmacologico", 1)
+        ],
+        "labs": [
+            ("Hemograma", "Leucocitosis con neutrofilia", 2),
+            ("PCR", "Marcador inespecífico de inflamación", 3)
+        ]
+    },
+    {
+        "name": "ITU",
+        "tx": [
+            ("Nitrofurantoína", "100 mg cada 12h por 5 días (cistitis no complicada)", "farmacologico", 2)
+        ],
+        "labs": [
+            ("EGO", "EGO/EGO+urocultivo si fiebre o recurrencia", 2)
+        ]
+    },
+    {
+        "name": "Meningitis",
+        "tx": [
+            ("Antibióticos IV", "Ceftriaxona + vancomicina (empírico)", "farmacologico", 1),
+            ("Dexametasona", "10 mg IV cada 6h por 4 días (bacteriana)", "farmacologico", 1)
+        ],
+        "labs": [
+            ("Punción lumbar", "Citoquímico de LCR, según indicación y seguridad", 1),
+            ("Hemocultivos", "Antes de antibiótico si es posible", 1)
+        ]
+    },
+    {
+        "name": "Dengue",
+        "tx": [
+            ("Hidratación", "VO o IV según signos de alarma", "procedimiento", 1),
+            ("Paracetamol", "Evitar AINES", "farmacologico", 2)
+        ],
+        "labs": [
+            ("Hemograma", "Hematocrito y plaquetas para seguimiento", 1)
+        ]
+    },
+    {
+        "name": "Pancreatitis",
+        "tx": [
+            ("Hidratación IV", "Cristaloides agresivos primeras 24-48h", "procedimiento", 1),
+            ("Analgesia", "Opioide según dolor", "farmacologico", 1)
+        ],
+        "labs": [
+            ("Amilasa", "Diagnóstico y seguimiento", 1),
+            ("Lipasa", "Más específica que amilasa", 1)
+        ]
+    },
+    {
+        "name": "Hipoglucemia",
+        "tx": [
+            ("Glucosa oral o IV", "15-20 g de glucosa oral; en severa, D50 IV", "farmacologico", 1)
+        ],
+        "labs": [
+            ("Glucosa capilar", "Control seriado hasta normalización", 1)
+        ]
+    }
+]
+
+
+def seed_recommendations(db):
+    """
+    Agrega datos básicos para poder mostrar tratamientos y pruebas sugeridas
+    por enfermedad. No hace nada si ya hay recomendaciones registradas.
+    """
+    has_any = db.fetchone("SELECT EXISTS (SELECT 1 FROM enfermedad_tratamientos_recomendados)")
+    if has_any and has_any[0]:
+        return  # ya hay datos
+
+    # Helper: obtener enfermedad_id por patrón de nombre
+    def get_enf_id(name_like):
+        row = db.fetchone(
+            "SELECT enfermedad_id FROM enfermedades WHERE nombre ILIKE %s ORDER BY gravedad DESC LIMIT 1",
+            (f"%{name_like}%",)
+        )
+        return row[0] if row else None
+
+    # Helper: obtener prueba_lab_id por nombre
+    def get_lab_id(name_like):
+        row = db.fetchone(
+            "SELECT prueba_lab_id FROM pruebas_lab_catalogo WHERE nombre ILIKE %s LIMIT 1",
+            (f"%{name_like}%",)
+        )
+        return row[0] if row else None
+
+    with db.transaction():
+        for item in RECOMMENDATION_SEEDS:
+            enf_id = get_enf_id(item["name"])
+            if not enf_id:
+                continue
+            # Insertar tratamientos
+            for t in item["tx"]:
+                nombre_tx, indic, tipo, prioridad = t
+                db.query(
+                    """
+                    INSERT INTO enfermedad_tratamientos_recomendados
+                    (enfermedad_id, tratamiento, indicaciones, tipo, prioridad)
+                    VALUES (%s,%s,%s,%s,%s)
+                    ON CONFLICT (enfermedad_id, tratamiento) DO NOTHING
+                    """,
+                    (enf_id, nombre_tx, indic, tipo, prioridad)
+                )
+
+            # Insertar pruebas: si existen en catálogo, se relacionan; si no, se guardan como texto
+            for l in item["labs"]:
+                nombre_lab, nota, urgencia = l
+                lab_id = get_lab_id(nombre_lab)
+                if lab_id:
+                    db.query(
+                        """
+                        INSERT INTO enfermedad_pruebas_recomendadas
+                        (enfermedad_id, prueba_lab_id, nota, urgencia)
+                        VALUES (%s,%s,%s,%s)
+                        ON CONFLICT (enfermedad_id, prueba_lab_id) DO NOTHING
+                        """,
+                        (enf_id, lab_id, nota, urgencia)
+                    )
+                else:
+                    db.query(
+                        """
+                        INSERT INTO enfermedad_pruebas_texto_recomendadas
+                        (enfermedad_id, nombre, nota, urgencia)
+                        VALUES (%s,%s,%s,%s)
+                        ON CONFLICT (enfermedad_id, nombre) DO NOTHING
+                        """,
+                        (enf_id, nombre_lab, nota, urgencia)
+                    )
+
+
+# ---------- Índices para las rutas de consulta más usadas ----------
+HOT_PATH_INDEXES = [
+    # Encuentros de un paciente, más recientes primero (EncuentrosFrame, DiagnosticoDialog)
+    "CREATE INDEX IF NOT EXISTS idx_encuentros_paciente_fecha ON encuentros (paciente_id, fecha DESC)",
+    # Listados de diagnósticos por fecha (DiagnosticosFrame, TratamientoDialog)
+    "CREATE INDEX IF NOT EXISTS idx_diagnosticos_created_at ON diagnosticos (created_at DESC)",
+    # Búsqueda de pacientes por nombre con ILIKE '%q%' y similitud
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS idx_pacientes_nombre_trgm ON pacientes USING gin (nombre gin_trgm_ops)",
+    # Recomendaciones por enfermedad, ya en el orden en que se muestran
+    """CREATE INDEX IF NOT EXISTS idx_etr_enfermedad_prioridad
+       ON enfermedad_tratamientos_recomendados (enfermedad_id, (COALESCE(prioridad, 99)), tratamiento)""",
+    """CREATE INDEX IF NOT EXISTS idx_epr_enfermedad_urgencia
+       ON enfermedad_pruebas_recomendadas (enfermedad_id, (COALESCE(urgencia, 99)))""",
+    """CREATE INDEX IF NOT EXISTS idx_eptr_enfermedad_urgencia
+       ON enfermedad_pruebas_texto_recomendadas (enfermedad_id, (COALESCE(urgencia, 99)), nombre)""",
+    # Claves foráneas sin índice (comprobaciones de UsuarioDialog.delete y joins)
+    "CREATE INDEX IF NOT EXISTS idx_encuentros_created_by ON encuentros (created_by)",
+    "CREATE INDEX IF NOT EXISTS idx_diagnosticos_created_by ON diagnosticos (created_by)",
+    "CREATE INDEX IF NOT EXISTS idx_tratamientos_prescrito_por ON tratamientos (prescrito_por)",
+    "CREATE INDEX IF NOT EXISTS idx_diagnosticos_paciente ON diagnosticos (paciente_id)",
+    "CREATE INDEX IF NOT EXISTS idx_diagnosticos_encuentro ON diagnosticos (encuentro_id)",
+    "CREATE INDEX IF NOT EXISTS idx_diagnosticos_enfermedad ON diagnosticos (enfermedad_id)",
+    "CREATE INDEX IF NOT EXISTS idx_tratamientos_diagnostico ON tratamientos (diagnostico_id)",
+    "CREATE INDEX IF NOT EXISTS idx_obs_signos_encuentro ON observacion_signos (encuentro_id)",
+    "CREATE INDEX IF NOT EXISTS idx_obs_sintomas_encuentro ON observacion_sintomas (encuentro_id)",
+]
+
+# ---------- Índices para la paginación keyset (paginacion.KeysetSource) ----------
+# Deben coincidir con la expresión de orden por defecto de cada listado,
+# incluido el COALESCE de las columnas nulables.
+KEYSET_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_pacientes_nombre_id ON pacientes (nombre, paciente_id)",
+    "CREATE INDEX IF NOT EXISTS idx_usuarios_nombre_id ON usuarios (nombre, usuario_id)",
+    """CREATE INDEX IF NOT EXISTS idx_diagnosticos_keyset_fecha
+       ON diagnosticos ((COALESCE(created_at, '-infinity'::timestamptz)), diagnostico_id)""",
+    """CREATE INDEX IF NOT EXISTS idx_tratamientos_keyset_inicio
+       ON tratamientos ((COALESCE(inicio_fecha, '-infinity'::date)), tratamiento_id)""",
+]
+
+# ---------- Búsqueda de pacientes por prefijo de identificación ----------
+PATIENT_SEARCH_INDEXES = [
+    """CREATE INDEX IF NOT EXISTS idx_pacientes_numero_id_prefijo
+       ON pacientes (lower(numero_identificacion) text_pattern_ops)""",
+]
+
+# ---------- Mapa id de regla -> enfermedad (catalogos.DiseaseMap) ----------
+RULE_DISEASE_MAP_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS regla_enfermedad_map (
+      rule_key VARCHAR(100) PRIMARY KEY,
+      enfermedad_id INT NOT NULL REFERENCES enfermedades(enfermedad_id) ON DELETE CASCADE,
+      metodo VARCHAR(20) NOT NULL, -- alias / nombre / aproximado
+      updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+    )
+    """,
+]
+
+# ---------- Marcas de cambio para refrescar listados por diferencias ----------
+# updated_at lo mantiene un trigger (clock_timestamp(), no now(), para que
+# dos cambios de una misma transacción larga no compartan marca) y cada
+# DELETE deja una lápida en filas_eliminadas. Con ambos, un listado pide
+# solo lo cambiado desde su última carga (paginacion.KeysetSource.build_changes_query).
+CHANGE_TRACKED_TABLES = {
+    "usuarios": "usuario_id",
+    "pacientes": "paciente_id",
+    "enfermedades": "enfermedad_id",
+    "diagnosticos": "diagnostico_id",
+    "tratamientos": "tratamiento_id",
+}
+
+CHANGE_TRACKING_FUNCTIONS = [
+    """
+    CREATE OR REPLACE FUNCTION marcar_updated_at() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+      NEW.updated_at := clock_timestamp();
+      RETURN NEW;
+    END
+    $$
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS filas_eliminadas (
+      tabla VARCHAR(63) NOT NULL,
+      pk BIGINT NOT NULL,
+      eliminado_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT clock_timestamp()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_filas_eliminadas_tabla_fecha ON filas_eliminadas (tabla, eliminado_at)",
+    """
+    CREATE OR REPLACE FUNCTION registrar_eliminacion() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+      -- TG_ARGV[0]: nombre de la columna clave primaria
+      INSERT INTO filas_eliminadas (tabla, pk)
+      VALUES (TG_TABLE_NAME, (to_jsonb(OLD) ->> TG_ARGV[0])::bigint);
+      RETURN OLD;
+    END
+    $$
+    """,
+]
+
+
+def _change_tracking_statements(table, pk):
+    return [
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE",
+        f"UPDATE {table} SET updated_at = COALESCE(created_at, now()) WHERE updated_at IS NULL",
+        f"ALTER TABLE {table} ALTER COLUMN updated_at SET DEFAULT clock_timestamp()",
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_updated_at ON {table} (updated_at)",
+        f"DROP TRIGGER IF EXISTS trg_{table}_updated_at ON {table}",
+        f"""CREATE TRIGGER trg_{table}_updated_at BEFORE UPDATE ON {table}
+            FOR EACH ROW EXECUTE PROCEDURE marcar_updated_at()""",
+        f"DROP TRIGGER IF EXISTS trg_{table}_eliminada ON {table}",
+        f"""CREATE TRIGGER trg_{table}_eliminada AFTER DELETE ON {table}
+            FOR EACH ROW EXECUTE PROCEDURE registrar_eliminacion('{pk}')""",
+    ]
+
+
+CHANGE_TRACKING = CHANGE_TRACKING_FUNCTIONS + [
+    sql for table, pk in CHANGE_TRACKED_TABLES.items() for sql in _change_tracking_statements(table, pk)
+]
+
+# ---------- Auditoría de inferencias (auditoria.py) ----------
+# Solo se admiten INSERT: un trigger rechaza UPDATE y DELETE para que el
+# registro sea de solo anexado.
+AUDIT_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS auditoria_inferencias (
+      auditoria_id BIGSERIAL PRIMARY KEY,
+      ts TIMESTAMP WITH TIME ZONE NOT NULL,
+      registrado_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+      usuario_id INTEGER,
+      paciente_id INTEGER,
+      encuentro_id INTEGER,
+      evidencia JSONB NOT NULL,
+      version_reglas VARCHAR(64) NOT NULL,
+      resultado JSONB NOT NULL,
+      duracion_ms NUMERIC(12,3)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_auditoria_inferencias_ts ON auditoria_inferencias (ts)",
+    "CREATE INDEX IF NOT EXISTS idx_auditoria_inferencias_paciente ON auditoria_inferencias (paciente_id, ts)",
+    """
+    CREATE OR REPLACE FUNCTION auditoria_solo_anexar() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+      RAISE EXCEPTION 'auditoria_inferencias es de solo anexado (% no permitido)', TG_OP;
+    END
+    $$
+    """,
+    "DROP TRIGGER IF EXISTS trg_auditoria_solo_anexar ON auditoria_inferencias",
+    """CREATE TRIGGER trg_auditoria_solo_anexar BEFORE UPDATE OR DELETE ON auditoria_inferencias
+       FOR EACH ROW EXECUTE PROCEDURE auditoria_solo_anexar()""",
+]
+
+# ---------- Agregados del tablero (analitica.py) ----------
+# Sin clave primaria: cada semana se borra y se recalcula entera. Las
+# lápidas de las tablas agregadas guardan la semana de la fila borrada
+# (segundo argumento de registrar_eliminacion: la columna de fecha), así
+# un borrado solo ensucia esa semana. Las observaciones también dejan
+# lápida al borrarse.
+ANALYTICS_TABLES = [
+    "ALTER TABLE filas_eliminadas ADD COLUMN IF NOT EXISTS semana DATE",
+    """
+    CREATE OR REPLACE FUNCTION registrar_eliminacion() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    DECLARE
+      fila jsonb := to_jsonb(OLD);
+      semana date;
+    BEGIN
+      -- TG_ARGV[0]: columna clave primaria; TG_ARGV[1] (opcional): columna
+      -- de fecha por la que se agrupa la fila en los agregados semanales
+      IF TG_NARGS > 1 THEN
+        semana := date_trunc('week', (fila ->> TG_ARGV[1])::timestamptz)::date;
+      END IF;
+      INSERT INTO filas_eliminadas (tabla, pk, semana)
+      VALUES (TG_TABLE_NAME, (fila ->> TG_ARGV[0])::bigint, semana);
+      RETURN OLD;
+    END
+    $$
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS agregados_estado (
+      nombre VARCHAR(63) PRIMARY KEY,
+      marca TIMESTAMP WITH TIME ZONE,
+      refrescado_at TIMESTAMP WITH TIME ZONE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS agg_diagnosticos_semana (
+      semana DATE NOT NULL,
+      enfermedad_id INTEGER NOT NULL,
+      usuario_id INTEGER NOT NULL,
+      tipo VARCHAR(50) NOT NULL,
+      total BIGINT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_agg_diagnosticos_semana ON agg_diagnosticos_semana (semana)",
+    """
+    CREATE TABLE IF NOT EXISTS agg_tratamientos_semana (
+      semana DATE NOT NULL,
+      estado VARCHAR(50) NOT NULL,
+      total BIGINT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_agg_tratamientos_semana ON agg_tratamientos_semana (semana)",
+    """
+    CREATE TABLE IF NOT EXISTS agg_signos_semana (
+      semana DATE NOT NULL,
+      signo_id INTEGER NOT NULL,
+      total BIGINT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_agg_signos_semana ON agg_signos_semana (semana)",
+    """
+    CREATE TABLE IF NOT EXISTS agg_sintomas_semana (
+      semana DATE NOT NULL,
+      sintoma_id INTEGER NOT NULL,
+      total BIGINT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_agg_sintomas_semana ON agg_sintomas_semana (semana)",
+    # Rangos por fecha de creación al recalcular una semana
+    "CREATE INDEX IF NOT EXISTS idx_tratamientos_created_at ON tratamientos (created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_obs_signos_recorded_at ON observacion_signos (recorded_at)",
+    "CREATE INDEX IF NOT EXISTS idx_obs_sintomas_recorded_at ON observacion_sintomas (recorded_at)",
+] + [
+    sql
+    for table, pk in (("diagnosticos", "diagnostico_id"), ("tratamientos", "tratamiento_id"))
+    for sql in (
+        f"DROP TRIGGER IF EXISTS trg_{table}_eliminada ON {table}",
+        f"""CREATE TRIGGER trg_{table}_eliminada AFTER DELETE ON {table}
+            FOR EACH ROW EXECUTE PROCEDURE registrar_eliminacion('{pk}', 'created_at')""",
+    )
+] + [
+    sql
+    for table, pk in (("observacion_signos", "observacion_signo_id"),
+                      ("observacion_sintomas", "observacion_sintoma_id"))
+    for sql in (
+        # recorded_at es la fecha clínica (la importación la trae del CSV, en
+        # el pasado): la marca del refresco incremental usa la de inserción
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITH TIME ZONE",
+        f"UPDATE {table} SET created_at = COALESCE(recorded_at, now()) WHERE created_at IS NULL",
+        f"ALTER TABLE {table} ALTER COLUMN created_at SET DEFAULT clock_timestamp()",
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_created_at ON {table} (created_at)",
+        f"DROP TRIGGER IF EXISTS trg_{table}_eliminada ON {table}",
+        f"""CREATE TRIGGER trg_{table}_eliminada AFTER DELETE ON {table}
+            FOR EACH ROW EXECUTE PROCEDURE registrar_eliminacion('{pk}', 'recorded_at')""",
+    )
+]
+
+# ---------- Evidencia por encuentro para cohortes (cohortes.py) ----------
+# Un arreglo ordenado de signo_id y otro de sintoma_id por encuentro, con
+# índices GIN para @> / &&. Los mantienen triggers de sentencia con tablas
+# de transición: un COPY o INSERT masivo recalcula cada encuentro tocado
+# una sola vez.
+_TRANSITION_TABLES = {
+    "INSERT": "NEW TABLE AS nuevas",
+    "UPDATE": "OLD TABLE AS viejas NEW TABLE AS nuevas",
+    "DELETE": "OLD TABLE AS viejas",
+}
+
+EVIDENCE_ARRAYS = [
+    """
+    CREATE TABLE IF NOT EXISTS evidencia_encuentros (
+      encuentro_id INTEGER PRIMARY KEY REFERENCES encuentros(encuentro_id) ON DELETE CASCADE,
+      paciente_id INTEGER NOT NULL,
+      fecha TIMESTAMP WITH TIME ZONE,
+      signos INTEGER[] NOT NULL DEFAULT '{}',
+      sintomas INTEGER[] NOT NULL DEFAULT '{}'
+    )
+    """,
+    """
+    INSERT INTO evidencia_encuentros (encuentro_id, paciente_id, fecha, signos, sintomas)
+    SELECT e.encuentro_id, e.paciente_id, e.fecha, COALESCE(s.ids, '{}'), COALESCE(t.ids, '{}')
+    FROM encuentros e
+    LEFT JOIN (SELECT encuentro_id, array_agg(DISTINCT signo_id ORDER BY signo_id) AS ids
+               FROM observacion_signos GROUP BY encuentro_id) s ON s.encuentro_id = e.encuentro_id
+    LEFT JOIN (SELECT encuentro_id, array_agg(DISTINCT sintoma_id ORDER BY sintoma_id) AS ids
+               FROM observacion_sintomas GROUP BY encuentro_id) t ON t.encuentro_id = e.encuentro_id
+    ON CONFLICT (encuentro_id) DO NOTHING
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_evidencia_signos ON evidencia_encuentros USING gin (signos)",
+    "CREATE INDEX IF NOT EXISTS idx_evidencia_sintomas ON evidencia_encuentros USING gin (sintomas)",
+    "CREATE INDEX IF NOT EXISTS idx_evidencia_fecha ON evidencia_encuentros (fecha)",
+    "CREATE INDEX IF NOT EXISTS idx_evidencia_paciente ON evidencia_encuentros (paciente_id)",
+    """
+    CREATE OR REPLACE FUNCTION refrescar_evidencia_encuentros(ids INTEGER[]) RETURNS void
+    LANGUAGE sql AS $$
+      INSERT INTO evidencia_encuentros (encuentro_id, paciente_id, fecha, signos, sintomas)
+      SELECT e.encuentro_id, e.paciente_id, e.fecha,
+             COALESCE((SELECT array_agg(DISTINCT os.signo_id ORDER BY os.signo_id)
+                       FROM observacion_signos os WHERE os.encuentro_id = e.encuentro_id), '{}'),
+             COALESCE((SELECT array_agg(DISTINCT ob.sintoma_id ORDER BY ob.sintoma_id)
+                       FROM observacion_sintomas ob WHERE ob.encuentro_id = e.encuentro_id), '{}')
+      FROM encuentros e
+      WHERE e.encuentro_id = ANY(ids)
+      ON CONFLICT (encuentro_id) DO UPDATE
+        SET paciente_id = EXCLUDED.paciente_id, fecha = EXCLUDED.fecha,
+            signos = EXCLUDED.signos, sintomas = EXCLUDED.sintomas
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION evidencia_tras_cambio() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    DECLARE
+      ids INTEGER[];
+    BEGIN
+      -- nuevas/viejas: tablas de transición declaradas en cada trigger
+      IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT encuentro_id) INTO ids FROM nuevas;
+      ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT encuentro_id) INTO ids FROM viejas;
+      ELSE
+        SELECT array_agg(encuentro_id) INTO ids
+        FROM (SELECT encuentro_id FROM nuevas UNION SELECT encuentro_id FROM viejas) x;
+      END IF;
+      IF ids IS NOT NULL THEN
+        -- Serializa a quienes tocan el mismo encuentro: tras esperar el
+        -- bloqueo, el recálculo toma una instantánea nueva (READ COMMITTED)
+        -- y ve las observaciones que la otra transacción ya confirmó. NO KEY
+        -- UPDATE no choca con el FOR KEY SHARE de las claves foráneas.
+        PERFORM 1 FROM encuentros WHERE encuentro_id = ANY(ids)
+        ORDER BY encuentro_id FOR NO KEY UPDATE;
+        PERFORM refrescar_evidencia_encuentros(ids);
+      END IF;
+      RETURN NULL;
+    END
+    $$
+    """,
+] + [
+    sql
+    for table, events in (("encuentros", ("INSERT", "UPDATE")),
+                          ("observacion_signos", ("INSERT", "UPDATE", "DELETE")),
+                          ("observacion_sintomas", ("INSERT", "UPDATE", "DELETE")))
+    for event in events
+    for sql in (
+        f"DROP TRIGGER IF EXISTS trg_{table}_evidencia_{event.lower()} ON {table}",
+        f"""CREATE TRIGGER trg_{table}_evidencia_{event.lower()} AFTER {event} ON {table}
+            REFERENCING {_TRANSITION_TABLES[event]}
+            FOR EACH STATEMENT EXECUTE PROCEDURE evidencia_tras_cambio()""",
+    )
+]
+
+MIGRATIONS = [
+    Migration(1, "esquema_base", func=apply_base_schema),
+    Migration(2, "tablas_recomendaciones", RECOMMENDATION_TABLES),
+    Migration(3, "semilla_recomendaciones", func=seed_recommendations),
+    Migration(4, "indices_rutas_calientes", HOT_PATH_INDEXES),
+    Migration(5, "indices_paginacion_keyset", KEYSET_INDEXES),
+    Migration(6, "indice_prefijo_identificacion", PATIENT_SEARCH_INDEXES),
+    Migration(7, "funcion_recomendaciones", [RECOMMENDATIONS_FUNCTION]),
+    Migration(8, "mapa_regla_enfermedad", RULE_DISEASE_MAP_TABLES),
+    Migration(9, "hashes_bcrypt_canonicos", func=canonicalize_stored_hashes),
+    Migration(10, "marcas_de_cambio", CHANGE_TRACKING),
+    Migration(11, "auditoria_inferencias", AUDIT_TABLES),
+    Migration(12, "agregados_tablero", ANALYTICS_TABLES),
+    Migration(13, "evidencia_por_encuentro", EVIDENCE_ARRAYS),
+]
+
+
+def applied_versions(db):
+    """Conjunto de versiones aplicadas (crea schema_version si no existe)."""
+    try:
+        rows = db.fetchall("SELECT version FROM schema_version")
+    except Exception:
+        db.query(SCHEMA_VERSION_DDL)
+        rows = []
+    return {r[0] for r in rows}
+
+
+def pending_migrations(db, migrations=None):
+    done = applied_versions(db)
+    todo = [m for m in (migrations or MIGRATIONS) if m.version not in done]
+    return sorted(todo, key=lambda m: m.version)
+
+
+def apply_pending(db, migrations=None):
+    """Aplica las migraciones pendientes en una sola transacción. Devuelve las aplicadas."""
+    todo = pending_migrations(db, migrations)
+    if not todo:
+        return []
+    with db.transaction():
+        for m in todo:
+            m.apply(db)
+            db.query(
+                "INSERT INTO schema_version (version, nombre) VALUES (%s, %s)",
+                (m.version, m.nombre)
+            )
+    return todo
+
+
+# ---------- Verificación con EXPLAIN ----------
+# (nombre, sql, params, índices aceptables)
+INDEX_CHECKS = [
+    (
+        "encuentros_por_paciente",
+        "SELECT encuentro_id, fecha, tipo_encuentro, motivo FROM encuentros WHERE paciente_id=%s ORDER BY fecha DESC",
+        (1,),
+        ("idx_encuentros_paciente_fecha",),
+    ),
+    (
+        "diagnosticos_recientes",
+        "SELECT diagnostico_id, created_at FROM diagnosticos ORDER BY created_at DESC LIMIT 100",
+        (),
+        ("idx_diagnosticos_created_at",),
+    ),
+    (
+        "pacientes_por_nombre",
+        "SELECT paciente_id, nombre FROM pacientes WHERE nombre ILIKE %s",
+        ("%gonz%",),
+        ("idx_pacientes_nombre_trgm",),
+    ),
+    (
+        "tratamientos_recomendados",
+        """SELECT tratamiento FROM enfermedad_tratamientos_recomendados
+           WHERE enfermedad_id = %s ORDER BY COALESCE(prioridad, 99), tratamiento""",
+        (1,),
+        ("idx_etr_enfermedad_prioridad", "enfermedad_tratamientos_recomendados_enfermedad_id_tratamiento_key"),
+    ),
+    (
+        "pruebas_recomendadas",
+        "SELECT prueba_lab_id FROM enfermedad_pruebas_recomendadas WHERE enfermedad_id = %s",
+        (1,),
+        ("idx_epr_enfermedad_urgencia", "enfermedad_pruebas_recomendadas_enfermedad_id_prueba_lab_id_key"),
+    ),
+    (
+        "pacientes_primera_pagina",
+        "SELECT paciente_id, nombre FROM pacientes ORDER BY nombre ASC, paciente_id ASC LIMIT 201",
+        (),
+        ("idx_pacientes_nombre_id",),
+    ),
+    (
+        "diagnosticos_pagina_siguiente",
+        """SELECT diagnostico_id FROM diagnosticos
+           WHERE (COALESCE(created_at, '-infinity'::timestamptz), diagnostico_id) < (now(), %s)
+           ORDER BY COALESCE(created_at, '-infinity'::timestamptz) DESC, diagnostico_id DESC LIMIT 201""",
+        (1000000,),
+        ("idx_diagnosticos_keyset_fecha",),
+    ),
+    (
+        "encuentros_por_usuario",
+        "SELECT 1 FROM encuentros WHERE created_by = %s",
+        (1,),
+        ("idx_encuentros_created_by",),
+    ),
+    (
+        "diagnosticos_por_usuario",
+        "SELECT 1 FROM diagnosticos WHERE created_by = %s",
+        (1,),
+        ("idx_diagnosticos_created_by",),
+    ),
+    (
+        "tratamientos_por_usuario",
+        "SELECT 1 FROM tratamientos WHERE prescrito_por = %s",
+        (1,),
+        ("idx_tratamientos_prescrito_por",),
+    ),
+]
+
+_INDEX_NODES = ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []) or []:
+        yield from _plan_nodes(child)
+
+
+def _explain_json(db, sql, params):
+    row = db.fetchone("EXPLAIN (FORMAT JSON) " + sql, params)
+    data = row[0]
+    if isinstance(data, str):
+        data = json.loads(data)
+    return data[0]["Plan"]
+
+
+def check_index_usage(db, checks=None):
+    """
+    Ejecuta EXPLAIN de cada consulta caliente y comprueba si usa un índice esperado.
+
+    En tablas pequeñas el planificador prefiere Seq Scan aunque el índice
+    exista, así que cada consulta se evalúa dos veces: con el plan natural
+    y con enable_seqscan desactivado (para saber si el índice es utilizable).
+    Devuelve una lista de dicts con el resultado por consulta.
+    """
+    results = []
+    for nombre, sql, params, expected in (checks or INDEX_CHECKS):
+        item = {"nombre": nombre, "expected": list(expected)}
+        try:
+            natural = _explain_json(db, sql, params)
+            item["natural_indexes"] = sorted({
+                n.get("Index Name") for n in _plan_nodes(natural) if n.get("Node Type") in _INDEX_NODES
+            })
+            try:
+                with db.transaction():
+                    db.query("SET LOCAL enable_seqscan = off")
+                    forced = _explain_json(db, sql, params)
+                    raise _Rollback()
+            except _Rollback:
+                pass
+            item["forced_indexes"] = sorted({
+                n.get("Index Name") for n in _plan_nodes(forced) if n.get("Node Type") in _INDEX_NODES
+            })
+            item["uses_index"] = any(ix in item["natural_indexes"] for ix in expected)
+            item["index_usable"] = any(ix in item["forced_indexes"] for ix in expected)
+        except Exception as e:
+            item["error"] = str(e)
+            item["uses_index"] = item["index_usable"] = False
+        results.append(item)
+    return results
+
+
+class _Rollback(Exception):
+    """Fuerza ROLLBACK de la transacción de verificación (SET LOCAL no persiste)."""
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    cmd = argv[0] if argv else "migrate"
+    from database import db
+
+    if cmd == "migrate":
+        applied = apply_pending(db)
+        if applied:
+            for m in applied:
+                print(f"aplicada {m.version:04d} {m.nombre}")
+        else:
+            print("esquema al día")
+        return 0
+    if cmd == "check":
+        ok = True
+        for r in check_index_usage(db):
+            estado = "OK" if r["index_usable"] else "FALTA"
+            ok = ok and r["index_usable"]
+            print(f"{estado:6} {r['nombre']:28} natural={r.get('natural_indexes')} "
+                  f"forzado={r.get('forced_indexes')} {r.get('error', '')}")
+        return 0 if ok else 1
+    print(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
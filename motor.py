@@ -0,0 +1,599 @@
+# motor.py
+"""
+Motor de inferencia por reglas: Rule, InferenceEngine, el vocabulario de
+signos y síntomas (SIGNOS_LIST, SINTOMAS_LIST, SYNONYMS) y las reglas
+(RULES). Sin dependencias de GUI ni de BD, para poder usarlo en procesos
+por lotes:
+
+    python motor.py evidencias.jsonl > diferenciales.jsonl
+    cat evidencias.jsonl | python motor.py --top 3 --workers 4
+
+Cada línea de entrada es un objeto JSON con "signos" y "sintomas" (listas
+de claves; se aceptan sinónimos) y opcionalmente "id". Cada línea de
+salida repite el "id" y trae "diferencial": [{"enfermedad", "probabilidad",
+"origen"}], en el mismo orden que la entrada.
+"""
+import argparse
+import hashlib
+import json
+import sys
+from typing import Any, Dict, Iterable, List, Mapping, Set, Tuple
+
+
+class Rule:
+    def __init__(
+        self,
+        enfermedad_id: Any,
+        required_signs: Iterable[str] = None,
+        required_symptoms: Iterable[str] = None,
+        optional_signs: Mapping[str, float] = None,
+        optional_symptoms: Mapping[str, float] = None,
+        rule_weight: float = 1.0,
+        sign_vs_symptom_balance: float = 0.5,
+        rule_id: Any = None
+    ):
+        self.rule_id = rule_id
+        self.enfermedad_id = enfermedad_id
+        self.required_signs = set(required_signs or [])
+        self.required_symptoms = set(required_symptoms or [])
+        self.optional_signs = dict(optional_signs or {})
+        self.optional_symptoms = dict(optional_symptoms or {})
+        self.rule_weight = float(rule_weight)
+        self.sign_vs_symptom_balance = float(sign_vs_symptom_balance)
+
+        # validaciones simples
+        if self.rule_weight < 0:
+            raise ValueError("rule_weight debe ser >= 0")
+        if not (0.0 <= self.sign_vs_symptom_balance <= 1.0):
+            raise ValueError("sign_vs_symptom_balance debe estar en [0,1]")
+        for w in list(self.optional_signs.values()) + list(self.optional_symptoms.values()):
+            if w < 0:
+                raise ValueError("pesos en optional_signs/optional_symptoms deben ser >= 0")
+
+    def _partial_score(self, optional_map: Mapping[str, float], evidence_set: Set[str]):
+        total_w = sum(optional_map.values())
+        if total_w <= 0:
+            return None
+        present_w = sum(w for s, w in optional_map.items() if s in evidence_set)
+        return float(present_w / total_w)
+
+    def match_score(self, present_signs: Set[str], present_symptoms: Set[str]) -> Tuple[float, Dict[str, Any]]:
+        """
+        Retorna (raw_score, breakdown). Si falta required devuelve score 0 y breakdown con razón.
+        raw_score está en rango [0, rule_weight].
+        """
+        # required checks
+        if self.required_signs and not self.required_signs.issubset(present_signs):
+            return 0.0, {"reason": "missing_required_signs", "missing": list(self.required_signs - present_signs)}
+        if self.required_symptoms and not self.required_symptoms.issubset(present_symptoms):
+            return 0.0, {"reason": "missing_required_symptoms", "missing": list(self.required_symptoms - present_symptoms)}
+
+        signs_partial = self._partial_score(self.optional_signs, present_signs)
+        symptoms_partial = self._partial_score(self.optional_symptoms, present_symptoms)
+
+        if signs_partial is None:
+            signs_score = 1.0 if self.required_signs else 0.0
+        else:
+            signs_score = signs_partial
+
+        if symptoms_partial is None:
+            symptoms_score = 1.0 if self.required_symptoms else 0.0
+        else:
+            symptoms_score = symptoms_partial
+
+        balance = self.sign_vs_symptom_balance
+        combined = balance * signs_score + (1.0 - balance) * symptoms_score
+        raw_score = float(self.rule_weight * combined)
+
+        breakdown = {
+            "rule_id": self.rule_id,
+            "enfermedad_id": self.enfermedad_id,
+            "required_signs": list(self.required_signs),
+            "required_symptoms": list(self.required_symptoms),
+            "signs_score": signs_score,
+            "symptoms_score": symptoms_score,
+            "combined_ratio": combined,
+            "rule_weight": self.rule_weight,
+            "raw_score": raw_score
+        }
+        return raw_score, breakdown
+
+    def match_score_ignore_required(self, present_signs: Set[str], present_symptoms: Set[str]) -> Tuple[float, Dict[str, Any]]:
+        """Versión suave que no falla por requireds (usada en fallback)."""
+        signs_partial = self._partial_score(self.optional_signs, present_signs)
+        symptoms_partial = self._partial_score(self.optional_symptoms, present_symptoms)
+
+        signs_score = 1.0 if signs_partial is None and self.required_signs else (signs_partial or 0.0)
+        symptoms_score = 1.0 if symptoms_partial is None and self.required_symptoms else (symptoms_partial or 0.0)
+
+        combined = self.sign_vs_symptom_balance * signs_score + (1 - self.sign_vs_symptom_balance) * symptoms_score
+        raw_score = float(self.rule_weight * combined)
+        return raw_score, {"note": "soft_ignore_required", "raw_score": raw_score}
+
+class InferenceEngine:
+    def __init__(self, rules: Iterable[Rule] = None):
+        self.rules: List[Rule] = list(rules or [])
+
+    def add_rule(self, rule: Rule) -> None:
+        self.rules.append(rule)
+
+    def infer(self, present_signs: Set[str], present_symptoms: Set[str]) -> List[Tuple[Any, float, List[Any]]]:
+        scores: Dict[Any, float] = {}
+        details: Dict[Any, List[Tuple[Any, float, Dict[str, Any]]]] = {}
+
+        for rule in self.rules:
+            s, breakdown = rule.match_score(present_signs, present_symptoms)
+            if s <= 0:
+                continue
+            eid = rule.enfermedad_id
+            scores[eid] = scores.get(eid, 0.0) + s
+            details.setdefault(eid, []).append((rule.rule_id, s, breakdown))
+
+        if not scores:
+            return []
+
+        total = sum(scores.values())
+        if total <= 1e-12:
+            n = len(scores)
+            results = []
+            for eid in scores:
+                prob = 100.0 / n
+                results.append((eid, prob, details.get(eid, [])))
+            results.sort(key=lambda x: x[1], reverse=True)
+            return results
+
+        results = []
+        for eid, v in scores.items():
+            prob = (v / total) * 100.0
+            results.append((eid, prob, details.get(eid, [])))
+        results.sort(key=lambda x: x[1], reverse=True)
+        return results
+
+
+SINTOMAS_LIST = [
+    ("fiebre", "Fiebre (sensación de calor)"),
+    ("escalofrios", "Escalofríos"),
+    ("tos", "Tos"),
+    ("disnea", "Disnea / Dificultad para respirar"),
+    ("dolor_pecho", "Dolor torácico / Dolor en el pecho"),
+    ("dolor_abdominal", "Dolor abdominal"),
+    ("nausea", "Náusea"),
+    ("vomito", "Vómito"),
+    ("diarrea", "Diarrea"),
+    ("cefalea", "Cefalea / Dolor de cabeza"),
+    ("mareo", "Mareo / Vértigo"),
+    ("confusion", "Confusión"),
+    ("perdida_conciencia", "Pérdida de conciencia"),
+    ("prurito", "Prurito"),
+    ("dolor_articular", "Dolor articular"),
+    ("dolor_muscular", "Dolor muscular"),
+    ("odinofagia", "Odinofagia / Dolor al tragar"),
+    ("rinorrea", "Secreción nasal / Rinorrea"),
+    ("estornudos", "Estornudos"),
+    ("anosmia", "Pérdida de olfato (Anosmia)"),
+    ("ageusia", "Pérdida de gusto (Ageusia)"),
+    ("fatiga", "Fatiga"),
+    ("sudoracion_nocturna", "Sudoración nocturna"),
+    ("dolor_pecho_radiado", "Dolor torácico irradiado"),
+    ("poliaquiuria", "Poliaquiuria / Micciones frecuentes"),
+    ("disuria", "Disuria / Dolor al orinar"),
+    ("diaforesis", "Diaforesis / Sudoración profusa"),
+    ("astenia", "Astenia / Debilidad general")
+]
+
+SIGNOS_LIST = [
+    ("fiebre_obj", "Fiebre (medida)"),
+    ("taquicardia", "Taquicardia"),
+    ("bradicardia", "Bradicardia"),
+    ("hipotension", "Hipotensión"),
+    ("hipertension", "Hipertensión"),
+    ("cianosis", "Cianosis"),
+    ("palidez", "Palidez"),
+    ("ictericia", "Ictericia"),
+    ("lesion_cutanea", "Lesión cutánea / Exantema"),
+    ("adenopatias", "Adenopatías palpables"),
+    ("taquipnea", "Taquipnea"),
+    ("bradipnea", "Bradipnea"),
+    ("hipoxia", "Hipoxia (SpO2 baja)"),
+    ("rales_respiratorios", "Rales / Crepitos"),
+    ("sibilancias", "Sibilancias"),
+    ("murmullo_reducido", "Murmullo vesicular reducido"),
+    ("distension_abdominal", "Distensión abdominal"),
+    ("hepatomegalia", "Hepatomegalia"),
+    ("esplenomegalia", "Esplenomegalia"),
+    ("signos_meningeos", "Signos meníngeos (rigidez nucal)"),
+    ("paresia_paralisis", "Paresia / Parálisis focal"),
+    ("arritmia", "Arritmia (observada/ECG)"),
+    ("edema_periferico", "Edema periférico"),
+    ("oliguria", "Oliguria"),
+    ("sincope", "Síncope observado"),
+    ("hemorragia_activa", "Hemorragia activa")
+]
+
+SYNONYMS = {
+    "dificultad_respiratoria": "disnea",
+    "dificultad-respiratoria": "disnea",
+    "polaquiuria": "poliaquiuria",
+    "congestion": "rinorrea",
+    "rash": "lesion_cutanea",
+    "rash_cutaneo": "lesion_cutanea",
+    "sudoracion": "diaforesis",
+    "sudoracion_nocturna": "sudoracion_nocturna",
+    "fiebre_medida": "fiebre_obj",
+    # añade más según sea necesario
+}
+
+def normalize_set(raw_set):
+    """Devuelve un set con las claves normalizadas por SYNONYMS."""
+    return {SYNONYMS.get(k, k) for k in raw_set}
+
+
+
+RULES = [
+    Rule(
+        enfermedad_id="Neumonia",
+        required_signs=["rales_respiratorios"],
+        required_symptoms=["fiebre"],
+        optional_signs={"hipoxia": 1.0, "taquipnea": 0.6, "fiebre_obj": 0.8},
+        optional_symptoms={"tos": 0.8, "dolor_pecho": 0.5, "disnea": 0.9},
+        rule_weight=1.6,
+        sign_vs_symptom_balance=0.7,
+        rule_id="r_neumo_1"
+    ),
+    Rule(
+        enfermedad_id="Bronquitis",
+        required_symptoms=["tos"],
+        optional_signs={"sibilancias": 0.6, "rales_respiratorios": 0.3},
+        optional_symptoms={"escalofrios": 0.2, "dolor_pecho": 0.2},
+        rule_weight=0.9,
+        sign_vs_symptom_balance=0.4,
+        rule_id="r_bronq_1"
+    ),
+    Rule(
+        enfermedad_id="Asma",
+        required_signs=["sibilancias"],
+        required_symptoms=["disnea"],
+        optional_signs={"taquipnea": 0.5},
+        optional_symptoms={"tos": 0.6, "fatiga": 0.2},
+        rule_weight=1.2,
+        sign_vs_symptom_balance=0.6,
+        rule_id="r_asma_1"
+    ),
+    Rule(
+        enfermedad_id="Gripe",
+        required_symptoms=["fiebre", "dolor_muscular"],
+        optional_signs={"fiebre_obj": 0.8},
+        optional_symptoms={"tos": 0.6, "rinorrea": 0.3, "anosmia": 0.1},
+        rule_weight=1.0,
+        sign_vs_symptom_balance=0.3,
+        rule_id="r_gripe_1"
+    ),
+    Rule(
+        enfermedad_id="Resfriado",
+        required_symptoms=["rinorrea"],
+        optional_symptoms={"estornudos": 0.7, "odinofagia": 0.3},
+        optional_signs={},
+        rule_weight=0.7,
+        sign_vs_symptom_balance=0.2,
+        rule_id="r_resf_1"
+    ),
+    Rule(
+        enfermedad_id="Sepsis",
+        required_signs=["hipoxia"],
+        required_symptoms=["fiebre"],
+        optional_signs={"taquicardia": 0.7, "hipotension": 0.8},
+        optional_symptoms={"confusion": 0.5, "oliguria": 0.6},
+        rule_weight=2.0,
+        sign_vs_symptom_balance=0.7,
+        rule_id="r_sepsis_1"
+    ),
+    Rule(
+        enfermedad_id="IAM",
+        required_symptoms=["dolor_pecho"],
+        optional_signs={"taquicardia": 0.4, "hipotension": 0.5, "arritmia": 0.6},
+        optional_symptoms={"diaforesis": 0.6, "mareo": 0.3, "nausea": 0.2},
+        rule_weight=1.8,
+        sign_vs_symptom_balance=0.5,
+        rule_id="r_iam_1"
+    ),
+    Rule(
+        enfermedad_id="Apendicitis",
+        required_symptoms=["dolor_abdominal"],
+        optional_signs={"distension_abdominal": 0.4, "fiebre_obj": 0.3},
+        optional_symptoms={"nausea": 0.6, "vomito": 0.5},
+        rule_weight=1.0,
+        sign_vs_symptom_balance=0.4,
+        rule_id="r_apend_1"
+    ),
+    Rule(
+        enfermedad_id="ITU",
+        required_symptoms=["disuria"],
+        optional_symptoms={"poliaquiuria": 0.8, "disuria": 1.0},
+        optional_signs={"fiebre_obj": 0.3},
+        rule_weight=0.8,
+        sign_vs_symptom_balance=0.2,
+        rule_id="r_itu_1"
+    ),
+    Rule(
+        enfermedad_id="Meningitis",
+        required_signs=["signos_meningeos"],
+        required_symptoms=["cefalea", "fiebre"],
+        optional_signs={"confusion": 0.6},
+        optional_symptoms={"vomito": 0.4},
+        rule_weight=1.9,
+        sign_vs_symptom_balance=0.8,
+        rule_id="r_mening_1"
+    ),
+    Rule(
+        enfermedad_id="Dengue",
+        required_symptoms=["fiebre", "dolor_muscular"],
+        optional_symptoms={"sudoracion_nocturna": 0.2, "prurito": 0.5},
+        optional_signs={"lesion_cutanea": 0.6, "hipotension": 0.4},
+        rule_weight=1.3,
+        sign_vs_symptom_balance=0.3,
+        rule_id="r_dengue_1"
+    ),
+    Rule(
+        enfermedad_id="Pancreatitis",
+        required_symptoms=["dolor_abdominal"],
+        optional_signs={"ictericia": 0.3},
+        optional_symptoms={"vomito": 0.6, "fiebre": 0.2},
+        rule_weight=1.1,
+        sign_vs_symptom_balance=0.3,
+        rule_id="r_pancr_1"
+    ),
+    Rule(
+        enfermedad_id="Hipoglucemia",
+        required_signs=[],
+        required_symptoms=["confusion", "mareo"],
+        optional_signs={"diaforesis": 0.6},
+        optional_symptoms={"diaforesis": 0.5},
+        rule_weight=1.0,
+        sign_vs_symptom_balance=0.2,
+        rule_id="r_hipo_1"
+    )
+]
+
+# Ids de enfermedad usados por las reglas (se vinculan al catálogo con catalog_store.disease_map)
+RULE_IDS = sorted({str(r.enfermedad_id) for r in RULES})
+
+
+def rules_version(rules):
+    """Huella corta del contenido de las reglas (cambia si cambia cualquier regla o peso)."""
+    canonical = [
+        {
+            "rule_id": r.rule_id, "enfermedad_id": str(r.enfermedad_id),
+            "required_signs": sorted(r.required_signs), "required_symptoms": sorted(r.required_symptoms),
+            "optional_signs": sorted(r.optional_signs.items()), "optional_symptoms": sorted(r.optional_symptoms.items()),
+            "rule_weight": r.rule_weight, "balance": r.sign_vs_symptom_balance,
+        }
+        for r in rules
+    ]
+    canonical.sort(key=lambda d: (str(d["rule_id"]), d["enfermedad_id"]))
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+RULES_VERSION = rules_version(RULES)
+
+def validate_rules(rules, sintomas_list, signos_list):
+    import difflib
+    valid_sintomas = {k for k, _ in sintomas_list}
+    valid_signos = {k for k, _ in signos_list}
+    report = {}
+    for rule in rules:
+        unknown = {"required_signs": [], "required_symptoms": [],
+                   "optional_signs": [], "optional_symptoms": []}
+
+        def check_iterables(iterable, target_set, bucket):
+            for item in (iterable or []):
+                if item not in target_set:
+                    bucket.append(item)
+
+        check_iterables(rule.required_signs, valid_signos, unknown["required_signs"])
+        check_iterables(rule.required_symptoms, valid_sintomas, unknown["required_symptoms"])
+        check_iterables(rule.optional_signs.keys(), valid_signos, unknown["optional_signs"])
+        check_iterables(rule.optional_symptoms.keys(), valid_sintomas, unknown["optional_symptoms"])
+
+        # sugerir correcciones
+        suggestions = {}
+        for cat, items in unknown.items():
+            suggestions[cat] = {}
+            target = valid_signos if "sign" in cat else valid_sintomas
+            for it in items:
+                cands = difflib.get_close_matches(it, target, n=3, cutoff=0.5)
+                suggestions[cat][it] = cands
+        report[rule.rule_id or str(rule.enfermedad_id)] = {"unknown": unknown, "suggestions": suggestions}
+    return report
+
+
+def differential(engine, present_signs, present_symptoms):
+    """
+    Diferencial combinado: resultados firmes (respetan los requeridos) y,
+    para las enfermedades que no salieron firmes, los suaves (ignoran los
+    requeridos), renormalizados para sumar 100.
+
+    Devuelve {"mode", "firm", "soft", "combined", "sources"}; combined es
+    [(enfermedad_id, prob_pct, detalles)] ordenado por probabilidad y
+    sources indica "firm" o "soft" por enfermedad.
+    """
+    # 1) Resultados firmes (respetan requireds)
+    firm_results = engine.infer(present_signs, present_symptoms)  # [(eid, prob_pct, details), ...]
+
+    # 2) Resultados suaves (ignoran requireds)
+    soft_scores = {}
+    soft_details = {}
+    for rule in engine.rules:
+        s, breakdown = rule.match_score_ignore_required(present_signs, present_symptoms)
+        if s <= 0:
+            continue
+        eid = rule.enfermedad_id
+        soft_scores[eid] = soft_scores.get(eid, 0.0) + s
+        soft_details.setdefault(eid, []).append((rule.rule_id, s, breakdown))
+
+    soft_results = []
+    if soft_scores:
+        total_soft = sum(soft_scores.values())
+        soft_results = [(eid, (v / total_soft) * 100.0, soft_details.get(eid, [])) for eid, v in soft_scores.items()]
+        soft_results.sort(key=lambda x: x[1], reverse=True)
+
+    # 3) Combinar: mantener probabilidades firmes, añadir suaves para eids no presentes
+    combined_map = {}
+    for eid, prob_pct, details in firm_results:
+        combined_map[eid] = {"score": prob_pct, "details": list(details), "source": "firm"}
+    for eid, prob_pct, details in soft_results:
+        if eid in combined_map:
+            # ya existe firme, no sobrescribir pero agregar detalles
+            combined_map[eid]["details"].extend(details)
+        else:
+            combined_map[eid] = {"score": prob_pct, "details": details, "source": "soft"}
+
+    if not combined_map:
+        return {"mode": "none", "firm": [], "soft": [], "combined": [], "sources": {}}
+
+    # 4) Normalizar scores combinados a porcentajes (suma 100)
+    total_score = sum(v["score"] for v in combined_map.values())
+    if total_score <= 1e-12:
+        n = len(combined_map)
+        results = [(eid, 100.0 / n, data["details"]) for eid, data in combined_map.items()]
+    else:
+        results = [(eid, (data["score"] / total_score) * 100.0, data["details"]) for eid, data in combined_map.items()]
+    results.sort(key=lambda x: x[1], reverse=True)
+
+    return {
+        "mode": "combined",
+        "firm": firm_results,
+        "soft": soft_results,
+        "combined": results,
+        "sources": {eid: data["source"] for eid, data in combined_map.items()},
+    }
+
+
+# ---------- CLI por lotes ----------
+_engine = None
+
+
+def _default_engine():
+    global _engine
+    if _engine is None:
+        _engine = InferenceEngine(rules=RULES)
+    return _engine
+
+
+def invalid_evidence(record):
+    """Mensaje de error si `signos`/`sintomas` no son listas de textos, o None."""
+    for field in ("signos", "sintomas"):
+        value = record.get(field) or []
+        if not isinstance(value, list):
+            return f"'{field}' debe ser una lista de textos"
+        for j, item in enumerate(value):
+            if not isinstance(item, str):
+                return f"'{field}[{j}]' debe ser texto"
+    return None
+
+
+def rank_record(record, top=None, engine=None):
+    """Diferencial de un registro de evidencia (dict) como dict serializable."""
+    error = invalid_evidence(record)
+    if error:
+        raise TypeError(error)
+    engine = engine or _default_engine()
+    signs = normalize_set(record.get("signos") or ())
+    symptoms = normalize_set(record.get("sintomas") or ())
+    result = differential(engine, signs, symptoms)
+    ranked = result["combined"][:top] if top else result["combined"]
+    return {
+        "id": record.get("id"),
+        "diferencial": [
+            {"enfermedad": eid, "probabilidad": round(prob, 4), "origen": result["sources"][eid]}
+            for eid, prob, _ in ranked
+        ],
+    }
+
+
+def _rank_batch(lines, top):
+    """Procesa un lote de líneas JSONL; un error afecta solo a su línea."""
+    out = []
+    for line in lines:
+        try:
+            out.append(json.dumps(rank_record(json.loads(line), top), ensure_ascii=False))
+        except (ValueError, TypeError, AttributeError) as e:
+            out.append(json.dumps({"error": str(e), "entrada": line[:200]}, ensure_ascii=False))
+    return out
+
+
+def _batches(lines, size):
+    batch = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        batch.append(line)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run_stream(infile, outfile, top=None, batch_size=256, workers=1):
+    """
+    Lee JSONL de infile y escribe un diferencial por línea en outfile, en
+    orden. Con workers > 1 los lotes se reparten entre procesos; como mucho
+    2*workers lotes están en vuelo, así la memoria no depende del tamaño de
+    la entrada. Devuelve la cantidad de registros escritos.
+    """
+    written = 0
+    batches = _batches(infile, batch_size)
+    if workers <= 1:
+        for batch in batches:
+            for line in _rank_batch(batch, top):
+                outfile.write(line + "\n")
+                written += 1
+        return written
+
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(_rank_batch, batch, top))
+            while len(pending) >= 2 * workers:
+                for line in pending.popleft().result():
+                    outfile.write(line + "\n")
+                    written += 1
+        while pending:
+            for line in pending.popleft().result():
+                outfile.write(line + "\n")
+                written += 1
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Diferenciales por lotes desde JSONL de evidencias.")
+    parser.add_argument("entrada", nargs="?", default="-", help="archivo JSONL (por defecto stdin)")
+    parser.add_argument("--top", type=int, default=None, help="máximo de enfermedades por registro")
+    parser.add_argument("--batch", type=int, default=256, help="registros por lote")
+    parser.add_argument("--workers", type=int, default=1, help="procesos en paralelo")
+    parser.add_argument("--validar", action="store_true", help="solo validar las reglas contra el vocabulario")
+    args = parser.parse_args(argv)
+
+    if args.validar:
+        report = validate_rules(RULES, SINTOMAS_LIST, SIGNOS_LIST)
+        problems = {k: v for k, v in report.items() if any(v["unknown"].values())}
+        print(json.dumps(problems, ensure_ascii=False, indent=2))
+        return 1 if problems else 0
+
+    infile = sys.stdin if args.entrada == "-" else open(args.entrada, encoding="utf-8")
+    try:
+        run_stream(infile, sys.stdout, top=args.top, batch_size=max(1, args.batch), workers=args.workers)
+    except BrokenPipeError:
+        # p. ej. `python motor.py ... | head`: dejar de escribir sin traza
+        sys.stderr.close()
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+# paginacion.py
+"""
+Fuente de datos paginada por keyset (sin OFFSET) para los listados.
+
+Cada página se pide con
+    WHERE (clave_orden, pk) > (ultimo_valor, ultimo_pk) ORDER BY clave_orden, pk LIMIT n
+de modo que el costo de abrir un listado o pedir la página siguiente no
+depende del total de filas, siempre que exista un índice sobre
+(clave_orden, pk). El orden y los filtros por columna se resuelven en el
+servidor.
+
+Si la fuente declara `changed_at` y `table`, además puede pedir solo lo
+que cambió desde una marca de tiempo (updated_at mantenido por trigger y
+lápidas en filas_eliminadas, ver migración 0010), para actualizar un
+listado ya cargado sin volver a traerlo entero.
+"""
+import functools
+
+
+class Column:
+    """
+    Columna de un listado.
+    expr: expresión SQL que se muestra.
+    key: expresión para ordenar/filtrar (por defecto expr; útil si expr recorta texto).
+    null_as: valor SQL que sustituye a NULL al ordenar. Necesario en columnas
+             nulables: una comparación de filas con NULL cortaría la paginación.
+    text: la columna es de texto (se filtra sin CAST, aprovechando índices trigram).
+    """
+
+    def __init__(self, name, expr, key=None, null_as=None, text=False):
+        self.name = name
+        self.expr = expr
+        self.key = key or expr
+        self.null_as = null_as
+        self.text = text
+
+    @property
+    def sort_expr(self):
+        if self.null_as is not None:
+            return f"COALESCE({self.key}, {self.null_as})"
+        return self.key
+
+    @property
+    def filter_expr(self):
+        return self.key if self.text else f"CAST({self.key} AS TEXT)"
+
+
+def _like_pattern(text):
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class KeysetSource:
+    """
+    db: objeto con fetchall(sql, params).
+    columns: lista de Column en el orden del Treeview (la primera suele ser el id).
+    from_sql: cláusula FROM (con JOINs si hace falta).
+    pk: expresión de la clave primaria, desempata el orden.
+    table: tabla base (la de pk), para buscar sus lápidas en filas_eliminadas.
+    changed_at: expresiones updated_at de las tablas cuyo cambio altera una
+                fila del listado (la base y las de los JOINs que se muestran).
+    """
+
+    def __init__(self, db, columns, from_sql, pk, default_sort, default_desc=False, page_size=200,
+                 table=None, changed_at=()):
+        self.db = db
+        self.table = table
+        self.changed_at = list(changed_at)
+        self.columns = list(columns)
+        self._by_name = {c.name: c for c in self.columns}
+        self.from_sql = from_sql
+        self.pk = pk
+        self.page_size = int(page_size)
+        self.sort = default_sort
+        self.desc = bool(default_desc)
+        self.filters = {}
+        self.reset()
+
+    def reset(self):
+        """Vuelve a la primera página (tras cambiar orden/filtros o datos)."""
+        self._cursor = None
+        self.has_more = True
+
+    def set_sort(self, name, desc=None):
+        """Ordena por `name`; si ya era la columna de orden y desc es None, invierte el sentido."""
+        if name not in self._by_name:
+            raise KeyError(name)
+        if desc is None:
+            desc = (not self.desc) if name == self.sort else False
+        self.sort = name
+        self.desc = bool(desc)
+        self.reset()
+
+    def set_filter(self, name, text):
+        if name not in self._by_name:
+            raise KeyError(name)
+        text = (text or "").strip()
+        if text:
+            self.filters[name] = text
+        else:
+            self.filters.pop(name, None)
+        self.reset()
+
+    def clear_filters(self):
+        self.filters.clear()
+        self.reset()
+
+    def _filter_conditions(self):
+        where = []
+        params = []
+        for name, text in self.filters.items():
+            where.append(f"{self._by_name[name].filter_expr} ILIKE %s")
+            params.append(_like_pattern(text))
+        return where, params
+
+    def build_query(self):
+        sort_col = self._by_name[self.sort]
+        sort_expr = sort_col.sort_expr
+        direction = "DESC" if self.desc else "ASC"
+
+        select_list = ", ".join(c.expr for c in self.columns)
+        where, params = self._filter_conditions()
+        if self._cursor is not None:
+            op = "<" if self.desc else ">"
+            where.append(f"({sort_expr}, {self.pk}) {op} (%s, %s)")
+            params.extend(self._cursor)
+
+        sql = f"SELECT {select_list}, {sort_expr}, {self.pk} FROM {self.from_sql}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {sort_expr} {direction}, {self.pk} {direction} LIMIT {self.page_size + 1}"
+        return sql, tuple(params)
+
+    def accept(self, rows, keyed=False):
+        """
+        Registra una página obtenida con build_query(): avanza el cursor y
+        devuelve las filas solo con las columnas visibles. Separado de la
+        consulta para poder ejecutar ésta en otro hilo.
+        Con keyed=True devuelve pares ((valor_orden, pk), columnas visibles).
+        """
+        self.has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if rows:
+            self._cursor = (rows[-1][-2], rows[-1][-1])
+        if keyed:
+            return [((r[-2], r[-1]), tuple(r[:-2])) for r in rows]
+        return [tuple(r[:-2]) for r in rows]
+
+    # ---------- Cambios desde una marca de tiempo ----------
+    @property
+    def tracks_changes(self):
+        return bool(self.table and self.changed_at)
+
+    def build_changes_query(self, since):
+        """
+        Filas cambiadas después de `since`, sin aplicar los filtros: cada
+        fila trae al final (valor_orden, pk, cumple_filtros, cambiada_en),
+        para poder quitar del listado las que dejaron de cumplirlos.
+        Con varias columnas changed_at se arma una rama por columna
+        (`col > %s`, cada una por su índice updated_at) unidas con UNION
+        sobre la pk; un GREATEST(...) > %s no puede usar ningún índice.
+        """
+        select_list = ", ".join(c.expr for c in self.columns)
+        sort_expr = self._by_name[self.sort].sort_expr
+        where, params = self._filter_conditions()
+        matches = " AND ".join(where) if where else "TRUE"
+        if len(self.changed_at) == 1:
+            changed = self.changed_at[0]
+            sql = (f"SELECT {select_list}, {sort_expr}, {self.pk}, COALESCE({matches}, FALSE), {changed}"
+                   f" FROM {self.from_sql} WHERE {changed} > %s")
+            return sql, tuple(params) + (since,)
+        changed = f"GREATEST({', '.join(self.changed_at)})"
+        branches = " UNION ".join(
+            f"SELECT {self.pk} FROM {self.from_sql} WHERE {col} > %s" for col in self.changed_at)
+        sql = (f"WITH cambiadas (pk) AS ({branches})"
+               f" SELECT {select_list}, {sort_expr}, {self.pk}, COALESCE({matches}, FALSE), {changed}"
+               f" FROM {self.from_sql} WHERE {self.pk} IN (SELECT pk FROM cambiadas)")
+        return sql, (since,) * len(self.changed_at) + tuple(params)
+
+    def build_deleted_query(self, since):
+        return ("SELECT pk, eliminado_at FROM filas_eliminadas WHERE tabla = %s AND eliminado_at > %s",
+                (self.table, since))
+
+    def _compare(self, a, b):
+        """Compara claves (valor_orden, pk) en el sentido del listado."""
+        if a == b:
+            return 0
+        less = a < b
+        return (1 if less else -1) if self.desc else (-1 if less else 1)
+
+    def in_window(self, key):
+        """True si una fila con esta clave cae dentro de lo ya cargado."""
+        if not self.has_more:
+            return True
+        if self._cursor is None:
+            return False
+        return self._compare(key, tuple(self._cursor)) <= 0
+
+    def position(self, keys, key):
+        """
+        Índice donde insertar `key` en `keys` (lista ya ordenada como el
+        listado). El texto se compara con el orden de Python, que puede
+        diferir levemente de la collation del servidor.
+        """
+        wrapped = functools.cmp_to_key(self._compare)
+        lo, hi = 0, len(keys)
+        target = wrapped(key)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if wrapped(keys[mid]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def fetch_page(self):
+        """Devuelve la siguiente página (filas solo con las columnas visibles)."""
+        if not self.has_more:
+            return []
+        sql, params = self.build_query()
+        return self.accept(self.db.fetchall(sql, params))
@@ -0,0 +1,121 @@
+# recomendaciones.py
+"""
+Recomendaciones (tratamientos y pruebas) por enfermedad.
+
+La función SQL recomendaciones_enfermedad(id) (migración 0007) devuelve
+en un solo viaje los tratamientos y las pruebas de ambas fuentes
+(catálogo y texto libre), ya filtradas y ordenadas. RecommendationCache
+guarda el resultado por enfermedad_id; la GUI lo precalienta en segundo
+plano con los mejores candidatos de la inferencia, así que abrir las
+recomendaciones normalmente no consulta la BD.
+"""
+import threading
+from collections import OrderedDict
+
+RECOMMENDATIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION recomendaciones_enfermedad(p_enfermedad_id INT)
+RETURNS TABLE (seccion TEXT, orden INT, nombre TEXT, detalle TEXT, tipo TEXT, nivel INT)
+LANGUAGE sql STABLE AS $$
+  WITH tx AS (
+    SELECT tratamiento AS nombre, COALESCE(indicaciones, '') AS detalle, COALESCE(tipo, '') AS tipo,
+           COALESCE(prioridad, 0)::int AS nivel, COALESCE(prioridad, 99) AS rango
+    FROM enfermedad_tratamientos_recomendados
+    WHERE enfermedad_id = p_enfermedad_id
+  ),
+  labs AS (
+    SELECT 1 AS fuente, plc.nombre::text AS nombre, COALESCE(epr.nota, '') AS detalle,
+           COALESCE(epr.urgencia, 0)::int AS nivel, COALESCE(epr.urgencia, 99) AS rango
+    FROM enfermedad_pruebas_recomendadas epr
+    JOIN pruebas_lab_catalogo plc ON plc.prueba_lab_id = epr.prueba_lab_id
+    WHERE epr.enfermedad_id = p_enfermedad_id
+    UNION ALL
+    SELECT 2, nombre, COALESCE(nota, ''), COALESCE(urgencia, 0)::int, COALESCE(urgencia, 99)
+    FROM enfermedad_pruebas_texto_recomendadas
+    WHERE enfermedad_id = p_enfermedad_id
+  ),
+  labs_marcadas AS (
+    -- Específica: urgente/prioritaria o con nota distinta de las genéricas
+    SELECT l.*, (l.rango <= 2 OR lower(trim(l.detalle)) NOT IN ('estudio básico', 'perfil básico')) AS especifica
+    FROM labs l
+  )
+  -- Si hay tratamientos específicos (prioridad <= 2) se ocultan los genéricos
+  SELECT 'tratamiento', (row_number() OVER (ORDER BY rango, nombre))::int, nombre, detalle, tipo, nivel
+  FROM tx
+  WHERE rango <= 2
+     OR nombre NOT IN ('Manejo sintomático', 'Analgesia/antitérmico')
+     OR NOT EXISTS (SELECT 1 FROM tx WHERE rango <= 2)
+  UNION ALL
+  -- Si hay pruebas específicas se ocultan las genéricas; primero las del catálogo
+  SELECT 'prueba', (row_number() OVER (ORDER BY fuente, rango, nombre))::int, nombre, detalle, '', nivel
+  FROM labs_marcadas
+  WHERE especifica OR NOT EXISTS (SELECT 1 FROM labs_marcadas WHERE especifica)
+$$
+"""
+
+DEFAULT_TOP_K = 5
+
+
+def fetch_recommendations(db, enfermedad_id):
+    """
+    {"tratamientos": [(tratamiento, indicaciones, tipo, prioridad)],
+     "pruebas": [(prueba, nota, urgencia)]}
+    """
+    rows = db.fetchall(
+        "SELECT seccion, nombre, detalle, tipo, nivel FROM recomendaciones_enfermedad(%s) ORDER BY seccion DESC, orden",
+        (enfermedad_id,)
+    )
+    result = {"tratamientos": [], "pruebas": []}
+    for seccion, nombre, detalle, tipo, nivel in rows:
+        if seccion == "tratamiento":
+            result["tratamientos"].append((nombre, detalle, tipo, nivel))
+        else:
+            result["pruebas"].append((nombre, detalle, nivel))
+    return result
+
+
+class RecommendationCache:
+    """
+    Caché LRU enfermedad_id -> recomendaciones. Segura entre hilos: get()
+    puede llamarse desde los hilos del executor para precalentar.
+    """
+
+    def __init__(self, db, max_entries=256):
+        self.db = db
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def peek(self, enfermedad_id):
+        """Devuelve las recomendaciones si ya están en caché (sin consultar la BD)."""
+        with self._lock:
+            value = self._data.get(enfermedad_id)
+            if value is not None:
+                self._data.move_to_end(enfermedad_id)
+            return value
+
+    def get(self, enfermedad_id):
+        value = self.peek(enfermedad_id)
+        if value is None:
+            value = fetch_recommendations(self.db, enfermedad_id)
+            with self._lock:
+                self._data[enfermedad_id] = value
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+        return value
+
+    def warm(self, enfermedad_ids):
+        """Carga en caché las enfermedades indicadas que falten. Devuelve las cargadas."""
+        loaded = []
+        for eid in enfermedad_ids:
+            if eid is not None and self.peek(eid) is None:
+                self.get(eid)
+                loaded.append(eid)
+        return loaded
+
+    def invalidate(self, enfermedad_id=None):
+        """Descarta una enfermedad, o todo si enfermedad_id es None."""
+        with self._lock:
+            if enfermedad_id is None:
+                self._data.clear()
+            else:
+                self._data.pop(enfermedad_id, None)
@@ -0,0 +1,163 @@
+# seguridad.py
+"""
+Contraseñas: hash y verificación con bcrypt, normalización de los hashes
+guardados y gestión del costo.
+
+El costo (rounds) se configura con DIAG_BCRYPT_ROUNDS. Tras un login
+correcto, needs_rehash() indica si el hash guardado usa otro costo o un
+prefijo distinto de $2b$, y la aplicación lo rehace con la contraseña que
+acaba de verificar. suggest_rounds() mide cuánto tarda cada costo en esta
+máquina para elegir uno que quepa en un presupuesto de latencia:
+
+    python seguridad.py calibrate 250   # costo máximo que tarda <= 250 ms
+
+Sin dependencias de GUI; bcrypt se importa al primer uso.
+"""
+import base64
+import binascii
+import os
+import sys
+import time
+
+DEFAULT_ROUNDS = int(os.environ.get("DIAG_BCRYPT_ROUNDS", "12"))
+CANONICAL_PREFIX = "$2b$"
+_BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
+
+
+def normalize_hash_from_db(raw):
+    """Convierte el valor guardado (texto, hex, base64, bytea) en bytes del hash."""
+    if raw is None:
+        return None
+    if isinstance(raw, memoryview):
+        return raw.tobytes()
+    if isinstance(raw, bytes):
+        return raw
+    if isinstance(raw, str):
+        s = raw.strip()
+        if s.startswith(_BCRYPT_PREFIXES):
+            return s.encode("utf-8")
+        try:
+            # bytea en formato de escape de PostgreSQL ("\x2432...") o hex plano
+            return bytes.fromhex(s[2:] if s.startswith("\\x") else s)
+        except (ValueError, TypeError):
+            pass
+        try:
+            return base64.b64decode(s)
+        except (binascii.Error, ValueError):
+            pass
+        return s.encode("utf-8")
+    try:
+        return bytes(raw)
+    except Exception:
+        return None
+
+
+def canonical_hash(raw):
+    """
+    Hash bcrypt como texto con prefijo $2b$, o None si el valor no es un
+    hash bcrypt reconocible. $2a$/$2y$ se verifican igual que $2b$.
+    """
+    hashed = normalize_hash_from_db(raw)
+    if not hashed:
+        return None
+    try:
+        text = hashed.decode("ascii").strip()
+    except UnicodeDecodeError:
+        return None
+    if not text.startswith(_BCRYPT_PREFIXES) or len(text) != 60:
+        return None
+    return CANONICAL_PREFIX + text[4:]
+
+
+def hash_rounds(raw):
+    """Costo de un hash bcrypt (el número tras el prefijo), o None."""
+    text = canonical_hash(raw)
+    if text is None:
+        return None
+    try:
+        return int(text[4:6])
+    except ValueError:
+        return None
+
+
+def verify_password(password_plain: str, hashed_raw) -> bool:
+    hashed = normalize_hash_from_db(hashed_raw)
+    if not hashed:
+        return False
+    try:
+        prefix = hashed[:4].decode('utf-8', errors='ignore')
+    except Exception:
+        prefix = ""
+    if not prefix.startswith(("$2a", "$2b", "$2y")):
+        return False
+    import bcrypt
+    try:
+        return bcrypt.checkpw(password_plain.encode('utf-8'), hashed)
+    except (ValueError, TypeError):
+        return False
+
+
+def hash_password(password_plain: str, rounds=None) -> str:
+    import bcrypt
+    salt = bcrypt.gensalt(rounds=rounds or DEFAULT_ROUNDS)
+    return bcrypt.hashpw(password_plain.encode('utf-8'), salt).decode('utf-8')
+
+
+def needs_rehash(hashed_raw, rounds=None) -> bool:
+    """True si el hash no está en texto $2b$ o su costo difiere del configurado."""
+    text = canonical_hash(hashed_raw)
+    if text is None:
+        return True
+    return hashed_raw != text or hash_rounds(text) != (rounds or DEFAULT_ROUNDS)
+
+
+def suggest_rounds(budget_ms, min_rounds=10, max_rounds=16):
+    """
+    Mayor costo cuyo hash tarda como mucho `budget_ms` en esta máquina.
+    Devuelve (rounds, {rounds: ms medidos}).
+    """
+    import bcrypt
+    timings = {}
+    best = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        t0 = time.perf_counter()
+        bcrypt.hashpw(b"calibracion", bcrypt.gensalt(rounds=rounds))
+        ms = (time.perf_counter() - t0) * 1000.0
+        timings[rounds] = round(ms, 1)
+        if ms > budget_ms:
+            break
+        best = rounds
+    return best, timings
+
+
+def canonicalize_stored_hashes(db):
+    """
+    Migración: reescribe usuarios.hashed_password como texto $2b$.
+    Los valores que no son hashes bcrypt se dejan como están y se avisan.
+    """
+    rows = db.fetchall("SELECT usuario_id, hashed_password FROM usuarios WHERE hashed_password IS NOT NULL")
+    invalid = []
+    for usuario_id, raw in rows:
+        text = canonical_hash(raw)
+        if text is None:
+            invalid.append(usuario_id)
+        elif text != raw:
+            db.query("UPDATE usuarios SET hashed_password = %s WHERE usuario_id = %s", (text, usuario_id))
+    if invalid:
+        print("WARN: usuarios con hash de contraseña no reconocible:", ", ".join(map(str, invalid)))
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if len(argv) == 2 and argv[0] == "calibrate":
+        rounds, timings = suggest_rounds(float(argv[1]))
+        for r, ms in timings.items():
+            print(f"rounds={r:2d} {ms:8.1f} ms")
+        print(f"DIAG_BCRYPT_ROUNDS={rounds}")
+        return 0
+    print(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,354 @@
+# servicio.py
+"""
+Servicio HTTP/JSON local de diferenciales con las mismas reglas que usa
+DiagnosticoDialog (motor.py). Solo biblioteca estándar.
+
+    python servicio.py serve --port 8765 --workers 4 --queue 64
+    python servicio.py carga --url http://127.0.0.1:8765 -n 2000 -c 16 --batch 10
+
+Endpoints:
+    POST /v1/diferencial        {"id"?, "signos": [...], "sintomas": [...], "top"?}
+    POST /v1/diferencial/lote   {"registros": [{...}, ...], "top"?}
+    GET  /health                estado, reglas cargadas, ocupación de la cola
+    GET  /metrics               latencias por endpoint (p50/p95/p99), códigos, rechazos
+
+Las reglas se cargan una vez por proceso de trabajo. Como mucho
+workers + queue solicitudes esperan o se procesan a la vez; por encima de
+eso se responde 503 con Retry-After (contrapresión) en lugar de acumular
+trabajo sin límite.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import motor
+from metricas_db import LatencyHistogram
+
+DEFAULT_PORT = int(os.environ.get("DIAG_SERVICE_PORT", "8765"))
+MAX_BODY_BYTES = 1024 * 1024
+MAX_BATCH = 1000
+
+
+# ---------- Trabajo (se ejecuta en el pool) ----------
+def _init_worker():
+    # Compila las reglas una vez por proceso, antes de la primera solicitud
+    motor._default_engine()
+
+
+def _rank_many(records, top):
+    return [motor.rank_record(r, top) for r in records]
+
+
+class InferencePool:
+    """
+    Pool de trabajo con admisión acotada: submit() falla de inmediato
+    (devuelve None) si ya hay `capacity` solicitudes en espera o en curso.
+    """
+
+    def __init__(self, workers=2, queue_size=32, kind="process"):
+        self.workers = int(workers)
+        self.capacity = self.workers + int(queue_size)
+        if kind == "thread":
+            _init_worker()
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inferencia")
+        else:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def submit(self, records, top):
+        if not self._slots.acquire(blocking=False):
+            return None
+        with self._lock:
+            self.in_flight += 1
+        try:
+            future = self._pool.submit(_rank_many, records, top)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda _f: self._release())
+        return future
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def warm(self):
+        """Arranca los procesos (y compila las reglas) antes de aceptar tráfico."""
+        for f in [self._pool.submit(_init_worker) for _ in range(self.workers)]:
+            f.result()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ServiceMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.latency = {}
+        self.status = {}
+        self.records = 0
+        self.rejected = 0
+
+    def record(self, endpoint, status, ms, records=0):
+        with self._lock:
+            hist = self.latency.get(endpoint)
+            if hist is None:
+                hist = self.latency[endpoint] = LatencyHistogram()
+            hist.add(ms)
+            self.status[str(status)] = self.status.get(str(status), 0) + 1
+            self.records += records
+            if status == 503:
+                self.rejected += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "uptime_s": round(time.time() - self.started, 1),
+                "registros": self.records,
+                "rechazadas": self.rejected,
+                "codigos": dict(self.status),
+                "latencia": {k: v.to_dict() for k, v in self.latency.items()},
+            }
+
+
+# ---------- HTTP ----------
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "DiagMedico/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            raise ValueError("cuerpo vacío")
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True  # el cuerpo queda sin leer en el socket
+            raise OverflowError("cuerpo demasiado grande")
+        return json.loads(self.rfile.read(length))
+
+    def do_GET(self):
+        t0 = time.perf_counter()
+        if self.path == "/health":
+            pool = self.server.pool
+            status, payload = 200, {
+                "estado": "ok",
+                "reglas": len(motor.RULES),
+                "en_curso": pool.in_flight,
+                "capacidad": pool.capacity,
+            }
+        elif self.path == "/metrics":
+            status, payload = 200, self.server.metrics.snapshot()
+        else:
+            status, payload = 404, {"error": "no encontrado"}
+        self._send(status, payload)
+        self.server.metrics.record(f"GET {self.path}" if status != 404 else "GET ?", status,
+                                   (time.perf_counter() - t0) * 1000.0)
+
+    def do_POST(self):
+        t0 = time.perf_counter()
+        endpoint = f"POST {self.path}"
+        status, payload, headers, n = self._handle_post()
+        self._send(status, payload, headers)
+        self.server.metrics.record(endpoint if status != 404 else "POST ?", status,
+                                   (time.perf_counter() - t0) * 1000.0, n)
+
+    def _handle_post(self):
+        """Devuelve (status, payload, headers, registros procesados)."""
+        if self.path not in ("/v1/diferencial", "/v1/diferencial/lote"):
+            return 404, {"error": "no encontrado"}, None, 0
+        try:
+            body = self._read_json()
+        except OverflowError as e:
+            return 413, {"error": str(e)}, None, 0
+        except ValueError as e:
+            return 400, {"error": f"JSON inválido: {e}"}, None, 0
+        if not isinstance(body, dict):
+            return 400, {"error": "se esperaba un objeto JSON"}, None, 0
+
+        batch = self.path.endswith("/lote")
+        records = body.get("registros") if batch else [body]
+        if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+            return 400, {"error": "'registros' debe ser una lista de objetos"}, None, 0
+        if len(records) > MAX_BATCH:
+            return 413, {"error": f"como máximo {MAX_BATCH} registros por lote"}, None, 0
+        top = body.get("top")
+        if top is not None and (not isinstance(top, int) or top <= 0):
+            return 400, {"error": "'top' debe ser un entero positivo"}, None, 0
+        for i, record in enumerate(records):
+            error = motor.invalid_evidence(record)
+            if error:
+                if not batch:
+                    return 400, {"error": error}, None, 0
+                return 400, {"error": f"registros[{i}]: {error}", "indice": i}, None, 0
+
+        try:
+            future = self.server.pool.submit(records, top)
+        except BrokenExecutor as e:
+            print(f"WARN: pool de inferencia inutilizable: {e}")
+            return 503, {"error": "pool de inferencia no disponible"}, None, 0
+        if future is None:
+            return 503, {"error": "servicio saturado, reintente"}, {"Retry-After": "1"}, 0
+        try:
+            results = future.result(timeout=self.server.timeout_s)
+        except FutureTimeout:
+            future.cancel()
+            return 504, {"error": "tiempo de espera agotado"}, None, 0
+        except BrokenExecutor as e:
+            print(f"WARN: pool de inferencia inutilizable: {e}")
+            return 503, {"error": "pool de inferencia no disponible"}, None, 0
+        except Exception as e:
+            return 500, {"error": f"{type(e).__name__}: {e}"}, None, 0
+        payload = {"resultados": results} if batch else results[0]
+        return 200, payload, None, len(records)
+
+
+class InferenceServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Backlog de accept(): la contrapresión la hace el pool, no el socket
+    request_queue_size = 128
+
+    def __init__(self, address, pool, timeout_s=10.0, verbose=False):
+        super().__init__(address, _Handler)
+        self.pool = pool
+        self.metrics = ServiceMetrics()
+        self.timeout_s = float(timeout_s)
+        self.verbose = verbose
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, workers=2, queue_size=32, pool_kind="process",
+          timeout_s=10.0, verbose=False):
+    pool = InferencePool(workers, queue_size, pool_kind)
+    pool.warm()
+    server = InferenceServer((host, port), pool, timeout_s, verbose)
+    print(f"INFO: servicio en http://{host}:{server.server_port} "
+          f"({workers} workers {pool_kind}, capacidad {pool.capacity})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.shutdown()
+
+
+# ---------- Generador de carga ----------
+def _random_record(rng, i):
+    signos = rng.sample([k for k, _ in motor.SIGNOS_LIST], rng.randint(0, 4))
+    sintomas = rng.sample([k for k, _ in motor.SINTOMAS_LIST], rng.randint(1, 5))
+    return {"id": i, "signos": signos, "sintomas": sintomas}
+
+
+def load_test(url, total=1000, concurrency=8, batch=1, top=5, seed=1):
+    """
+    Envía `total` solicitudes desde `concurrency` hilos y devuelve un
+    resumen: throughput, latencias y códigos de respuesta.
+    """
+    endpoint = url.rstrip("/") + ("/v1/diferencial/lote" if batch > 1 else "/v1/diferencial")
+    hist = LatencyHistogram()
+    codes = {}
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker(n):
+        rng = random.Random(seed + n)
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            if batch > 1:
+                payload = {"registros": [_random_record(rng, i * batch + j) for j in range(batch)], "top": top}
+            else:
+                payload = dict(_random_record(rng, i), top=top)
+            req = urllib.request.Request(endpoint, data=json.dumps(payload).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"})
+            t0 = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req, timeout=30) as resp:
+                    resp.read()
+                    code = resp.status
+            except urllib.error.HTTPError as e:
+                code = e.code
+            except OSError:
+                code = "conexion"
+            ms = (time.perf_counter() - t0) * 1000.0
+            with lock:
+                hist.add(ms)
+                codes[str(code)] = codes.get(str(code), 0) + 1
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    d = hist.to_dict()
+    return {
+        "solicitudes": total,
+        "registros": total * batch,
+        "segundos": round(elapsed, 3),
+        "solicitudes_s": round(total / elapsed, 1) if elapsed else None,
+        "registros_s": round(total * batch / elapsed, 1) if elapsed else None,
+        "codigos": codes,
+        "latencia": {k: d[k] for k in ("mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms")},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio HTTP de diferenciales y generador de carga.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("serve", help="levantar el servicio")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    p.add_argument("--queue", type=int, default=32, help="solicitudes en espera antes de responder 503")
+    p.add_argument("--pool", choices=("process", "thread"), default="process")
+    p.add_argument("--timeout", type=float, default=10.0, help="segundos máximos por solicitud")
+    p.add_argument("--verbose", action="store_true")
+
+    c = sub.add_parser("carga", help="generar carga contra un servicio en marcha")
+    c.add_argument("--url", default=f"http://127.0.0.1:{DEFAULT_PORT}")
+    c.add_argument("-n", "--requests", type=int, default=1000)
+    c.add_argument("-c", "--concurrency", type=int, default=8)
+    c.add_argument("--batch", type=int, default=1, help="registros por solicitud (>1 usa /lote)")
+    c.add_argument("--top", type=int, default=5)
+
+    args = parser.parse_args(argv)
+    if args.cmd == "serve":
+        serve(args.host, args.port, args.workers, args.queue, args.pool, args.timeout, args.verbose)
+        return 0
+    print(json.dumps(load_test(args.url, args.requests, args.concurrency, args.batch, args.top),
+                     ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
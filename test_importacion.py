@@ -0,0 +1,74 @@
+# test_importacion.py
+"""
+Pruebas de los normalizadores de importacion.py (funciones puras, sin BD).
+
+    python -m unittest test_importacion
+"""
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+
+from importacion import RowError, normalize_observacion, normalize_paciente
+
+
+class _Resolver:
+    """Sustituto de CatalogResolver con un mapa fijo."""
+
+    maps = {"signo": {"sat o2": 6}, "sintoma": {"fiebre": 1}}
+
+    def resolve(self, clase, nombre):
+        return self.maps[clase].get(nombre.lower())
+
+
+def _obs(**campos):
+    row = {"numero_identificacion": "123", "fecha": "2024-03-01 10:30", "clase": "signo", "hallazgo": "Sat O2"}
+    row.update(campos)
+    return row
+
+
+class NormalizePacienteTest(unittest.TestCase):
+    def test_valores(self):
+        row = {"numero_identificacion": " 123 ", "nombre": "Ana  María", "fecha_nacimiento": "02/01/1980",
+               "sexo": "Femenino", "direccion": "", "telefono": "555"}
+        self.assertEqual(normalize_paciente(row),
+                         ("123", "Ana María", date(1980, 1, 2), "F", None, "555"))
+
+    def test_sexo_invalido(self):
+        with self.assertRaises(RowError):
+            normalize_paciente({"numero_identificacion": "1", "nombre": "A", "sexo": "x"})
+
+    def test_fecha_futura(self):
+        with self.assertRaises(RowError):
+            normalize_paciente({"numero_identificacion": "1", "nombre": "A", "fecha_nacimiento": "2999-01-01"})
+
+
+class NormalizeObservacionTest(unittest.TestCase):
+    def test_signo(self):
+        out = normalize_observacion(_obs(valor_numerico="91,5", severidad="3"), _Resolver())
+        self.assertEqual(out[1], datetime(2024, 3, 1, 10, 30))
+        self.assertEqual((out[3], out[4]), ("signo", 6))
+        self.assertEqual(out[6], Decimal("91.5"))
+        self.assertEqual(out[8], 3)
+
+    def test_hallazgo_fuera_de_catalogo(self):
+        with self.assertRaises(RowError):
+            normalize_observacion(_obs(hallazgo="Cianosis"), _Resolver())
+
+    def test_severidad_no_finita(self):
+        for value in ("nan", "snan", "inf", "-Infinity"):
+            with self.subTest(value=value), self.assertRaises(RowError):
+                normalize_observacion(_obs(severidad=value), _Resolver())
+
+    def test_severidad_fuera_de_rango(self):
+        for value in ("11", "2.5", "1e999999"):
+            with self.subTest(value=value), self.assertRaises(RowError):
+                normalize_observacion(_obs(severidad=value), _Resolver())
+
+    def test_valor_numerico_no_finito(self):
+        for value in ("Infinity", "NaN", "abc"):
+            with self.subTest(value=value), self.assertRaises(RowError):
+                normalize_observacion(_obs(valor_numerico=value), _Resolver())
+
+
+if __name__ == "__main__":
+    unittest.main()